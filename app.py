@@ -1,19 +1,31 @@
 import os
 import urllib.parse
-import json
-import base64
-import random
-import requests
 import uuid
-import time
 
 import streamlit as st
-import streamlit.components.v1 as components
 
-from google_auth_oauthlib.flow import Flow
-from google.oauth2 import id_token
-from google.auth.transport import requests as grequests
-from dotenv import load_dotenv
+from auth_utils import exchange_code_for_token, login_view, resume_session
+from cache_utils import depersonalize, get_answer_cache
+from chat_utils import (
+    ensure_session_defaults,
+    keep_turn_alive,
+    load_older_history,
+    remember,
+    render_job,
+    restore_history,
+    start_turn,
+    warm_up,
+)
+from footprint_utils import FULL_REPLY, get_session_tracker, track_session
+from gemini_utils import INTERRUPTED_NOTE, is_error_reply
+from media_utils import header_html, pick_avatar_video, render_avatar_video
+from memory_utils import new_message
+from metrics_utils import span, start_exporters
+from rate_utils import get_rate_limiter
+from resilience_utils import get_upstream
+from session_utils import SESSION_REFRESH_DAYS, write_session_cookie
+from speech_utils import get_tts_engine
+from voice_utils import latest_assistant_message, render_voice
 
 # ------------------------------------------------------------
 # Configuración inicial de Streamlit
@@ -37,359 +49,87 @@ if "/oauth2callback" in _request_uri:
     st.query_params.update(query_clean)
     st.rerun()
 
-# ------------------------------------------------------------
-# Cargar variables de entorno
-# ------------------------------------------------------------
-load_dotenv()
-
-CLIENT_ID = st.secrets.get("GOOGLE_CLIENT_ID", os.getenv("GOOGLE_CLIENT_ID", ""))
-CLIENT_SECRET = st.secrets.get(
-    "GOOGLE_CLIENT_SECRET", os.getenv("GOOGLE_CLIENT_SECRET", "")
-)
-GOOGLE_REDIRECT_URI = st.secrets.get(
-    "GOOGLE_REDIRECT_URI",
-    os.getenv("GOOGLE_REDIRECT_URI", "https://nicooapp-umsnh.streamlit.app/"),
-)
+# ============================================================
+# Lógica principal de la app
+# ============================================================
 
-SCOPES = [
-    "openid",
-    "https://www.googleapis.com/auth/userinfo.email",
-    "https://www.googleapis.com/auth/userinfo.profile",
-]
+start_exporters()  # /metrics y logs de tramos (sólo con METRICS_ENABLED)
+warm_up()  # clientes y cachés del proceso, en segundo plano (una sola vez)
+if not track_session():  # actividad y tamaño de la sesión; tope SESSION_MAX
+    st.warning(FULL_REPLY)
+    st.stop()
+ensure_session_defaults()
+resume_session()
+exchange_code_for_token()
 
-GEMINI_API_KEY = st.secrets.get("GEMINI_API_KEY", os.getenv("GEMINI_API_KEY", ""))
-GEMINI_MODEL = st.secrets.get(
-    "GEMINI_MODEL", os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite-preview-02-05")
-)
+if not st.session_state.get("logged"):
+    login_view()
+    st.stop()
 
-# ============================================================
-# Funciones auxiliares
-# ============================================================
+restore_history()
 
-def get_flow(state=None):
-    client_config = {
-        "web": {
-            "client_id": CLIENT_ID,
-            "client_secret": CLIENT_SECRET,
-            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-            "token_uri": "https://oauth2.googleapis.com/token",
-            "redirect_uris": [
-                "https://nicooapp-umsnh.streamlit.app/",
-                "http://localhost:8501/",
-                "http://127.0.0.1:8501/",
-            ],
-        }
-    }
-
-    flow = Flow.from_client_config(
-        client_config, scopes=SCOPES, redirect_uri=GOOGLE_REDIRECT_URI
+# Cookie de sesión recién emitida (una sola vez tras el login o la renovación)
+if st.session_state.get("session_token_pending"):
+    write_session_cookie(
+        st.session_state.pop("session_token_pending"), SESSION_REFRESH_DAYS * 86400
     )
-    if state:
-        flow.redirect_uri = GOOGLE_REDIRECT_URI
-    return flow
-
-
-def ensure_session_defaults():
-    """Valores por defecto en session_state."""
-    st.session_state.setdefault("logged", False)
-    st.session_state.setdefault("profile", {})
-    st.session_state.setdefault("history", [])
-    st.session_state.setdefault("voice_on", True)
-    st.session_state.setdefault("temperature", 0.7)
-    st.session_state.setdefault("top_p", 0.9)
-    st.session_state.setdefault("max_tokens", 256)
-    st.session_state.setdefault("current_video", None)
-    st.session_state.setdefault("open_cfg", False)
-    st.session_state.setdefault("greeted", False)
-    # Nuevos para el control de input
-    st.session_state.setdefault("input_val", "")
-    st.session_state.setdefault("trigger_run", False)
-    # 🌟 CORRECCIÓN AUTH: Bandera para evitar doble intercambio de token (invalid_grant)
-    st.session_state.setdefault("is_exchanging_token", False)
-
-
-def header_html():
-    """Cabecera visual."""
-    video_path = "assets/videos/nico_header_video.mp4"
-    video_tag = '<div class="nico-placeholder">🦊</div>'
-    
-    if os.path.exists(video_path):
-        with open(video_path, "rb") as f:
-            b64 = base64.b64encode(f.read()).decode("utf-8")
-        video_tag = f"""
-        <video class="nico-video" autoplay loop muted playsinline>
-            <source src="data:video/mp4;base64,{b64}" type="video/mp4">
-        </video>
-        """
-
-    return f"""
-    <style>
-    .nico-header {{
-        background: linear-gradient(90deg, #0f2347 0%, #1a3b6e 100%);
-        color: #fff;
-        padding: 16px 24px;
-        border-radius: 12px;
-        margin-bottom: 20px;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-    }}
-    .nico-wrap {{ display: flex; align-items: center; gap: 16px; }}
-    .nico-video, .nico-placeholder {{
-        width: 60px; height: 60px; border-radius: 50%;
-        background: #fff; object-fit: cover; border: 2px solid #ffd700;
-        display: flex; align-items: center; justify-content: center; font-size: 30px;
-    }}
-    .nico-title {{ font-size: 24px; font-weight: 800; margin: 0; }}
-    .nico-subtitle {{ margin: 0; font-size: 16px; opacity: 0.8; font-weight: 300; }}
-    .chat-bubble {{
-        background: #f0f2f6; border-radius: 12px; padding: 16px; margin-top: 8px;
-        color: #31333F; border-left: 4px solid #0f2347;
-    }}
-    </style>
-    <div class="nico-header">
-        <div class="nico-wrap">
-            {video_tag}
-            <div>
-                <p class="nico-title">NICO</p>
-                <p class="nico-subtitle">Asistente Virtual UMSNH</p>
-            </div>
-        </div>
-    </div>
-    """
-
-
-def login_view():
-    """Pantalla de login con botón de Google."""
+
+# Cabecera y estilos: el HTML se arma una vez por proceso y sólo viaja
+# en los reruns completos (los fragmentos de abajo se reejecutan solos)
+with span("header_render"):
     st.markdown(header_html(), unsafe_allow_html=True)
-    st.info("Inicia sesión con tu cuenta de Google para usar **NICO**.")
 
-    if not CLIENT_ID or not CLIENT_SECRET or not GOOGLE_REDIRECT_URI:
-        st.error("Faltan variables de configuración OAuth.")
-        return
 
-    if "oauth_state" not in st.session_state:
-        st.session_state["oauth_state"] = str(uuid.uuid4())
+# ------------------------------------------------------------
+# Fragmentos: cada interacción reejecuta sólo la parte que cambia
+# ------------------------------------------------------------
 
-    state_key = st.session_state["oauth_state"]
-    flow = get_flow(state=state_key)
+def toggle_voice():
+    st.session_state["voice_on"] = not st.session_state["voice_on"]
 
-    auth_url, _ = flow.authorization_url(
-        access_type="offline",
-        include_granted_scopes=False,
-        prompt="consent",
-        state=state_key,
-    )
-
-    # st.query_params para versiones nuevas
-    st.query_params["oauth_state"] = state_key
-    st.markdown(f"[🔐 Iniciar sesión con Google]({auth_url})")
-
-
-def exchange_code_for_token():
-    """Intercambiar el código OAuth por tokens y obtener perfil."""
-    try:
-        # En nuevas versiones es un objeto tipo dict, no devuelve listas por defecto
-        params = st.query_params
-        code = params.get("code")
-        state = params.get("state")
-    except:
-        return
-
-    if not code or not state:
-        return
-
-    # 🌟 CORRECCIÓN AUTH: Bloquear la doble ejecución (Previene invalid_grant)
-    if st.session_state.get("is_exchanging_token"):
-        return
-
-    # Establecer la bandera antes de intentar el intercambio
-    st.session_state["is_exchanging_token"] = True
-
-    try:
-        if "oauth_state" not in st.session_state:
-            st.session_state["oauth_state"] = state
-
-        if state != st.session_state.get("oauth_state"):
-            st.warning("⚠️ El estado OAuth se regeneró automáticamente.")
-            st.session_state["oauth_state"] = state
-
-        flow = get_flow(state=state)
-        flow.fetch_token(code=code)
-        creds = flow.credentials
-
-        request = grequests.Request()
-        idinfo = id_token.verify_oauth2_token(creds.id_token, request, CLIENT_ID)
-
-        st.session_state["logged"] = True
-        st.session_state["profile"] = {
-            "email": idinfo.get("email"),
-            "name": idinfo.get("name"),
-            "picture": idinfo.get("picture"),
-        }
-        
-        # Limpiar la bandera en caso de éxito
-        st.session_state["is_exchanging_token"] = False
-        st.query_params.clear() # Limpiar URL
-        st.rerun() 
-
-    except Exception as e:
-        st.error(f"Error al autenticar: {e}")
-        # Limpiar la bandera y la URL en caso de fallo
-        st.session_state["is_exchanging_token"] = False
-        st.query_params.clear()
-        st.rerun()
 
+@st.fragment
+def avatar_view(video_container):
+    """Video del avatar, botón de voz y componente de voz."""
+    keep_turn_alive()
 
-# ============================================================
-# Gemini 2.0 con búsqueda en internet (REVERTIDO A PROMPT ÚNICO)
-# ============================================================
-# 🌟 CORRECCIÓN GEMINI: Revertido a formato de prompt de texto único para evitar el error 400.
-def gemini_generate(prompt: str, temperature: float, top_p: float, max_tokens: int) -> str:
-    endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
-    headers = {
-        "Content-Type": "application/json",
-        "x-goog-api-key": GEMINI_API_KEY,
-    }
-    # Payload simple: Envía todo el historial y las instrucciones como texto en 'contents'
-    payload = {
-        "contents": [{"parts": [{"text": prompt}]}],
-        "generationConfig": {
-            "temperature": float(temperature),
-            "topP": float(top_p),
-            "maxOutputTokens": int(max_tokens),
-        },
-        "tools": [{"google_search": {}}],
-    }
-
-    try:
-        r = requests.post(endpoint, headers=headers, json=payload, timeout=40)
-        r.raise_for_status()
-        data = r.json()
-        text = ""
-        for cand in data.get("candidates", []):
-            for part in cand.get("content", {}).get("parts", []):
-                text += part.get("text", "")
-        return text.strip() or "No obtuve respuesta del modelo."
-    except Exception as e:
-        return f"⚠️ Error con Gemini: {e}"
-
-
-def speak_browser(text: str):
-    """
-    Usa la Web Speech API y sincroniza el video.
-    """
-    if not text: return
-    payload = json.dumps(text)
-
-    js_code = f"""
-    <script>
-    (function() {{
-        const text = {payload};
-        const synth = window.speechSynthesis;
-        if (!synth) return;
-
-        function findVideo() {{
-            const v = parent.document.querySelector('video');
-            return v;
-        }}
-
-        function speak() {{
-            synth.cancel();
-            const utter = new SpeechSynthesisUtterance(text);
-            const voices = synth.getVoices() || [];
-            let chosen = null;
-            
-            const preferNames = ["miguel", "diego", "jorge", "pablo", "male", "hombre"];
-            for (const v of voices) {{
-                const name = (v.name || "").toLowerCase();
-                const lang = (v.lang || "").toLowerCase();
-                if (lang.startsWith("es")) {{
-                    for (const pref of preferNames) {{
-                        if (name.includes(pref)) {{ chosen = v; break; }}
-                    }}
-                }}
-                if (chosen) break;
-            }}
-            if (!chosen) {{
-                for (const v of voices) {{
-                    if (v.lang.toLowerCase().startsWith("es")) {{ chosen = v; break; }}
-                }}
-            }}
-            if (chosen) utter.voice = chosen;
-
-            utter.rate = 0.95;
-            utter.pitch = 0.65;
-
-            utter.onstart = () => {{ const v = findVideo(); if (v) v.play(); }};
-            utter.onend = () => {{ const v = findVideo(); if (v) v.pause(); }};
-
-            synth.speak(utter);
-        }}
-
-        if (synth.getVoices().length === 0) {{
-            synth.addEventListener('voiceschanged', function handler() {{
-                synth.removeEventListener('voiceschanged', handler);
-                speak();
-            }});
-        }} else {{
-            speak();
-        }}
-    }})();
-    </script>
-    """
-    components.html(js_code, height=0)
+    # Mostrar video actual o elegir uno inicial
+    # (la sesión sólo guarda el nombre; los bytes viven una vez por proceso)
+    if not st.session_state["current_video"]:
+        try:
+            st.session_state["current_video"] = pick_avatar_video()
+        except: pass
 
+    if st.session_state["current_video"]:
+        render_avatar_video(video_container, st.session_state["current_video"])
 
-# ============================================================
-# Lógica principal de la app
-# ============================================================
+    st.button(
+        "🎙️ Voz: " + ("ON" if st.session_state["voice_on"] else "OFF"),
+        on_click=toggle_voice,
+    )
 
-ensure_session_defaults()
-exchange_code_for_token()
+    # Voz: componente estático; cada respuesta se habla una sola vez
+    render_voice(
+        latest_assistant_message(st.session_state["history"]),
+        st.session_state["voice_on"],
+        st.session_state["voice_mode"],
+    )
 
-if not st.session_state.get("logged"):
-    login_view()
-    st.stop()
 
-# Cabecera
-st.markdown(header_html(), unsafe_allow_html=True)
+def close_config():
+    st.session_state["open_cfg"] = False
 
-# Layout: chat + video
-conv_col, video_col = st.columns([0.7, 0.3])
 
-with video_col:
-    video_container = st.empty()
-    
-    # Mostrar video actual o generar uno inicial
-    if not st.session_state["current_video"]:
-        try:
-            video_files = [f for f in os.listdir("assets/videos") if f.lower().endswith((".mp4", ".webm"))]
-            if video_files:
-                chosen = random.choice(video_files)
-                video_path = os.path.join("assets/videos", chosen)
-                with open(video_path, "rb") as f:
-                    b64 = base64.b64encode(f.read()).decode("utf-8")
-                
-                st.session_state["current_video"] = f"""
-                <video width="220" loop muted playsinline style="border-radius:12px;">
-                    <source src="data:video/mp4;base64,{b64}" type="video/mp4">
-                </video>
-                """
-        except: pass
-            
-    if st.session_state["current_video"]:
-        video_container.markdown(st.session_state["current_video"], unsafe_allow_html=True)
+@st.fragment
+def controls_view():
+    """Barra superior y configuración del modelo (sólo cambian session_state)."""
+    keep_turn_alive()
 
-with conv_col:
-    # Barra superior de controles
-    c1, c2, c3 = st.columns([0.15, 0.15, 0.7])
+    c1, c2 = st.columns([0.15, 0.85])
     with c1:
-        if st.button("🎙️ Voz: " + ("ON" if st.session_state["voice_on"] else "OFF")):
-            st.session_state["voice_on"] = not st.session_state["voice_on"]
-            st.rerun() 
-    with c2:
         if st.button("⚙️ Config"):
             st.session_state["open_cfg"] = True
-    with c3:
+    with c2:
         st.write(f"Bienvenido, **{st.session_state['profile'].get('name', '')}**")
 
     if st.session_state.get("open_cfg"):
@@ -397,18 +137,39 @@ with conv_col:
             st.slider("Temperatura", 0.0, 1.5, key="temperature")
             st.slider("Top-P", 0.0, 1.0, key="top_p")
             st.slider("Máx. tokens", 64, 2048, key="max_tokens", step=32)
-            if st.button("Cerrar Config"):
-                st.session_state["open_cfg"] = False
-                st.rerun()
-
+            st.toggle("Respuesta en streaming", key="stream_on")
+            st.radio("Voz", ["Navegador", "Servidor"], key="voice_mode", horizontal=True)
+            stats = get_answer_cache().stats()
+            st.caption(
+                f"Caché de respuestas: {stats['hits']} aciertos, "
+                f"{stats['misses']} fallos, {stats['size']} guardadas"
+            )
+            load = get_rate_limiter().stats()
+            st.caption(f"Gemini: {load['active']} en curso, {load['queued']} en fila")
+            sessions = get_session_tracker().stats()
+            st.caption(
+                f"Sesiones en este proceso: {sessions['sessions']} "
+                f"({sessions['compacted']} compactadas), {sessions['bytes'] / 1024:.0f} KiB de estado; "
+                f"la mayor {sessions['max_bytes'] / 1024:.0f} KiB"
+            )
+            down = [m for m, info in get_upstream().stats().items() if info["state"] != "closed"]
+            if down:
+                st.caption(f"Sin respuesta de Gemini (circuito abierto): {', '.join(down)}")
+            st.button("Cerrar Config", on_click=close_config)
+
+
+@st.fragment
+def chat_view(video_container):
+    """Entrada, turno en curso e historial."""
     st.markdown("### 💬 Conversación")
 
     # --- LÓGICA DE INPUT (Callbacks para Enter y Borrar) ---
     
     def action_submit():
-        """Activa la bandera para enviar a Gemini"""
+        """Activa la bandera para enviar a Gemini (cada envío es un turno nuevo)"""
         if st.session_state["input_val"].strip():
             st.session_state["trigger_run"] = True
+            st.session_state["turn_id"] = uuid.uuid4().hex
 
     def action_clear():
         """Limpia el texto sin enviar"""
@@ -430,103 +191,54 @@ with conv_col:
         st.button("Borrar 🗑️", on_click=action_clear)
 
     # Procesamiento si se activó la bandera
+    # El turno corre en el pool de hilos; si un rerun interrumpe este script
+    # (slider, Voz, otro mensaje) el trabajo sigue y se retoma por turn_id.
     if st.session_state["trigger_run"]:
-        user_msg = st.session_state["input_val"]
-        
-        # 1. Guardar mensaje de usuario
-        st.session_state["history"].append({"role": "user", "content": user_msg})
-
-        # 2. Video Aleatorio
-        try:
-            video_files = [f for f in os.listdir("assets/videos") if f.lower().endswith((".mp4", ".webm"))]
-            if video_files:
-                chosen = random.choice(video_files)
-                video_path = os.path.join("assets/videos", chosen)
-                with open(video_path, "rb") as f:
-                    b64 = base64.b64encode(f.read()).decode("utf-8")
-                
-                html_video = f"""
-                <video width="220" loop muted playsinline style="border-radius:12px;">
-                    <source src="data:video/mp4;base64,{b64}" type="video/mp4">
-                </video>
-                """
-                st.session_state["current_video"] = html_video
-                video_container.markdown(html_video, unsafe_allow_html=True)
-        except Exception as e:
-            st.warning(f"Video error: {e}")
-
-        # 3. Obtener Nombre (Primer nombre)
-        full_name = st.session_state['profile'].get('name', 'Usuario')
-        first_name = full_name.split(' ')[0] if full_name else 'Amigo'
-
-        # 4. Prompt del Sistema (CONSTANTE)
-        sys_prompt = (
-            "Eres NICO, asistente institucional de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH). "
-            f"El usuario se llama {first_name}. "
-            "se responsable e incluyente, eficiente y ético"    
-            "Tu personalidad es alegre y jovial"
-            "Eres la mascota de la UMSNH eres un zorro, puedes hablar en español o purepecha"       
-            "NO uses negritas, NO uses Markdown, NO uses símbolos como **, *, _, #, ~~, etc.  "
-            "NO generes listas con guiones viñetas asteriscos o puntos. "
-            "Tu objetivo principal es proporcionar información precisa, actualizada y relevante de la UMSNH. "
-            "ANTE CUALQUIER PREGUNTA SOBRE NOTICIAS, CONTACTOS, O ACTUALIDAD (DESPUÉS DE 2023), DEBES EJECUTAR LA HERRAMIENTA DE BÚSQUEDA WEB DE GOOGLE (GoGoGoogleSearchh)"                                                                                                       
-            "Responde siempre en español de mexico o en purépecha si es solicitado de forma clara, breve y amable. "
-            "**IMPORTANTE: NO saludes al inicio de tu respuesta (ej. no digas 'Hola', 'Buenos días', 'Qué tal {nombre}'). El sistema ya saluda por ti la primera vez. Comienza directamente con la información solicitada o la respuesta a la pregunta.**"
-            "Usa su nombre ocasionalmente en la conversación para que suene natural, pero no en cada frase.\n "
-            "para nombres de funcionarios busca la web en https://umich.mx/unidades-administrativas/"       
-            "Prioriza sitios *.umich.mx."
-            "- https://www.umich.mx\n"
-            "-https://www.gacetanicolaita.umich.mx/n"
-            "-https://umich.mx/unidades-administrativas/n"
-            "- https://www.dce.umich.mx\n"
-            "- https://siia.umich.mx\n"
-            "Solo si te preguntan quien es la rectora, responde con, La rectora de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH) es Yarabí Ávila González. Fue designada para este cargo por el periodo 2023-2027."
-            "Solo si te preguntan quien es el director de El director de la Dirección de Tecnologías de la Información y la Comunicación (DTIC) respondeEl director de la Dirección de Tecnologías de la Información y la Comunicación (DTIC) de la UMSNH (Universidad Michoacana de San Nicolás de Hidalgo) es el Ingeniero Francisco Octavio Aparicio Contreras"
-            "El lema de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH) es, Cuna de héroes, crisol de pensadores"
-             "cual es el himno de la UMSNH, Universidad Michoacana, Tienes el tesoro del saber, Universidad Michoacana,En tu esencia Humanista he de crecer. Universidad Michoacana, Llevas puesto el corazón de Ocampo, Universidad Michoacana, Tienes en tu sangre inscrito a Hidalgo." 
-             "Pis pas, calis calas es parte de una famosa porra de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH) en Morelia, México, un grito tradicional de identidad y orgullo estudiantil que se canta en eventos deportivos y cívicos, significando rapidez y unidad, y a menudo se completa con ¡Pummm! ¡San Nicolás! "           
-             "Solo si te preguntan quien es el secretario general de la UMSNH El secretario general de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH) es Javier Cervantes Rodríguez. Asumió el cargo en julio de 2023")
-        # 5. CONSTRUIR EL PROMPT COMPLETO CON HISTORIAL (para el error 400)
-        full_prompt = sys_prompt + "\n\n--- HISTORIAL DE CONVERSACIÓN ---\n"
-        
-        # Iterar sobre el historial para concatenar el texto (máx. 5 mensajes)
-        # Se invierte el historial para dar más peso al final de la conversación
-        history_text = ""
-        # Usamos los últimos 5 mensajes para mantener el contexto
-        for msg in st.session_state["history"][-5:]: 
-            role = "Asistente" if msg["role"] == "assistant" else "Usuario"
-            content = msg["content"]
-            
-            # Omitir el saludo inyectado en el historial para no confundir al modelo
-            if not st.session_state["greeted"] and content.startswith(f"¡Hola {first_name}!") and msg["role"] == "assistant":
-                continue 
-            
-            history_text += f"{role}: {content}\n"
-        
-        full_prompt += history_text
-        full_prompt += f"\n--- FIN DEL HISTORIAL ---\n\nÚltimo mensaje del Usuario: {user_msg}"
-        
-        # 6. Llamar a la función gemini_generate con el prompt de texto único
-        reply_raw = gemini_generate(
-            full_prompt,
-            st.session_state["temperature"],
-            st.session_state["top_p"],
-            st.session_state["max_tokens"],
-        )
-        
-        # 7. Saludo Único (Solo la primera vez)
-        if not st.session_state["greeted"]:
-            saludo = f"¡Hola {first_name}! Soy NICO, tu asistente virtual.\n\n"
-            reply = saludo + reply_raw
-            st.session_state["greeted"] = True
+        job = st.session_state["pending_job"]
+        if job is None or job.meta.get("turn_id") != st.session_state["turn_id"]:
+            if job is not None:
+                job.cancel()  # el usuario mandó otro mensaje
+            job = start_turn(video_container)
+            st.session_state["pending_job"] = job
+
+        meta = job.meta
+        # 10. Mostrar la respuesta conforme llega
+        if not job.done or meta.get("saludo"):
+            with st.chat_message("assistant"):
+                if meta.get("saludo"):
+                    st.markdown(meta["saludo"])
+                reply_raw = render_job(job).strip()
         else:
-            reply = reply_raw
+            reply_raw = job.text.strip()
+
+        # Sólo respuestas que terminaron limpias van a la caché compartida
+        if (
+            meta.get("cache_key")
+            and meta.get("from_model")
+            and not meta.get("throttled")
+            and not meta.get("degraded")
+            and not meta.get("error")
+            and not is_error_reply(reply_raw)
+        ):
+            # None: el nombre del usuario aparece fuera del vocativo (no se comparte)
+            shared = depersonalize(reply_raw, meta["first_name"])
+            if shared is not None:
+                get_answer_cache().put(meta["cache_key"], shared)
+        elif meta.get("error") and not meta.get("degraded") and not is_error_reply(reply_raw):
+            reply_raw += f"\n\n{INTERRUPTED_NOTE}"  # cortada a media respuesta
+
+        reply = meta.get("saludo", "") + reply_raw
+
+        # 11. Guardar respuesta del asistente
+        remember(new_message("assistant", reply))
+        if st.session_state["voice_on"] and st.session_state["voice_mode"] == "Servidor":
+            get_tts_engine().prefetch(reply)  # la voz se sintetiza mientras se redibuja
+        st.session_state["history"] = st.session_state["memory"].trim(st.session_state["history"])
 
-        # 8. Guardar respuesta del asistente
-        st.session_state["history"].append({"role": "assistant", "content": reply})
-        
         # Bajamos la bandera pero NO borramos el input
+        st.session_state["pending_job"] = None
         st.session_state["trigger_run"] = False
+        # Rerun completo: la respuesta nueva también cambia el avatar y la voz
         st.rerun()
 
     # Mostrar historial
@@ -536,6 +248,28 @@ with conv_col:
         else:
             with st.chat_message("assistant"):
                 st.markdown(f"<div class='chat-bubble'>{msg['content']}</div>", unsafe_allow_html=True)
-                if st.session_state["voice_on"]:
-                    speak_browser(msg["content"])
             break
+
+    # Mensajes anteriores: sólo se pintan (y se leen del almacén) si se piden
+    if st.toggle("🕘 Ver mensajes anteriores", key="show_older"):
+        history = st.session_state["history"]
+        last_reply = max(
+            (i for i, m in enumerate(history) if m["role"] == "assistant"), default=len(history)
+        )
+        for msg in st.session_state["older_history"] + history[:last_reply]:
+            who = "Tú" if msg["role"] == "user" else "NICO"
+            st.caption(f"{who}: {msg['content']}")
+        st.button("Cargar anteriores", on_click=load_older_history)
+
+
+# Layout: chat + video
+conv_col, video_col = st.columns([0.7, 0.3])
+
+with video_col:
+    # Contenedor creado fuera de los fragmentos: el turno (chat) también cambia el video
+    video_container = st.empty()
+    avatar_view(video_container)
+
+with conv_col:
+    controls_view()
+    chat_view(video_container)
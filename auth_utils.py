@@ -0,0 +1,314 @@
+# ---------------------------------------
+# auth_utils.py
+# Login con Google: configuración del cliente OAuth lista de antemano,
+# certificados de Google (id_token) cacheados según Cache-Control,
+# intercambio del código OAuth y reanudación de sesión.
+# El estado y el nonce de OAuth viven en el estado compartido (state_utils):
+# el regreso de Google puede caer en cualquier réplica.
+# google_auth_oauthlib sólo se importa cuando hace falta el flujo OAuth.
+# ---------------------------------------
+
+import re
+import threading
+import time
+import uuid
+
+import streamlit as st
+from google.auth import exceptions
+from google.auth.transport import requests as grequests
+from google.oauth2 import id_token
+
+from config_utils import get_setting
+from http_utils import get_http_session, share_pool
+from media_utils import header_html
+from metrics_utils import inc, span
+from session_utils import (
+    get_refresh_vault,
+    issue_session_token,
+    read_session_token,
+    refresh_id_token,
+    session_cookie,
+    session_secret,
+)
+from state_utils import get_shared_state
+
+CLIENT_ID = get_setting("GOOGLE_CLIENT_ID", "")
+CLIENT_SECRET = get_setting("GOOGLE_CLIENT_SECRET", "")
+GOOGLE_REDIRECT_URI = get_setting("GOOGLE_REDIRECT_URI", "https://nicooapp-umsnh.streamlit.app/")
+
+SCOPES = [
+    "openid",
+    "https://www.googleapis.com/auth/userinfo.email",
+    "https://www.googleapis.com/auth/userinfo.profile",
+]
+
+GOOGLE_AUTH_URI = "https://accounts.google.com/o/oauth2/auth"
+# Configurables para apuntar a un servidor simulado (bench/)
+GOOGLE_TOKEN_URI = get_setting("GOOGLE_TOKEN_URI", "https://oauth2.googleapis.com/token")
+GOOGLE_CERTS_URL = get_setting("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+REDIRECT_URIS = [
+    "https://nicooapp-umsnh.streamlit.app/",
+    "http://localhost:8501/",
+    "http://127.0.0.1:8501/",
+]
+
+# Segundos que vale un enlace de login (estado + nonce de un solo uso)
+OAUTH_STATE_TTL = get_setting("OAUTH_STATE_TTL", 600.0)
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+@st.cache_resource(show_spinner=False)
+def oauth_client_config(client_id: str, client_secret: str) -> dict:
+    """client_config del Flow, construido una vez por proceso."""
+    return {
+        "web": {
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "auth_uri": GOOGLE_AUTH_URI,
+            "token_uri": GOOGLE_TOKEN_URI,
+            "redirect_uris": REDIRECT_URIS,
+        }
+    }
+
+
+class CachingRequest(grequests.Request):
+    """
+    Transporte de google-auth sobre la sesión HTTP compartida que guarda las
+    respuestas GET exitosas (certificados / JWKS) mientras lo permita su
+    Cache-Control: max-age. Así cada login no vuelve a descargar los certificados.
+    """
+
+    def __init__(self, session=None):
+        super().__init__(session=session)
+        self._lock = threading.Lock()
+        self._cache = {}  # url -> (respuesta, expira)
+        self._refreshing = {}  # url -> Lock: una sola descarga por URL a la vez
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, url):
+        with self._lock:
+            cached = self._cache.get(url)
+            if cached and cached[1] > time.time():
+                self.hits += 1
+                inc("certs_cache_total", result="hit")
+                return cached[0]
+            return None
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=120, **kwargs):
+        if method != "GET":
+            return super().__call__(url, method, body, headers, timeout, **kwargs)
+
+        cached = self._fresh(url)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            refreshing = self._refreshing.setdefault(url, threading.Lock())
+        with refreshing:
+            # Otro login pudo descargarlos mientras esperábamos
+            cached = self._fresh(url)
+            if cached is not None:
+                return cached
+
+            now = time.time()
+            response = super().__call__(url, method, body, headers, timeout, **kwargs)
+            ttl = self._ttl(response)
+            inc("certs_cache_total", result="miss")
+            with self._lock:
+                self.misses += 1
+                if response.status == 200 and ttl > 0:
+                    response.data  # leer el cuerpo ahora para reutilizarlo
+                    self._cache[url] = (response, now + ttl)
+            return response
+
+    @staticmethod
+    def _ttl(response) -> int:
+        cache_control = response.headers.get("Cache-Control", "")
+        if "no-store" in cache_control or "no-cache" in cache_control:
+            return 0
+        match = _MAX_AGE.search(cache_control)
+        if not match:
+            return 0
+        try:
+            age = int(response.headers.get("Age", 0))
+        except ValueError:
+            age = 0
+        return max(0, int(match.group(1)) - age)
+
+
+@st.cache_resource(show_spinner=False)
+def get_auth_request() -> CachingRequest:
+    return CachingRequest(session=get_http_session())
+
+
+def verify_google_id_token(token: str, audience: str) -> dict:
+    """Verifica el id_token con los certificados cacheados (sin red si siguen vigentes)."""
+    # Igual que id_token.verify_oauth2_token, pero con la URL de certificados configurable
+    idinfo = id_token.verify_token(token, get_auth_request(), audience, certs_url=GOOGLE_CERTS_URL)
+    if idinfo.get("iss") not in GOOGLE_ISSUERS:
+        raise exceptions.GoogleAuthError(f"Emisor inválido: {idinfo.get('iss')}")
+    return idinfo
+
+
+# ============================================================
+# Flujo OAuth y sesión
+# ============================================================
+
+def get_flow(state=None):
+    # Importe tardío: quien ya tiene sesión (cookie) no carga google_auth_oauthlib
+    from google_auth_oauthlib.flow import Flow
+
+    # client_config se arma una sola vez por proceso
+    client_config = oauth_client_config(CLIENT_ID, CLIENT_SECRET)
+
+    flow = Flow.from_client_config(
+        client_config, scopes=SCOPES, redirect_uri=GOOGLE_REDIRECT_URI
+    )
+    if state:
+        flow.redirect_uri = GOOGLE_REDIRECT_URI
+    return flow
+
+
+def resume_session():
+    """
+    Reanuda la sesión con la cookie firmada: si está vigente sólo se valida
+    la firma (sin red); si expiró, se renueva con el refresh token guardado.
+    """
+    if st.session_state["logged"] or st.session_state.get("resume_checked"):
+        return
+    st.session_state["resume_checked"] = True
+
+    secret = session_secret(CLIENT_SECRET)
+    profile, valid = read_session_token(session_cookie(), secret)
+    if profile is None:
+        return
+    st.session_state["login_hint"] = profile["email"]
+
+    if not valid:
+        refresh_token = get_refresh_vault().get(profile["email"])
+        if not refresh_token:
+            return
+        try:
+            new_id_token = refresh_id_token(refresh_token, CLIENT_ID, CLIENT_SECRET, GOOGLE_TOKEN_URI)
+            idinfo = verify_google_id_token(new_id_token, CLIENT_ID) if new_id_token else None
+        except Exception:
+            idinfo = None
+        if not idinfo or idinfo.get("email") != profile["email"]:
+            return
+        profile = {k: idinfo.get(k) for k in ("email", "name", "picture")}
+        st.session_state["session_token_pending"] = issue_session_token(profile, secret)
+
+    st.session_state["logged"] = True
+    st.session_state["profile"] = profile
+
+
+def login_view():
+    """Pantalla de login con botón de Google."""
+    st.markdown(header_html(), unsafe_allow_html=True)
+    st.info("Inicia sesión con tu cuenta de Google para usar **NICO**.")
+
+    if not CLIENT_ID or not CLIENT_SECRET or not GOOGLE_REDIRECT_URI:
+        st.error("Faltan variables de configuración OAuth.")
+        return
+
+    if "oauth_state" not in st.session_state:
+        st.session_state["oauth_state"] = str(uuid.uuid4())
+    nonce = st.session_state.setdefault("oauth_nonce", uuid.uuid4().hex)
+
+    state_key = st.session_state["oauth_state"]
+    # Se registra fuera de la sesión: el regreso de Google abre una sesión nueva
+    get_shared_state().set(f"oauth:{state_key}", nonce, ttl=OAUTH_STATE_TTL)
+    flow = get_flow(state=state_key)
+
+    # Sólo se fuerza "consent" si aún no tenemos refresh token de este usuario
+    login_hint = st.session_state.get("login_hint")
+    extra = {"login_hint": login_hint} if login_hint else {}
+    has_refresh = bool(login_hint and get_refresh_vault().get(login_hint))
+
+    auth_url, _ = flow.authorization_url(
+        access_type="offline",
+        include_granted_scopes=False,
+        prompt="select_account" if has_refresh else "consent",
+        state=state_key,
+        nonce=nonce,
+        **extra,
+    )
+
+    # st.query_params para versiones nuevas
+    st.query_params["oauth_state"] = state_key
+    st.markdown(f"[🔐 Iniciar sesión con Google]({auth_url})")
+
+
+def exchange_code_for_token():
+    """Intercambiar el código OAuth por tokens y obtener perfil."""
+    try:
+        # En nuevas versiones es un objeto tipo dict, no devuelve listas por defecto
+        params = st.query_params
+        code = params.get("code")
+        state = params.get("state")
+    except:
+        return
+
+    if not code or not state:
+        return
+
+    # 🌟 CORRECCIÓN AUTH: Bloquear la doble ejecución (Previene invalid_grant)
+    if st.session_state.get("is_exchanging_token"):
+        return
+
+    # Establecer la bandera antes de intentar el intercambio
+    st.session_state["is_exchanging_token"] = True
+
+    # Estado de un solo uso emitido por login_view (en esta u otra réplica)
+    nonce = get_shared_state().pop(f"oauth:{state}")
+    if nonce is None:
+        inc("oauth_state_rejected_total")
+        st.session_state["is_exchanging_token"] = False
+        st.session_state.pop("oauth_state", None)
+        st.session_state.pop("oauth_nonce", None)
+        st.query_params.clear()
+        st.warning("⚠️ El enlace de inicio de sesión caducó o ya se usó. Vuelve a intentarlo.")
+        return
+
+    try:
+        with span("oauth_exchange"):
+            flow = get_flow(state=state)
+            share_pool(flow.oauth2session)  # reutiliza conexiones keep-alive
+            flow.fetch_token(code=code)
+            creds = flow.credentials
+
+            # Certificados de Google cacheados según su Cache-Control
+            idinfo = verify_google_id_token(creds.id_token, CLIENT_ID)
+            if idinfo.get("nonce") != nonce:
+                raise exceptions.GoogleAuthError("nonce de OAuth inválido")
+
+        st.session_state["logged"] = True
+        st.session_state["profile"] = {
+            "email": idinfo.get("email"),
+            "name": idinfo.get("name"),
+            "picture": idinfo.get("picture"),
+        }
+
+        # Reanudación: refresh token en el servidor + cookie firmada en el navegador
+        if creds.refresh_token:
+            get_refresh_vault().put(idinfo.get("email"), creds.refresh_token)
+        secret = session_secret(CLIENT_SECRET)
+        if secret:
+            st.session_state["session_token_pending"] = issue_session_token(
+                st.session_state["profile"], secret
+            )
+        
+        # Limpiar la bandera en caso de éxito
+        st.session_state["is_exchanging_token"] = False
+        st.query_params.clear() # Limpiar URL
+        st.rerun() 
+
+    except Exception as e:
+        st.error(f"Error al autenticar: {e}")
+        # Limpiar la bandera y la URL en caso de fallo
+        st.session_state["is_exchanging_token"] = False
+        st.query_params.clear()
+        st.rerun()
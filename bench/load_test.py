@@ -0,0 +1,290 @@
+# ---------------------------------------
+# bench/load_test.py
+# Prueba de carga de NICO contra bench/mock_google.py (sin red ni cuota).
+# Cada sesión simulada: login (refresh -> id_token -> verificación),
+# turnos con memoria + prompt + ruta + Gemini (pool, admisión, streaming)
+# + voz (backend falso con latencia) + elección de video.
+# Reporta p50/p95/p99, rendimiento y memoria por sesión.
+#
+#   python -m bench.load_test --sessions 500 --concurrency 100 --turns 3
+#   python -m bench.load_test --apptest 20      (además: sesiones completas con AppTest)
+#   python -m bench.load_test --slow-rate 0.05 --slow-delay 8    (cola lenta: cobertura)
+#   python -m bench.load_test --error-rate 1                      (caída: cortacircuitos)
+# ---------------------------------------
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.mock_google import MockGoogle
+
+QUESTIONS = [
+    "¿Quién es la rectora?",
+    "Explícame qué es una derivada",
+    "¿Cuándo es el examen de admisión?",
+    "Traduce gracias al purépecha",
+    "¿Cuál es el teléfono de control escolar?",
+    "Dame consejos para estudiar para un examen",
+    "¿Cuál es el lema de la universidad?",
+    "¿Qué becas hay para estudiantes de licenciatura?",
+]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def error(self, name: str):
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def timed(self, name: str):
+        recorder = self
+
+        class _Timer:
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, *exc):
+                recorder.add(name, time.perf_counter() - self.start)
+
+        return _Timer()
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+# ============================================================
+# Sesión simulada (misma secuencia que start_turn en chat_utils.py)
+# ============================================================
+
+def run_session(index: int, args, mock: MockGoogle, rec: Recorder, tts) -> int:
+    # Importes tardíos: la configuración del servidor simulado ya está en el entorno
+    from auth_utils import GOOGLE_TOKEN_URI, verify_google_id_token
+    from cache_utils import is_history_dependent
+    from footprint_utils import state_size
+    from gemini_utils import gemini_job
+    from media_utils import avatar_variant, load_avatar_videos, load_media_file, pick_avatar_video
+    from memory_utils import ConversationMemory, new_message
+    from prompt_utils import SYSTEM_INSTRUCTION, build_contents
+    from rate_utils import submit_admitted
+    from router_utils import STATIC, fallback_answer, route_question
+    from session_utils import refresh_id_token
+    from worker_utils import PoolBusy
+
+    email = f"estudiante{index}@umich.mx"
+    with rec.timed("login"):
+        token = refresh_id_token(f"bench-refresh:{email}", mock.client_id, "bench", GOOGLE_TOKEN_URI)
+        verify_google_id_token(token, mock.client_id)
+
+    memory = ConversationMemory()
+    history, last_tier = [], ""
+    for turn in range(args.turns):
+        question = QUESTIONS[(index + turn) % len(QUESTIONS)]
+        started = time.perf_counter()
+        history.append(new_message("user", question))
+
+        with rec.timed("prompt"):
+            recent = memory.select(history)
+            contents = build_contents(recent, "Estudiante", len(recent), memory.summary)
+            follow_up = is_history_dependent(question, len(history) - 1)
+            route = route_question(question, args.model, follow_up, last_tier)
+            last_tier = route.tier
+
+        reply = route.answer
+        if route.tier != STATIC:
+            try:
+                job = submit_admitted(
+                    gemini_job, contents, 0.7, 0.9, 256,
+                    stream=not args.no_stream, model=args.model, api_key="bench",
+                    system_instruction=SYSTEM_INSTRUCTION, tools=route.tools,
+                    degraded=fallback_answer(question),
+                )
+            except PoolBusy:
+                rec.error("pool_busy")
+                continue
+            text, done = "", False
+            while not text and not done:
+                text, done = job.snapshot(0, timeout=1.0)
+            rec.add("first_token", time.perf_counter() - started)
+            job.result(timeout=120)
+            reply = job.text
+            if job.meta.get("throttled"):
+                rec.error("queue_full")
+            elif job.meta.get("degraded"):
+                rec.error("degraded")
+            elif job.meta.get("error") or reply.startswith("⚠️"):
+                rec.error("gemini")
+            rec.add("gemini", time.perf_counter() - started)
+
+        if tts is not None:
+            with rec.timed("tts"):
+                tts_started = time.perf_counter()
+                for seq, _ in enumerate(tts.stream(reply)):
+                    if seq == 0:  # lo que espera el navegador antes de oír algo
+                        rec.add("tts_first", time.perf_counter() - tts_started)
+        with rec.timed("video"):
+            name = pick_avatar_video()
+            variant = avatar_variant(name, "Mozilla/5.0 (Linux; Android 14) Mobile")
+            if variant:
+                load_media_file(variant["file"])  # bytes compartidos por proceso
+            elif name:
+                load_avatar_videos()[name].data  # sin manifiesto: los originales
+
+        history.append(new_message("assistant", reply))
+        history = memory.trim(history)
+        rec.add("turn", time.perf_counter() - started)
+
+    return state_size(history) + state_size(memory)
+
+
+# ============================================================
+# Sesiones completas con AppTest (script real de Streamlit)
+# ============================================================
+
+def run_apptest_session(index: int, args, rec: Recorder) -> int:
+    from streamlit.testing.v1 import AppTest
+
+    from footprint_utils import state_size
+
+    at = AppTest.from_file(os.path.join(os.path.dirname(__file__), "..", "app.py"), default_timeout=120)
+    at.session_state["logged"] = True
+    at.session_state["profile"] = {"name": f"Estudiante {index}", "email": f"app{index}@umich.mx"}
+    with rec.timed("script_first_run"):
+        at.run()
+    for turn in range(args.turns):
+        with rec.timed("script_turn"):
+            at.text_input[0].input(QUESTIONS[(index + turn) % len(QUESTIONS)]).run()
+        if at.exception:
+            rec.error("script")
+    return state_size(at.session_state.filtered_state)
+
+
+# ============================================================
+# Reporte
+# ============================================================
+
+def report(rec: Recorder, elapsed: float, turns: int, session_sizes: list, rss_delta: int, mock) -> dict:
+    result = {"elapsed_s": elapsed, "turns": turns, "throughput_turns_s": turns / elapsed if elapsed else 0}
+    print(f"\n{'métrica':<18}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'máx ms':>10}")
+    for name, values in rec.samples.items():
+        row = {q: percentile(values, q) * 1000 for q in (50, 95, 99)}
+        row["max"] = max(values) * 1000
+        row["n"] = len(values)
+        result[name] = row
+        print(f"{name:<18}{len(values):>7}{row[50]:>10.1f}{row[95]:>10.1f}{row[99]:>10.1f}{row['max']:>10.1f}")
+
+    sessions = len(session_sizes)
+    result["errors"] = dict(rec.errors)
+    result["upstream"] = dict(mock.counts)
+    result["session_bytes_avg"] = sum(session_sizes) / sessions if sessions else 0
+    result["rss_bytes_per_session"] = rss_delta / sessions if sessions else 0
+    print(f"\n{turns} turnos en {elapsed:.1f} s -> {result['throughput_turns_s']:.1f} turnos/s")
+    print(f"errores: {result['errors'] or 'ninguno'}")
+    print(f"llamadas al servidor simulado: {result['upstream']}")
+    from resilience_utils import get_upstream
+
+    result["circuits"] = get_upstream().stats()
+    print(f"circuitos y p95 por modelo: {result['circuits']}")
+    print(
+        f"memoria por sesión: {result['session_bytes_avg'] / 1024:.1f} KiB (estado), "
+        f"{result['rss_bytes_per_session'] / 1024:.1f} KiB (RSS)"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de NICO con Google simulado")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50, help="sesiones simultáneas")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.3, help="segundos hasta el primer token")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fracción de respuestas 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fracción de respuestas lentas")
+    parser.add_argument("--slow-delay", type=float, default=8.0, help="segundos extra de las lentas")
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--chunk-delay", type=float, default=0.03)
+    parser.add_argument("--no-stream", action="store_true", help="usar generateContent")
+    parser.add_argument("--tts-delay", type=float, default=0.05, help="latencia de la voz (-1 = sin voz)")
+    parser.add_argument("--apptest", type=int, default=0, help="sesiones completas con AppTest")
+    parser.add_argument("--model", default="bench-model")
+    parser.add_argument("--json", help="guardar el resultado en este archivo")
+    args = parser.parse_args()
+
+    mock = MockGoogle(
+        args.latency, args.jitter, args.error_rate, args.chunks, args.chunk_delay,
+        slow_rate=args.slow_rate, slow_delay=args.slow_delay,
+    ).start()
+    # Antes de importar la app: sus módulos leen la configuración al cargarse
+    os.environ.update(mock.settings())
+    os.environ.setdefault("TTS_BACKEND", "fake")
+    os.environ.setdefault("HISTORY_STORE", "none")
+    os.environ.setdefault("GEMINI_FALLBACK_MODEL", "")
+    os.environ.setdefault("RATE_LIMIT_BURST", str(args.turns))
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+    from streamlit.logger import set_log_level
+
+    from speech_utils import AudioCache, FakeTTSBackend, SpeechEngine
+
+    set_log_level("error")  # sin avisos de "missing ScriptRunContext" en modo bare
+    tts = None
+    if args.tts_delay >= 0:
+        tts = SpeechEngine(FakeTTSBackend(delay=args.tts_delay), AudioCache(32 * 1024 * 1024))
+
+    rec = Recorder()
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    # AppTest usa un Runtime global: sus sesiones van una tras otra en su propio hilo,
+    # al mismo tiempo que la carga de las sesiones simuladas
+    apptest = ThreadPoolExecutor(1, thread_name_prefix="bench-apptest")
+    with ThreadPoolExecutor(args.concurrency, thread_name_prefix="bench-session") as pool:
+        futures = [apptest.submit(run_apptest_session, i, args, rec) for i in range(args.apptest)]
+        futures += [pool.submit(run_session, i, args, mock, rec, tts) for i in range(args.sessions)]
+        sizes = []
+        for future in futures:
+            try:
+                sizes.append(future.result())
+            except Exception as e:
+                rec.error(type(e).__name__)
+    apptest.shutdown()
+    elapsed = time.perf_counter() - started
+
+    turns = len(rec.samples.get("turn", [])) + len(rec.samples.get("script_turn", []))
+    result = report(rec, elapsed, turns, sizes, rss_bytes() - rss_before, mock)
+    mock.stop()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    main()
@@ -0,0 +1,194 @@
+# ---------------------------------------
+# bench/mock_google.py
+# Servidor local que imita a Google para pruebas de carga (sin red ni cuota):
+#   POST /v1beta/models/<m>:generateContent        (JSON)
+#   POST /v1beta/models/<m>:streamGenerateContent  (SSE, chunked)
+#   POST /v1beta/cachedContents                    (caché de contexto)
+#   POST /token                                    (refresh_token -> id_token)
+#   GET  /oauth2/v1/certs                          (llaves públicas, con max-age)
+# Latencia, jitter, tasa de errores y cola lenta (una fracción de
+# respuestas con un retraso extra) configurables.
+# ---------------------------------------
+
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rsa
+from google.auth import crypt, jwt
+
+REPLY = (
+    "La Universidad Michoacana de San Nicolás de Hidalgo ofrece licenciaturas, "
+    "posgrados y bachillerato en Morelia y en varias sedes regionales del estado."
+)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class MockGoogle:
+    def __init__(self, latency: float = 0.3, jitter: float = 0.1, error_rate: float = 0.0,
+                 chunks: int = 8, chunk_delay: float = 0.03, client_id: str = "bench-client",
+                 port: int = 0, slow_rate: float = 0.0, slow_delay: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.client_id = client_id
+        self.counts = {}
+        self._lock = threading.Lock()
+
+        # Llave RSA propia para firmar id_tokens que google-auth acepte
+        public, private = rsa.newkeys(1024)
+        self._kid = "bench-key"
+        self._public_pem = public.save_pkcs1().decode("ascii")
+        self._signer = crypt.RSASigner.from_string(private.save_pkcs1(), self._kid)
+
+        self.server = _Server(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    # --- ciclo de vida ---
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-google", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def settings(self) -> dict:
+        """Variables de entorno para que la app use este servidor."""
+        return {
+            "GEMINI_API_ROOT": f"{self.url}/v1beta",
+            "GOOGLE_TOKEN_URI": f"{self.url}/token",
+            "GOOGLE_CERTS_URL": f"{self.url}/oauth2/v1/certs",
+        }
+
+    # --- utilidades ---
+
+    def id_token(self, email: str, name: str = "Estudiante") -> str:
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com",
+            "aud": self.client_id,
+            "sub": email,
+            "email": email,
+            "name": name,
+            "iat": now,
+            "exp": now + 3600,
+        }
+        return jwt.encode(self._signer, payload, key_id=self._kid).decode("ascii")
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def _wait(self):
+        delay = max(0.0, random.gauss(self.latency, self.jitter))
+        if random.random() < self.slow_rate:
+            self._count("slow")
+            delay += self.slow_delay
+        time.sleep(delay)
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive y respuestas chunked
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def _json(self, status, data, headers=None):
+                out = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(out)
+
+            def _chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path.startswith("/oauth2/v1/certs"):
+                    mock._count("certs")
+                    self._json(200, {mock._kid: mock._public_pem},
+                               {"Cache-Control": "public, max-age=3600"})
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                body = self._body()
+                path = urllib.parse.urlparse(self.path).path
+
+                if path == "/token":
+                    mock._count("token")
+                    form = urllib.parse.parse_qs(body.decode("utf-8"))
+                    email = form.get("refresh_token", ["bench@umich.mx"])[0].split(":")[-1]
+                    self._json(200, {
+                        "access_token": "bench-access",
+                        "expires_in": 3600,
+                        "id_token": mock.id_token(email),
+                    })
+                    return
+
+                if path.endswith("/cachedContents"):
+                    mock._count("cachedContents")
+                    self._json(200, {"name": f"cachedContents/bench-{random.randrange(1 << 30)}"})
+                    return
+
+                if ":generateContent" not in path and ":streamGenerateContent" not in path:
+                    self._json(404, {"error": "not found"})
+                    return
+
+                stream = ":streamGenerateContent" in path
+                mock._count("stream" if stream else "generate")
+                mock._wait()
+                if random.random() < mock.error_rate:
+                    mock._count("errors")
+                    self._json(503, {"error": {"code": 503, "message": "overloaded"}})
+                    return
+
+                if not stream:
+                    self._json(200, {"candidates": [{"content": {"parts": [{"text": REPLY}]}}]})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                words = REPLY.split(" ")
+                step = max(1, len(words) // mock.chunks)
+                try:
+                    for i in range(0, len(words), step):
+                        text = " ".join(words[i:i + step]) + " "
+                        event = {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+                        self._chunk(f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8"))
+                        time.sleep(mock.chunk_delay)
+                    self._chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    mock._count("closed")  # el cliente cortó (cobertura perdedora, cancelación)
+                    self.close_connection = True
+
+        return Handler
@@ -0,0 +1,38 @@
+# ---------------------------------------
+# build_faq.py
+# Precalcula las respuestas de las preguntas frecuentes (faq/preguntas.txt)
+# con el mismo prompt, ruta e índice local que un turno de la app.
+#
+#   python build_faq.py                     (sólo lo que cambió)
+#   python build_faq.py --audio --workers 4 (además, voz del servidor por frase)
+#
+# Conviene correrlo a diario (p. ej. después de build_index.py): las
+# respuestas no revisadas en FAQ_MAX_AGE_DAYS dejan de servirse.
+# ---------------------------------------
+
+import argparse
+
+from faq_utils import FAQ_QUESTIONS, FAQ_STORE, FAQ_WORKERS, build_faq
+from gemini_utils import GEMINI_API_KEY
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Respuestas precalculadas de las preguntas frecuentes")
+    parser.add_argument("questions", nargs="?", default=FAQ_QUESTIONS, help="una pregunta por línea")
+    parser.add_argument("--store", default=FAQ_STORE, help="archivo que lee la app")
+    parser.add_argument("--workers", type=int, default=FAQ_WORKERS, help="llamadas a Gemini simultáneas")
+    parser.add_argument("--audio", action="store_true", help="sintetizar también la voz del servidor")
+    parser.add_argument("--force", action="store_true", help="regenerar todo aunque no haya cambios")
+    args = parser.parse_args()
+
+    if not GEMINI_API_KEY:
+        parser.error("falta GEMINI_API_KEY (entorno, .env o secrets)")
+    stats = build_faq(args.questions, args.store, workers=args.workers, audio=args.audio, force=args.force)
+    print(
+        f"{stats['questions']} preguntas: {stats['generated']} generadas, {stats['static']} datos fijos, "
+        f"{stats['reused']} sin cambios, {stats['failed']} con error -> {args.store}"
+    )
+
+
+if __name__ == "__main__":
+    main()
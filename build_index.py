@@ -0,0 +1,30 @@
+# ---------------------------------------
+# build_index.py
+# Construye (o actualiza) el índice local de umich.mx para NICO.
+#
+#   wget -m -np -A html,htm -P snapshot https://umich.mx/unidades-administrativas/
+#   python build_index.py snapshot
+#
+# Sólo se vuelven a procesar las páginas que cambiaron desde la última vez.
+# ---------------------------------------
+
+import argparse
+
+from retrieval_utils import RETRIEVAL_INDEX_DIR, build_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice BM25 local sobre una copia de umich.mx")
+    parser.add_argument("snapshot", help="directorio con la copia local (html, txt o md)")
+    parser.add_argument("--index", default=RETRIEVAL_INDEX_DIR, help="directorio del índice")
+    args = parser.parse_args()
+
+    stats = build_index(args.snapshot, args.index)
+    print(
+        f"{stats['files']} archivos ({stats['parsed']} procesados, {stats['reused']} sin cambios, "
+        f"{stats['removed']} eliminados) -> {stats['chunks']} pasajes en {args.index}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# ---------------------------------------
+# build_media.py
+# Genera las variantes ligeras de los videos del avatar (requiere ffmpeg):
+# 220 px, sin audio, WebM (VP9) y MP4 (H.264) en calidad ligera y estándar,
+# más assets/avatar/manifest.json.
+#
+#   python build_media.py
+#
+# Sólo se vuelven a codificar los videos que cambiaron. Sube assets/avatar
+# al repo: Streamlit Cloud no corre este paso.
+# ---------------------------------------
+
+import argparse
+
+from media_utils import MEDIA_DIR, VIDEO_DIR, build_media
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Variantes precomprimidas de los videos del avatar")
+    parser.add_argument("--src", default=VIDEO_DIR, help="directorio con los videos originales")
+    parser.add_argument("--out", default=MEDIA_DIR, help="directorio de salida")
+    args = parser.parse_args()
+
+    stats = build_media(args.src, args.out)
+    print(
+        f"{stats['clips']} videos ({stats['encoded']} codificados, {stats['reused']} sin cambios, "
+        f"{stats['removed']} archivos viejos eliminados): "
+        f"{stats['bytes_in'] / 1024:.0f} KiB -> {stats['bytes_out'] / 1024:.0f} KiB en variantes"
+    )
+
+
+if __name__ == "__main__":
+    main()
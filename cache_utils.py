@@ -0,0 +1,269 @@
+# ---------------------------------------
+# cache_utils.py
+# Caché de respuestas para preguntas institucionales repetidas
+# (rectora, himno, lema, "Pis pas", ...)
+# Memoria con TTL + LRU y respaldo opcional en SQLite o en el estado
+# compartido entre réplicas (state_utils).
+# ---------------------------------------
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import streamlit as st
+
+from config_utils import get_setting
+from state_utils import get_shared_state
+
+ANSWER_CACHE_TTL = get_setting("ANSWER_CACHE_TTL", 6 * 3600.0)
+ANSWER_CACHE_SIZE = get_setting("ANSWER_CACHE_SIZE", 512)
+ANSWER_CACHE_DB = get_setting("ANSWER_CACHE_DB", "")
+
+# Marcador para no guardar el nombre de un usuario dentro de la respuesta compartida
+NAME_PLACEHOLDER = "{{NOMBRE}}"
+
+# Palabras que indican que la pregunta depende de turnos anteriores
+_FOLLOW_UP_WORDS = {
+    "eso", "esa", "ese", "esto", "ello", "ella", "ellos", "ellas",
+    "anterior", "antes", "mas", "tambien", "entonces", "otra", "otro", "dijiste",
+}
+
+
+def normalize_question(text: str) -> str:
+    """Minúsculas, sin acentos ni signos, espacios colapsados."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def is_history_dependent(question: str, history_turns: int) -> bool:
+    """
+    Sin turnos previos la pregunta es autocontenida.
+    Con historial, se considera dependiente si es muy corta o usa referencias
+    ("y eso?", "dime más", "quién es él").
+    """
+    if history_turns == 0:
+        return False
+    words = normalize_question(question).split()
+    return len(words) < 3 or bool(_FOLLOW_UP_WORDS.intersection(words))
+
+
+def cache_key(question: str, model: str, temperature: float, top_p: float, max_tokens: int,
+              tools: list = None) -> str:
+    """Llave de la respuesta: pregunta, modelo y herramientas de la ruta, y ajustes."""
+    raw = json.dumps(
+        [normalize_question(question), model, tools or [], round(float(temperature), 2),
+         round(float(top_p), 2), int(max_tokens)],
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _name_pattern(name: str, vocative: bool) -> re.Pattern:
+    """
+    El nombre como palabra completa ("Ana" no coincide dentro de "semana").
+    vocative=True: sólo donde se le habla al usuario ("¡Hola Ana!", "Claro, Ana,"):
+    precedido por inicio de línea, "¡", "," u "Hola" y seguido de puntuación.
+    """
+    word = rf"(?<!\w){re.escape(name)}(?!\w)"
+    if not vocative:
+        return re.compile(word)
+    return re.compile(
+        rf"(?:^|(?<=[¡,])|(?<=[¡,] )|(?<=[Hh]ola ))[ ]?{word}(?=\s*(?:[,;:!?.]|$))",
+        re.MULTILINE,
+    )
+
+
+def swap_name(text: str, old: str, new: str) -> str:
+    """Cambia el nombre sólo donde va en vocativo; "San Nicolás" queda intacto."""
+    if not old or old == new:
+        return text
+    return _name_pattern(old, vocative=True).sub(
+        lambda m: m.group(0).replace(old, new), text
+    )
+
+
+def depersonalize(text: str, name: str):
+    """
+    Versión compartible de una respuesta: el nombre en vocativo pasa a
+    NAME_PLACEHOLDER. Devuelve None si el nombre aparece en cualquier otro
+    lugar (p. ej. "San Nicolás de Hidalgo" para alguien llamado Nicolás):
+    no se sabe si es el usuario, así que esa respuesta no se comparte.
+    """
+    if not name:
+        return text
+    shared = swap_name(text, name, NAME_PLACEHOLDER)
+    if _name_pattern(name, vocative=False).search(shared):
+        return None
+    return shared
+
+
+def personalize(text: str, name: str) -> str:
+    return text.replace(NAME_PLACEHOLDER, name or "")
+
+
+class SQLiteAnswerStore:
+    """Respaldo en disco para que la caché sobreviva reinicios."""
+
+    def __init__(self, path: str, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE answers SET used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0], row[1]
+
+    def put(self, key: str, value: str, expires: float):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, value, expires, used) VALUES (?, ?, ?, ?)",
+                (key, value, expires, time.time()),
+            )
+            # LRU: conservar sólo las `maxsize` más recientes
+            self._db.execute(
+                "DELETE FROM answers WHERE key NOT IN "
+                "(SELECT key FROM answers ORDER BY used DESC LIMIT ?)",
+                (self.maxsize,),
+            )
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM answers")
+            self._db.commit()
+
+
+class SharedAnswerStore:
+    """
+    Respaldo en el estado compartido (Redis): lo que una réplica responde
+    lo aprovechan las demás. Caduca por TTL; el desalojo por tamaño queda
+    a cargo de la política de memoria de Redis.
+    """
+
+    def __init__(self, state):
+        self._state = state
+
+    def get(self, key: str):
+        stored = self._state.get(f"answer:{key}")
+        if stored is None:
+            return None
+        item = json.loads(stored)
+        return item["value"], item["expires"]
+
+    def put(self, key: str, value: str, expires: float):
+        ttl = expires - time.time()
+        if ttl > 0:
+            self._state.set(
+                f"answer:{key}", json.dumps({"value": value, "expires": expires}), ttl=ttl
+            )
+
+    def clear(self):
+        self._state.delete_prefix("answer:")
+
+
+class AnswerCache:
+    """Caché por proceso con TTL y desalojo LRU; contadores de aciertos/fallos."""
+
+    def __init__(self, ttl: float = ANSWER_CACHE_TTL, maxsize: int = ANSWER_CACHE_SIZE, backend=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # key -> (value, expires)
+
+    def get(self, key: str):
+        value = self.peek(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def peek(self, key: str):
+        """Como get() pero sin contar acierto ni fallo (consultas secundarias)."""
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] >= now:
+                self._items.move_to_end(key)
+                return item[0]
+            self._items.pop(key, None)
+
+        if self.backend is not None:
+            stored = self.backend.get(key)
+            if stored is not None:
+                with self._lock:
+                    self._remember(key, stored[0], stored[1])
+                return stored[0]
+        return None
+
+    def put(self, key: str, value: str):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires)
+        if self.backend is not None:
+            self.backend.put(key, value, expires)
+
+    def _remember(self, key, value, expires):
+        self._items[key] = (value, expires)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._items),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_answer_cache() -> AnswerCache:
+    """Caché compartida por todas las sesiones del proceso."""
+    state = get_shared_state()
+    if ANSWER_CACHE_DB:
+        backend = SQLiteAnswerStore(ANSWER_CACHE_DB, ANSWER_CACHE_SIZE)
+    elif state.shared:
+        backend = SharedAnswerStore(state)
+    else:
+        backend = None
+    return AnswerCache(ANSWER_CACHE_TTL, ANSWER_CACHE_SIZE, backend)
@@ -0,0 +1,353 @@
+# ---------------------------------------
+# chat_utils.py
+# Estado de la conversación y turnos: historial (sesión + almacén),
+# preparación del turno (memoria, prompt, ruta, caché, límites) y
+# pintado de la respuesta conforme llega.
+# ---------------------------------------
+
+import threading
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from auth_utils import GOOGLE_CERTS_URL, get_auth_request
+from cache_utils import cache_key, get_answer_cache, is_history_dependent, personalize
+from config_utils import get_setting
+from faq_utils import get_faq_store
+from flight_utils import get_single_flight
+from gemini_utils import (
+    DEFAULT_GEN_ARGS,
+    DEFAULT_TOOLS,
+    GEMINI_API_KEY,
+    GEMINI_MODEL,
+    gemini_available,
+    gemini_job,
+    get_context_cache,
+)
+from http_utils import get_http_session
+from media_utils import pick_avatar_video, render_avatar_video
+from memory_utils import ConversationMemory, gemini_summarizer, new_message
+from metrics_utils import inc, span
+from prompt_utils import SYSTEM_INSTRUCTION, build_contents, greeting
+from rate_utils import get_gemini_pool, get_rate_limiter, slow_down_reply, submit_admitted
+from retrieval_utils import get_retriever
+from router_utils import (
+    ROUTER_FAST_MODEL,
+    ROUTER_GROUNDED_MODEL,
+    STATIC,
+    fallback_answer,
+    ground,
+    route_question,
+)
+from store_utils import get_history_store
+from worker_utils import BUSY_REPLY, Job, PoolBusy, get_worker_pool
+
+WARM_UP_ENABLED = get_setting("WARM_UP_ENABLED", True)
+
+
+# ============================================================
+# Calentamiento del proceso
+# ============================================================
+
+def _warm_up_tasks() -> list:
+    """Recursos compartidos que el primer turno necesitaría construir."""
+    tasks = [
+        get_http_session,
+        pick_avatar_video,  # manifiesto de variantes (o los originales)
+        get_answer_cache,
+        get_faq_store,
+        get_history_store,
+        get_retriever,
+        get_rate_limiter,
+        get_gemini_pool,
+        get_single_flight,
+        get_worker_pool,
+    ]
+    request = get_auth_request()
+    tasks.append(lambda: request(GOOGLE_CERTS_URL))  # certificados para verificar id_token
+    if GEMINI_API_KEY:
+        # cachedContent de la persona con y sin búsqueda web (rutas grounded y fast)
+        for model, tools in ((ROUTER_GROUNDED_MODEL or GEMINI_MODEL, DEFAULT_TOOLS),
+                             (ROUTER_FAST_MODEL or GEMINI_MODEL, [])):
+            tasks.append(lambda m=model, t=tools: get_context_cache().resolve(
+                m, GEMINI_API_KEY, SYSTEM_INSTRUCTION, t
+            ))
+    return tasks
+
+
+@st.cache_resource(show_spinner=False)
+def warm_up():
+    """
+    Una vez por proceso, en un hilo aparte: el primer estudiante no paga la
+    creación de clientes, cachés e índices. La voz no se calienta: su cliente
+    (google.cloud) sólo se importa si alguien la pide en modo Servidor.
+    """
+    if not WARM_UP_ENABLED:
+        return None
+
+    def run():
+        for task in _warm_up_tasks():
+            try:
+                task()
+            except Exception:
+                pass  # se reintentará en el primer uso real
+
+    thread = threading.Thread(target=run, name="nico-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def ensure_session_defaults():
+    """Valores por defecto en session_state."""
+    st.session_state.setdefault("logged", False)
+    st.session_state.setdefault("profile", {})
+    st.session_state.setdefault("history", [])
+    st.session_state.setdefault("history_loaded", False)
+    st.session_state.setdefault("older_history", [])
+    if "memory" not in st.session_state:
+        st.session_state["memory"] = ConversationMemory()
+    st.session_state.setdefault("voice_on", True)
+    st.session_state.setdefault("voice_mode", "Navegador")
+    st.session_state.setdefault("temperature", DEFAULT_GEN_ARGS[0])
+    st.session_state.setdefault("top_p", DEFAULT_GEN_ARGS[1])
+    st.session_state.setdefault("max_tokens", DEFAULT_GEN_ARGS[2])
+    st.session_state.setdefault("stream_on", True)
+    st.session_state.setdefault("current_video", None)
+    st.session_state.setdefault("open_cfg", False)
+    st.session_state.setdefault("greeted", False)
+    # Nuevos para el control de input
+    st.session_state.setdefault("input_val", "")
+    st.session_state.setdefault("trigger_run", False)
+    st.session_state.setdefault("turn_id", "")
+    st.session_state.setdefault("pending_job", None)
+    st.session_state.setdefault("last_tier", "")
+    # 🌟 CORRECCIÓN AUTH: Bandera para evitar doble intercambio de token (invalid_grant)
+    st.session_state.setdefault("is_exchanging_token", False)
+
+
+def keep_turn_alive():
+    """
+    Llamar al inicio de los fragmentos que no son el chat. Si uno de ellos se
+    vuelve a ejecutar solo (slider, Voz) mientras hay un turno en curso, el
+    fragmento del chat no corre: se pide un rerun completo para seguir pintándolo.
+    """
+    ctx = get_script_run_ctx()
+    if st.session_state["trigger_run"] and ctx is not None and ctx.fragment_ids_this_run:
+        st.rerun()
+
+
+def remember(message: dict):
+    """Agrega al historial de la sesión y lo encola para guardarlo (por email)."""
+    st.session_state["history"].append(message)
+    get_history_store().append(st.session_state["profile"].get("email"), message)
+
+
+def restore_history():
+    """Al entrar, recupera la última página de la conversación guardada."""
+    if st.session_state["history_loaded"]:
+        return
+    st.session_state["history_loaded"] = True
+    if st.session_state["history"]:
+        return
+    saved = get_history_store().recent(st.session_state["profile"].get("email"))
+    if saved:
+        st.session_state["history"] = saved
+        st.session_state["greeted"] = True
+        # La última respuesta restaurada ya se escuchó en la conversación anterior
+        spoken = [m["id"] for m in saved if m["role"] == "assistant"]
+        if spoken:
+            st.session_state["spoken_id"] = spoken[-1]
+
+
+def load_older_history():
+    """Carga una página más de mensajes anteriores (sólo cuando se pide)."""
+    loaded = st.session_state["older_history"] or st.session_state["history"]
+    if not loaded:
+        return
+    store = get_history_store()
+    store.flush()  # los mensajes recién encolados deben existir para paginar
+    page = store.before(st.session_state["profile"].get("email"), loaded[0]["id"])
+    st.session_state["older_history"] = page + st.session_state["older_history"]
+
+
+def degraded_answer(question: str, first_name: str, follow_up: bool, gen_args: tuple, route) -> str:
+    """
+    Respuesta sin Gemini (circuito abierto o falla): la guardada para la
+    misma pregunta y ruta con los ajustes por defecto, el dato fijo o un aviso.
+    """
+    if not follow_up and tuple(gen_args) != DEFAULT_GEN_ARGS:
+        key = cache_key(question, route.model, *DEFAULT_GEN_ARGS, tools=route.tools)
+        cached = get_answer_cache().peek(key)  # no cuenta en las estadísticas
+        if cached is not None:
+            return personalize(cached, first_name)
+    return fallback_answer(question)
+
+
+def start_turn(video_container):
+    """
+    Prepara el turno en el hilo del script (historial, video, prompt, caché)
+    y lanza la llamada a Gemini en el pool compartido. Devuelve el Job.
+    """
+    user_msg = st.session_state["input_val"]
+
+    # 1. Guardar mensaje de usuario
+    remember(new_message("user", user_msg))
+
+    # 2. Video Aleatorio
+    try:
+        with span("video_select"):
+            chosen = pick_avatar_video()
+            if chosen:
+                st.session_state["current_video"] = chosen
+                render_avatar_video(video_container, chosen)
+    except Exception as e:
+        st.warning(f"Video error: {e}")
+
+    # 3. Obtener Nombre (Primer nombre)
+    full_name = st.session_state['profile'].get('name', 'Usuario')
+    first_name = full_name.split(' ')[0] if full_name else 'Amigo'
+
+    # 4. Memoria: turnos recientes dentro del presupuesto de tokens;
+    #    los anteriores se resumen en segundo plano
+    memory = st.session_state["memory"]
+    with span("prompt_build"):
+        memory.collect()
+        recent = memory.select(st.session_state["history"])
+        memory.fold(
+            st.session_state["history"],
+            recent,
+            gemini_summarizer(GEMINI_MODEL, GEMINI_API_KEY),
+        )
+
+        # 5. Request estructurado: systemInstruction fija + turnos con rol (user/model)
+        contents = build_contents(
+            recent, first_name, max_messages=len(recent), summary=memory.summary
+        )
+
+    # 6. Saludo Único (Solo la primera vez)
+    saludo = ""
+    if not st.session_state["greeted"]:
+        saludo = greeting(first_name)
+        st.session_state["greeted"] = True
+
+    gen_args = (
+        contents,
+        st.session_state["temperature"],
+        st.session_state["top_p"],
+        st.session_state["max_tokens"],
+    )
+
+    # 7. Ruta: dato fijo, modelo sin búsqueda o modelo con búsqueda web
+    follow_up = is_history_dependent(user_msg, len(st.session_state["history"]) - 1)
+    route = route_question(user_msg, GEMINI_MODEL, follow_up, st.session_state["last_tier"])
+    st.session_state["last_tier"] = route.tier
+    inc("route_total", tier=route.tier)
+
+    # Caché de preguntas institucionales (sólo preguntas autocontenidas), por
+    # modelo y herramientas de la ruta: con y sin búsqueda web no se mezclan
+    key = None
+    if not follow_up:
+        key = cache_key(user_msg, route.model, *gen_args[1:], tools=route.tools)
+    # Preguntas frecuentes precalculadas (build_faq.py) antes que la caché viva
+    cached = get_faq_store().get(user_msg) if not follow_up else None
+    if cached is not None:
+        inc("faq_total")
+    elif key:
+        cached = get_answer_cache().get(key)
+        inc("answer_cache_total", result="miss" if cached is None else "hit")
+
+    # Pasajes del índice local de umich.mx; si bastan, se omite la búsqueda web
+    if cached is None:
+        ground(route, contents, user_msg)
+
+    meta = {
+        "turn_id": st.session_state["turn_id"],
+        "saludo": saludo,
+        "first_name": first_name,
+        "cache_key": key,
+        "from_model": cached is None,
+    }
+    # 8. Single-flight: si alguien ya hace la misma pregunta, esperar su respuesta
+    flights = get_single_flight()
+    static = route.tier == STATIC
+    shared = flights.join(key, first_name) if key and cached is None and not static else None
+
+    # Gemini caído (circuito abierto): responder ya, sin fila ni cuota
+    upstream_ok = static or cached is not None or shared is not None or gemini_available(route.model)
+    degraded = ""
+    if cached is None and shared is None and not static:
+        degraded = degraded_answer(user_msg, first_name, follow_up, gen_args[1:], route)
+
+    # 9. Límite por usuario (sólo lo que llega a Gemini gasta cuota)
+    allowed, retry_after = (True, 0.0)
+    if cached is None and shared is None and not static and upstream_ok:
+        allowed, retry_after = get_rate_limiter().take(st.session_state["profile"].get("email") or "")
+
+    def submit():
+        # Semáforo global: el trabajo espera su turno en la fila compartida
+        return submit_admitted(
+            gemini_job,
+            *gen_args,
+            stream=st.session_state["stream_on"],
+            model=route.model,
+            api_key=GEMINI_API_KEY,
+            system_instruction=SYSTEM_INSTRUCTION,
+            tools=route.tools,
+            degraded=degraded,
+        )
+
+    if cached is not None:
+        job = Job()
+        job.emit(personalize(cached, first_name))
+        job.finish()
+    elif static:
+        job = Job()
+        job.emit(route.answer)
+        job.finish()
+        meta["from_model"] = False
+    elif shared is not None:
+        inc("flight_joined_total")
+        job = shared
+        meta["from_model"] = False  # quien lanzó la llamada la guarda en caché
+    elif not upstream_ok:
+        inc("degraded_total")
+        job = Job()
+        job.emit(degraded)
+        job.finish()
+        meta["from_model"] = False
+        meta["degraded"] = True
+    elif not allowed:
+        inc("rate_limited_total", reason="user")
+        job = Job()
+        job.emit(slow_down_reply(retry_after))
+        job.finish()
+        meta["from_model"] = False
+    else:
+        try:
+            job = flights.lead(key, first_name, submit) if key else submit()
+        except PoolBusy:
+            inc("pool_busy_total")
+            job = Job()
+            job.emit(BUSY_REPLY)
+            job.finish()
+            meta["from_model"] = False
+    job.meta.update(meta)
+    return job
+
+
+def render_job(job) -> str:
+    """
+    Pinta el texto del Job conforme llega. Cada espera corta vuelve a pintar
+    (cursor parpadeante) para que Streamlit pueda interrumpir con un rerun.
+    """
+    placeholder = st.empty()
+    text, done, blink = "", False, False
+    while not done:
+        text, done = job.snapshot(len(text))
+        blink = not blink
+        position = job.meta.get("queue_position")
+        if not text and position:
+            placeholder.caption(f"⏳ En fila para NICO: lugar {position}")
+            continue
+        placeholder.markdown(text + ("" if done else (" ▌" if blink else " ")))
+    return text
@@ -0,0 +1,28 @@
+# ---------------------------------------
+# config_utils.py
+# Lectura de configuración: st.secrets primero, luego variables de entorno
+# ---------------------------------------
+
+import os
+
+import streamlit as st
+from dotenv import load_dotenv
+
+# .env se carga al importar, antes de que cualquier módulo lea su configuración
+load_dotenv()
+
+
+def get_setting(name: str, default):
+    """
+    Lee un valor de st.secrets o, si no está, del entorno (.env incluido)
+    y lo convierte al tipo de `default`.
+    """
+    try:
+        value = st.secrets.get(name, os.getenv(name))
+    except FileNotFoundError:
+        value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    if isinstance(default, bool) and isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on", "si", "sí")
+    return type(default)(value) if default is not None else value
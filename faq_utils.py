@@ -0,0 +1,224 @@
+# ---------------------------------------
+# faq_utils.py
+# Respuestas precalculadas para las preguntas institucionales más
+# frecuentes (fechas, oficinas, contactos, datos de la persona).
+# build_faq.py las genera por lotes con el mismo prompt, ruta e índice
+# que un turno normal; la app las lee al arrancar y las sirve al instante.
+# ---------------------------------------
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from cache_utils import NAME_PLACEHOLDER, normalize_question, swap_name
+from config_utils import get_setting
+from gemini_utils import (
+    DEFAULT_GEN_ARGS,
+    GEMINI_API_KEY,
+    GEMINI_MODEL,
+    gemini_generate,
+    is_error_reply,
+)
+from memory_utils import new_message
+from prompt_utils import SYSTEM_INSTRUCTION, build_contents
+from router_utils import STATIC, ground, route_question
+from speech_utils import TTS_SEED_DIR, audio_key, get_tts_engine, split_sentences
+
+FAQ_ENABLED = get_setting("FAQ_ENABLED", True)
+FAQ_QUESTIONS = get_setting("FAQ_QUESTIONS", "faq/preguntas.txt")
+FAQ_STORE = get_setting("FAQ_STORE", "faq/answers.json")
+# Respuestas no revisadas por build_faq.py en este tiempo no se sirven
+# (fechas y convocatorias cambian)
+FAQ_MAX_AGE_DAYS = get_setting("FAQ_MAX_AGE_DAYS", 7.0)
+# Las respuestas del modelo sin pasajes locales que comparar se regeneran
+# pasado este tiempo (antes de FAQ_MAX_AGE_DAYS, para no dejar huecos)
+FAQ_REFRESH_DAYS = get_setting("FAQ_REFRESH_DAYS", 6.0)
+FAQ_WORKERS = get_setting("FAQ_WORKERS", 4)
+
+# Nombre con el que se arma el prompt; en la respuesta se cambia por NAME_PLACEHOLDER
+FAQ_NAME = "Estudiante"
+
+
+def _digest(value) -> str:
+    raw = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def read_questions(path: str = FAQ_QUESTIONS) -> list:
+    """
+    Una pregunta por línea; variantes separadas por "|" (la primera es la principal).
+    Líneas vacías y comentarios (#) se ignoran.
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            variants = [v.strip() for v in line.split("|") if v.strip()]
+            questions.append(variants)
+    return questions
+
+
+# ============================================================
+# Construcción por lotes
+# ============================================================
+
+def plan_question(question: str, model: str = GEMINI_MODEL):
+    """
+    Lo mismo que prepara start_turn para una pregunta autocontenida:
+    (ruta, contents, hash de fuentes, hash del prompt, verificable).
+    `verificable`: el hash de fuentes cubre el contenido (dato fijo o pasajes
+    del índice); si no, la respuesta viene de la búsqueda web y el hash no
+    cambia aunque la información sí.
+    """
+    contents = build_contents([new_message("user", question)], FAQ_NAME, max_messages=1)
+    route = route_question(question, model)
+    passages = ground(route, contents, question)
+    source_hash = _digest([[p["url"], p["text"]] for p in passages] or route.answer)
+    prompt_hash = _digest([SYSTEM_INSTRUCTION, contents, route.model, route.tools, DEFAULT_GEN_ARGS])
+    return route, contents, source_hash, prompt_hash, route.tier == STATIC or bool(passages)
+
+
+def _load_store(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["answers"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def _write_audio(answer: str, audio_dir: str = TTS_SEED_DIR) -> list:
+    """
+    Sintetiza cada frase con el motor de voz del servidor en `audio_dir`,
+    que AudioCache consulta (sólo lectura) antes de sintetizar. Devuelve las llaves.
+    """
+    engine = get_tts_engine()
+    backend = engine.backend
+    os.makedirs(audio_dir, exist_ok=True)
+    keys = []
+    for chunk in split_sentences(answer):
+        key = audio_key(chunk, backend.voice, backend.encoding)
+        path = os.path.join(audio_dir, f"{key}.audio")
+        if not os.path.exists(path):
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(backend.synthesize(chunk))
+            os.replace(tmp, path)
+        keys.append(key)
+    return keys
+
+
+def build_faq(questions_path: str = FAQ_QUESTIONS, store_path: str = FAQ_STORE, *,
+              workers: int = FAQ_WORKERS, audio: bool = False, force: bool = False,
+              api_key: str = GEMINI_API_KEY, model: str = GEMINI_MODEL) -> dict:
+    """
+    Responde las preguntas del archivo y escribe el almacén que lee la app.
+    Sólo se vuelven a generar las preguntas cuyo hash de fuentes (pasajes
+    del índice, dato fijo) o de prompt (instrucción, modelo, herramientas)
+    cambió, y las que dependen de la búsqueda web pasados FAQ_REFRESH_DAYS.
+    checked_at sólo avanza si el contenido se generó o se verificó contra
+    sus fuentes. Como mucho `workers` llamadas a Gemini a la vez.
+    Devuelve estadísticas de la construcción.
+    """
+    previous = _load_store(store_path)
+    stats = {"questions": 0, "reused": 0, "generated": 0, "static": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def count(name):
+        with lock:
+            stats[name] += 1
+
+    def answer(variants):
+        question = variants[0]
+        route, contents, source_hash, prompt_hash, verifiable = plan_question(question, model)
+        old = previous.get(normalize_question(question))
+        now = time.time()
+        entry = {
+            "question": question,
+            "variants": variants[1:],
+            "tier": route.tier,
+            "source_hash": source_hash,
+            "prompt_hash": prompt_hash,
+        }
+        if (
+            not force and old
+            and old.get("source_hash") == source_hash and old.get("prompt_hash") == prompt_hash
+            and (not audio or old.get("audio"))
+            and (verifiable or old.get("generated_at", 0) >= now - FAQ_REFRESH_DAYS * 86400)
+        ):
+            count("reused")
+            checked_at = now if verifiable else old.get("checked_at", old.get("generated_at", 0))
+            return {**old, "variants": variants[1:], "checked_at": checked_at}
+
+        if route.tier == STATIC:
+            text = route.answer
+            count("static")
+        else:
+            text = gemini_generate(
+                contents, *DEFAULT_GEN_ARGS,
+                model=route.model, api_key=api_key,
+                system_instruction=SYSTEM_INSTRUCTION, tools=route.tools,
+            )
+            if is_error_reply(text):
+                count("failed")
+                return old  # se conserva la respuesta anterior, si había
+            count("generated")
+
+        # FAQ_NAME es ficticio: otras apariciones de "Estudiante" se quedan como están
+        entry["answer"] = swap_name(text, FAQ_NAME, NAME_PLACEHOLDER)
+        entry["generated_at"] = entry["checked_at"] = time.time()
+        # Sin audio si la respuesta lleva el nombre (cambia por usuario)
+        if audio and NAME_PLACEHOLDER not in entry["answer"]:
+            entry["audio"] = _write_audio(entry["answer"])
+        return entry
+
+    questions = read_questions(questions_path)
+    stats["questions"] = len(questions)
+    with ThreadPoolExecutor(max(1, workers), thread_name_prefix="nico-faq") as pool:
+        entries = list(pool.map(answer, questions))
+
+    answers = {
+        normalize_question(entry["question"]): entry for entry in entries if entry
+    }
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    tmp = f"{store_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"model": model, "answers": answers}, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, store_path)
+    return stats
+
+
+# ============================================================
+# Consulta (app)
+# ============================================================
+
+class FAQStore:
+    """Respuestas precalculadas indexadas por pregunta normalizada (y sus variantes)."""
+
+    def __init__(self, path: str = FAQ_STORE, max_age_days: float = FAQ_MAX_AGE_DAYS):
+        self._answers = {}
+        oldest = time.time() - max_age_days * 86400
+        for entry in _load_store(path).values():
+            if entry.get("checked_at", 0) < oldest:
+                continue
+            for question in [entry["question"], *entry.get("variants", [])]:
+                self._answers[normalize_question(question)] = entry["answer"]
+
+    def __len__(self):
+        return len(self._answers)
+
+    def get(self, question: str):
+        """Respuesta con NAME_PLACEHOLDER (ver cache_utils.personalize), o None."""
+        return self._answers.get(normalize_question(question))
+
+
+@st.cache_resource(show_spinner=False)
+def get_faq_store() -> FAQStore:
+    """Se lee una vez al arrancar el proceso; sin archivo, queda vacío."""
+    return FAQStore() if FAQ_ENABLED else FAQStore(path="")
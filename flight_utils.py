@@ -0,0 +1,147 @@
+# ---------------------------------------
+# flight_utils.py
+# Single-flight: preguntas idénticas que llegan mientras la primera aún
+# se está generando se cuelgan de la misma llamada a Gemini.
+# Cubre la ventana en la que la caché de respuestas todavía está vacía.
+# ---------------------------------------
+
+import threading
+import uuid
+from collections import ChainMap
+
+import streamlit as st
+
+from cache_utils import swap_name
+
+
+class SharedJob:
+    """
+    Vista de un Job compartido para un usuario: mismo texto, con su propio
+    nombre. Cancelar la vista sólo cancela la llamada si nadie más la usa.
+    """
+
+    def __init__(self, flight, first_name: str):
+        self.id = uuid.uuid4().hex
+        self.flight = flight
+        self.first_name = first_name
+        # Lo que escribe el trabajo (lugar en la fila, throttled) se ve aquí también
+        self.meta = ChainMap({}, flight.job.meta)
+        self._cancelled = False
+        self._raw_seen = 0
+        self._view_seen = 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled or self.flight.job.cancelled
+
+    @property
+    def done(self) -> bool:
+        return self.flight.job.done
+
+    def _view(self, raw: str, done: bool) -> str:
+        if not done:
+            # No mostrar una palabra a medias (podría ser el nombre de otro)
+            cut = max(raw.rfind(" "), raw.rfind("\n"))
+            raw = raw[: cut + 1] if cut >= 0 else ""
+        # Sólo el nombre en vocativo: "San Nicolás" no cambia aunque el líder se llame Nicolás
+        return swap_name(raw, self.flight.first_name, self.first_name)
+
+    @property
+    def text(self) -> str:
+        return self._view(self.flight.job.text, True)
+
+    def snapshot(self, seen: int = 0, timeout: float = 0.25):
+        # `seen` cuenta caracteres de la vista; la espera va sobre el texto crudo.
+        # Si quien llama ya tiene toda la vista (aunque esté vacía porque falta
+        # cortar la palabra), esperar texto crudo nuevo en vez de regresar al instante.
+        raw_seen = self._raw_seen if seen >= self._view_seen else 0
+        raw, done = self.flight.job.snapshot(raw_seen, timeout)
+        view = self._view(raw, done)
+        self._raw_seen, self._view_seen = len(raw), len(view)
+        return view, done
+
+    def cancel(self):
+        if not self._cancelled:
+            self._cancelled = True
+            self.flight.release()
+
+    def result(self, timeout=None):
+        self.flight.job.result(timeout)
+        return self.text
+
+
+class Flight:
+    """Una llamada en curso y cuántas vistas la esperan."""
+
+    def __init__(self, job, first_name: str):
+        self.job = job
+        self.first_name = first_name
+        self.waiters = 0
+        self.closed = False  # nadie la espera: ya se canceló o está por cancelarse
+        self._lock = threading.Lock()
+
+    def attach(self, first_name: str):
+        """Nueva vista, o None si la llamada ya terminó o se canceló."""
+        with self._lock:
+            if self.closed or self.job.done or self.job.cancelled:
+                return None
+            self.waiters += 1
+        return SharedJob(self, first_name)
+
+    def release(self):
+        with self._lock:
+            self.waiters -= 1
+            idle = self.closed = self.waiters <= 0
+        if idle:
+            self.job.cancel()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # cache_key -> Flight
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key: str, first_name: str):
+        """Vista de la llamada en curso para `key`, o None si no hay ninguna."""
+        # Búsqueda y attach bajo el mismo candado: la llamada no puede cancelarse
+        # entre las dos y dejar al seguidor esperando un trabajo muerto
+        with self._lock:
+            flight = self._flights.get(key)
+            view = flight.attach(first_name) if flight is not None else None
+            if view is not None:
+                self.followers += 1
+        return view
+
+    def lead(self, key: str, first_name: str, start) -> SharedJob:
+        """
+        Lanza la llamada con start() (devuelve un Job de worker_utils) y la
+        registra para que otros se unan mientras dure.
+        """
+        job = start()
+        flight = Flight(job, first_name)
+        view = flight.attach(first_name)
+        with self._lock:
+            self._flights[key] = flight
+            self.leaders += 1
+        job.future.add_done_callback(lambda _: self._forget(key, flight))
+        return view
+
+    def _forget(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "in_flight": len(self._flights),
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_single_flight() -> SingleFlight:
+    return SingleFlight()
@@ -0,0 +1,236 @@
+# ---------------------------------------
+# footprint_utils.py
+# Memoria de las sesiones del proceso: tamaño aproximado del estado de
+# cada sesión (totales y las más grandes, en /metrics y en Config),
+# compactación de las sesiones inactivas y tope de sesiones por réplica.
+# Un hilo revisa las sesiones cada SESSION_SWEEP_SECONDS; al compactar
+# se descarta lo que el almacén de historial puede devolver después.
+# ---------------------------------------
+
+import sys
+import threading
+import time
+import types
+import weakref
+from collections import deque
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from config_utils import get_setting
+from metrics_utils import clear_gauge, gauge, inc
+from store_utils import NullHistoryStore, get_history_store
+
+# Minutos sin actividad antes de compactar una sesión (0 = nunca)
+SESSION_IDLE_MINUTES = get_setting("SESSION_IDLE_MINUTES", 10.0)
+SESSION_SWEEP_SECONDS = get_setting("SESSION_SWEEP_SECONDS", 30.0)
+# Sesiones simultáneas por proceso (0 = sin tope); las nuevas ven un aviso
+SESSION_MAX = get_setting("SESSION_MAX", 0)
+# Cuántas de las sesiones más grandes se reportan
+SESSION_TOP = get_setting("SESSION_TOP", 5)
+
+FULL_REPLY = "NICO está atendiendo a muchos estudiantes en este momento 🦊. Intenta de nuevo en unos minutos."
+
+# Recursos del proceso que una sesión sólo referencia: no cuentan como suyos
+_SHARED_TYPES = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+    types.MethodType, threading.Thread,
+)
+
+
+def state_size(obj) -> int:
+    """Bytes aproximados de un objeto y todo lo que referencia (sin módulos, clases ni funciones)."""
+    seen, stack, size = set(), [obj], 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, _SHARED_TYPES):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+    return size
+
+
+def _measure(state) -> int:
+    try:
+        return state_size(state.filtered_state)
+    except RuntimeError:
+        return -1  # el script la modificaba mientras se medía: se mide en la siguiente vuelta
+
+
+def _get(state, key: str, default=None):
+    try:
+        return state[key]
+    except KeyError:
+        return default
+
+
+# ============================================================
+# Compactación
+# ============================================================
+
+def compact_session(state, store):
+    """
+    Reduce el estado de una sesión inactiva; devuelve los bytes liberados o
+    None si no se tocó (turno en curso). Se descartan:
+      - las páginas anteriores cargadas con "Cargar anteriores" (vienen del almacén)
+      - del historial, los mensajes que ya están en el resumen de la memoria y
+        fuera de la ventana del prompt, si el almacén los guarda (se pagina por id)
+    """
+    if _get(state, "trigger_run") or _get(state, "pending_job") is not None:
+        return None
+    before = _measure(state)
+
+    # Se recortan las listas en su lugar: escribir session_state desde otro hilo
+    # que no es el del script no está soportado por Streamlit
+    older = _get(state, "older_history")
+    if older:
+        older.clear()
+
+    history = _get(state, "history") or []
+    memory = _get(state, "memory")
+    if memory is not None and history and not isinstance(store, NullHistoryStore):
+        store.flush()  # lo que se descarte debe estar escrito
+        memory.collect()
+        recent_ids = {m["id"] for m in memory.select(history)}
+        kept = [
+            m for m in history[:-2]
+            if m["id"] in recent_ids or m["id"] not in memory.folded
+        ] + history[-2:]
+        if len(kept) < len(history):
+            memory.folded.intersection_update(m["id"] for m in kept)
+            history[:] = kept
+
+    after = _measure(state)
+    return max(0, before - after) if before >= 0 and after >= 0 else 0
+
+
+# ============================================================
+# Registro de sesiones del proceso
+# ============================================================
+
+class SessionTracker:
+    """
+    Sesiones vivas del proceso (referencias débiles a su estado: una sesión
+    cerrada por Streamlit desaparece sola), su última actividad y su tamaño.
+    """
+
+    def __init__(self, store, idle_minutes: float = SESSION_IDLE_MINUTES, max_sessions: int = SESSION_MAX,
+                 top: int = SESSION_TOP):
+        self.store = store  # almacén de historial (para saber qué se puede descartar)
+        self.idle_seconds = idle_minutes * 60
+        self.max_sessions = max_sessions
+        self.top = top
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> {"ref", "seen", "bytes", "compacted"}
+
+    def _prune(self):
+        for session_id in [k for k, e in self._sessions.items() if e["ref"]() is None]:
+            del self._sessions[session_id]
+
+    def touch(self, session_id: str, state) -> bool:
+        """Registra actividad; False si la sesión es nueva y ya no hay lugar."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry["ref"]() is not state:
+                self._prune()
+                if entry is None and self.max_sessions and len(self._sessions) >= self.max_sessions:
+                    inc("session_rejected_total")
+                    return False
+                entry = self._sessions[session_id] = {
+                    "ref": weakref.ref(state), "bytes": 0, "compacted": False,
+                }
+            entry["seen"] = now
+            entry["compacted"] = False
+        return True
+
+    def sweep(self):
+        """Mide todas las sesiones y compacta las inactivas."""
+        with self._lock:
+            self._prune()
+            entries = list(self._sessions.values())
+        now = time.monotonic()
+        for entry in entries:
+            state = entry["ref"]()
+            if state is None:
+                continue
+            if self.idle_seconds and not entry["compacted"] and now - entry["seen"] >= self.idle_seconds:
+                freed = compact_session(state, self.store)
+                if freed is not None:
+                    with self._lock:
+                        # Si volvió mientras tanto, se compactará en su siguiente inactividad
+                        entry["compacted"] = now - entry["seen"] >= self.idle_seconds
+                    inc("session_compacted_total")
+                    inc("session_freed_bytes_total", freed)
+            size = _measure(state)
+            if size >= 0:
+                entry["bytes"] = size
+        self._publish()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = [(sid, dict(e)) for sid, e in self._sessions.items() if e["ref"]() is not None]
+        now = time.monotonic()
+        sizes = [e["bytes"] for _, e in entries]
+        largest = sorted(entries, key=lambda item: item[1]["bytes"], reverse=True)[:self.top]
+        return {
+            "sessions": len(entries),
+            "idle": sum(1 for _, e in entries if self.idle_seconds and now - e["seen"] >= self.idle_seconds),
+            "compacted": sum(1 for _, e in entries if e["compacted"]),
+            "bytes": sum(sizes),
+            "max_bytes": max(sizes, default=0),
+            # Id corto de la sesión (no el email): sirve para cruzar con los logs
+            "largest": [
+                {"session": sid[:8], "bytes": e["bytes"], "idle_s": round(now - e["seen"])}
+                for sid, e in largest
+            ],
+        }
+
+    def _publish(self):
+        stats = self.stats()
+        gauge("sessions_active", stats["sessions"])
+        gauge("sessions_idle", stats["idle"])
+        gauge("sessions_compacted", stats["compacted"])
+        gauge("session_state_bytes_total", stats["bytes"])
+        gauge("session_state_bytes_max", stats["max_bytes"])
+        clear_gauge("session_state_bytes_top")
+        for item in stats["largest"]:
+            gauge("session_state_bytes_top", item["bytes"], session=item["session"])
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_tracker() -> SessionTracker:
+    """Una vez por proceso; el hilo de revisión sólo si SESSION_SWEEP_SECONDS > 0."""
+    tracker = SessionTracker(get_history_store())
+
+    def run():
+        while True:
+            time.sleep(SESSION_SWEEP_SECONDS)
+            try:
+                tracker.sweep()
+            except Exception:
+                pass  # una sesión rara no detiene la revisión de las demás
+
+    if SESSION_SWEEP_SECONDS > 0:
+        threading.Thread(target=run, name="nico-session-sweeper", daemon=True).start()
+    return tracker
+
+
+def track_session() -> bool:
+    """
+    Llamar en cada ejecución completa del script: registra la actividad de la
+    sesión. False si es nueva y el proceso ya tiene SESSION_MAX sesiones.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return True
+    # El SessionState de la sesión (el envoltorio seguro cambia en cada ejecución)
+    state = getattr(ctx.session_state, "_state", ctx.session_state)
+    return get_session_tracker().touch(ctx.session_id, state)
@@ -0,0 +1,404 @@
+# ---------------------------------------
+# gemini_utils.py
+# Llamadas a Gemini 2.0 (generateContent y streamGenerateContent)
+# con systemInstruction y caché de contexto para la persona fija.
+# Plazo, cobertura y cortacircuitos en resilience_utils.
+# ---------------------------------------
+
+import hashlib
+import json
+import random
+import threading
+import time
+
+import requests
+import streamlit as st
+
+from config_utils import get_setting
+from http_utils import HTTP_BACKOFF, HTTP_BACKOFF_JITTER, HTTP_BACKOFF_MAX, get_http_session
+from metrics_utils import count_usage, inc, observe
+from resilience_utils import GEMINI_DEADLINE, CircuitOpen, get_upstream, guarded_call
+
+GEMINI_API_ROOT = get_setting("GEMINI_API_ROOT", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_API_KEY = get_setting("GEMINI_API_KEY", "")
+GEMINI_MODEL = get_setting("GEMINI_MODEL", "gemini-2.0-flash-lite-preview-02-05")
+# temperatura, top_p, máx. tokens de una sesión nueva
+DEFAULT_GEN_ARGS = (0.7, 0.9, 256)
+ERROR_PREFIX = "⚠️ Error con Gemini"
+EMPTY_REPLY = "No obtuve respuesta del modelo."
+UNAVAILABLE = "el servicio no responde, intenta en un momento"
+# Se agrega al historial (no al texto del stream) si la conexión se cortó a media respuesta
+INTERRUPTED_NOTE = "⚠️ La respuesta se interrumpió. Intenta de nuevo."
+DEFAULT_TOOLS = [{"google_search": {}}]
+
+GEMINI_CONTEXT_CACHE = get_setting("GEMINI_CONTEXT_CACHE", True)
+GEMINI_CONTEXT_CACHE_TTL = get_setting("GEMINI_CONTEXT_CACHE_TTL", 3600)
+# Modelo de respaldo ante timeout / 5xx del principal ("" = sin respaldo).
+# Con respaldo, el principal tiene un timeout más corto para no agotar la espera.
+GEMINI_FALLBACK_MODEL = get_setting("GEMINI_FALLBACK_MODEL", "gemini-2.0-flash")
+GEMINI_TIMEOUT = get_setting("GEMINI_TIMEOUT", 40.0)
+GEMINI_PRIMARY_TIMEOUT = get_setting("GEMINI_PRIMARY_TIMEOUT", 15.0)
+# Reintentos por modelo ante 429/503 (cuota por minuto, sobrecarga), con
+# backoff y jitter y siempre dentro del plazo del turno
+GEMINI_RETRIES = get_setting("GEMINI_RETRIES", 1)
+RETRY_STATUS = (429, 503)
+# Si la API rechaza el caché (p. ej. instrucción por debajo del mínimo de tokens)
+# no se vuelve a intentar hasta pasado este tiempo.
+GEMINI_CONTEXT_CACHE_RETRY = 6 * 3600
+
+
+def _headers(api_key: str) -> dict:
+    return {
+        "Content-Type": "application/json",
+        "x-goog-api-key": api_key,
+    }
+
+
+def _as_contents(prompt) -> list:
+    # Compatibilidad: un texto suelto se envía como un único turno "user"
+    if isinstance(prompt, str):
+        return [{"role": "user", "parts": [{"text": prompt}]}]
+    return prompt
+
+
+def _candidate_text(data: dict) -> str:
+    text = ""
+    for cand in data.get("candidates", []):
+        for part in cand.get("content", {}).get("parts", []):
+            text += part.get("text", "")
+    return text
+
+
+class ContextCache:
+    """
+    Registra un cachedContent de Gemini por (modelo, instrucción, herramientas).
+    Así la persona de NICO se tokeniza una vez por hora y no en cada turno.
+    Si la API no lo permite, se recuerda el fallo y se envía la instrucción en línea.
+    """
+
+    def __init__(self, ttl: int = GEMINI_CONTEXT_CACHE_TTL):
+        self.ttl = int(ttl)
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (name | None, renovar_desde, expira)
+        self._creating = set()  # llaves con un _create en curso
+
+    @staticmethod
+    def _key(model, system_instruction, tools) -> tuple:
+        raw = json.dumps([system_instruction, tools], sort_keys=True, ensure_ascii=False)
+        return model, hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def resolve(self, model: str, api_key: str, system_instruction: dict, tools: list):
+        """
+        Nombre del caché para la llave, o None (instrucción en línea). Un solo
+        hilo por llave lo crea, fuera del candado; mientras tanto los demás no
+        esperan: usan el caché anterior si sigue vivo o la instrucción en línea.
+        """
+        key = self._key(model, system_instruction, tools)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+            if key in self._creating:
+                return entry[0] if entry and entry[2] > now else None
+            self._creating.add(key)
+        name = None
+        try:
+            name = self._create(model, api_key, system_instruction, tools)
+        finally:
+            with self._lock:
+                self._creating.discard(key)
+                now = time.time()
+                if name:
+                    # margen para no usar un caché a punto de expirar
+                    self._entries[key] = (name, now + self.ttl - 60, now + self.ttl - 5)
+                else:
+                    retry = now + GEMINI_CONTEXT_CACHE_RETRY
+                    self._entries[key] = (None, retry, retry)
+        return name
+
+    def invalidate(self, name: str):
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry[0] == name:
+                    del self._entries[key]
+
+    def _create(self, model, api_key, system_instruction, tools):
+        body = {
+            "model": f"models/{model}",
+            "systemInstruction": system_instruction,
+            "ttl": f"{self.ttl}s",
+        }
+        if tools:
+            body["tools"] = tools
+        try:
+            r = get_http_session().post(
+                f"{GEMINI_API_ROOT}/cachedContents",
+                headers=_headers(api_key),
+                json=body,
+                timeout=10,
+            )
+            r.raise_for_status()
+            return r.json().get("name")
+        except Exception:
+            return None
+
+
+@st.cache_resource(show_spinner=False)
+def get_context_cache() -> ContextCache:
+    return ContextCache()
+
+
+def _build_payload(prompt, temperature, top_p, max_tokens, system_instruction, tools, cached_name) -> dict:
+    payload = {
+        "contents": _as_contents(prompt),
+        "generationConfig": {
+            "temperature": float(temperature),
+            "topP": float(top_p),
+            "maxOutputTokens": int(max_tokens),
+        },
+    }
+    if cached_name:
+        # La instrucción y las herramientas ya viven en el cachedContent
+        payload["cachedContent"] = cached_name
+    else:
+        if system_instruction:
+            payload["systemInstruction"] = system_instruction
+        if tools:
+            payload["tools"] = tools
+    return payload
+
+
+def _post(endpoint, model, api_key, prompt, gen_args, system_instruction, tools, **kwargs):
+    """POST a Gemini; si el cachedContent caducó, repite con la instrucción en línea."""
+    cached_name = None
+    if system_instruction and GEMINI_CONTEXT_CACHE:
+        cached_name = get_context_cache().resolve(model, api_key, system_instruction, tools)
+
+    payload = _build_payload(prompt, *gen_args, system_instruction, tools, cached_name)
+    r = get_http_session().post(endpoint, headers=_headers(api_key), json=payload, **kwargs)
+    if cached_name and r.status_code in (400, 403, 404):
+        r.close()
+        get_context_cache().invalidate(cached_name)
+        payload = _build_payload(prompt, *gen_args, system_instruction, tools, None)
+        r = get_http_session().post(endpoint, headers=_headers(api_key), json=payload, **kwargs)
+    return r
+
+
+def _retry_delay(retry: int) -> float:
+    return min(HTTP_BACKOFF_MAX, HTTP_BACKOFF * 2 ** retry) + random.uniform(0, HTTP_BACKOFF_JITTER)
+
+
+def _guarded_with_retry(model, attempt, deadline):
+    """
+    guarded_call con hasta GEMINI_RETRIES reintentos si la respuesta es 429/503.
+    No se reintenta si después de la espera ya no queda plazo para otro intento.
+    """
+    for retry in range(GEMINI_RETRIES + 1):
+        r = guarded_call(model, attempt, deadline)
+        if r.status_code not in RETRY_STATUS or retry == GEMINI_RETRIES:
+            return r
+        delay = _retry_delay(retry)
+        if deadline - time.monotonic() < 2 * delay:
+            return r
+        inc("gemini_retry_total", model=model, status=r.status_code)
+        r.close()
+        time.sleep(delay)
+    return r
+
+
+def _models(model, fallback_model) -> list:
+    if fallback_model and fallback_model != model:
+        return [model, fallback_model]
+    return [model]
+
+
+def gemini_available(model: str, fallback_model: str = GEMINI_FALLBACK_MODEL) -> bool:
+    """False si los circuitos del modelo y de su respaldo están abiertos (falla rápida)."""
+    upstream = get_upstream()
+    return any(upstream.breaker(name).available() for name in _models(model, fallback_model))
+
+
+def _open(method, model, fallback_model, api_key, prompt, gen_args, system_instruction, tools,
+          deadline=None, **kwargs):
+    """
+    POST al modelo principal (con un reintento breve ante 429/503); si se
+    agota el tiempo, falla la conexión, responde 429/5xx o su circuito está
+    abierto, se repite con el modelo de respaldo.
+    Todo dentro del plazo del turno (`deadline`, time.monotonic()).
+    """
+    models = _models(model, fallback_model)
+    if deadline is None:
+        deadline = time.monotonic() + GEMINI_DEADLINE
+
+    for i, name in enumerate(models):
+        last = i == len(models) - 1
+        endpoint = f"{GEMINI_API_ROOT}/models/{name}:{method}"
+        limit = GEMINI_TIMEOUT if last else GEMINI_PRIMARY_TIMEOUT
+        # Con respaldo, el principal no puede gastarse todo el plazo
+        model_deadline = min(deadline, time.monotonic() + limit)
+
+        def attempt(timeout, endpoint=endpoint, name=name):
+            return _post(
+                endpoint, name, api_key, prompt, gen_args, system_instruction, tools,
+                timeout=timeout, **kwargs,
+            )
+
+        try:
+            r = _guarded_with_retry(name, attempt, model_deadline)
+        except (requests.Timeout, requests.ConnectionError, CircuitOpen) as e:
+            inc("gemini_responses_total", status=type(e).__name__, model=name)
+            if last:
+                raise
+            inc("gemini_fallback_total", model=name)
+            continue
+        inc("gemini_responses_total", status=r.status_code, model=name)
+        # Hasta los encabezados de la respuesta (primer byte)
+        observe("gemini_first_byte_seconds", r.elapsed.total_seconds(), method=method, model=name)
+        if (r.status_code >= 500 or r.status_code == 429) and not last:
+            inc("gemini_fallback_total", model=name)
+            r.close()
+            continue
+        return r
+
+
+def gemini_generate(
+    prompt,
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    *,
+    model: str,
+    api_key: str,
+    system_instruction: dict = None,
+    tools: list = DEFAULT_TOOLS,
+    fallback_model: str = GEMINI_FALLBACK_MODEL,
+    deadline: float = None,
+) -> str:
+    """
+    Respuesta completa (bloqueante).
+    `prompt` es la lista de contents con rol (ver prompt_utils) o un texto suelto.
+    `tools=[]` desactiva la búsqueda web (p. ej. para resúmenes).
+    `deadline` (time.monotonic()) acota la espera; por defecto GEMINI_DEADLINE.
+    """
+    started = time.monotonic()
+    try:
+        r = _open(
+            "generateContent", model, fallback_model, api_key, prompt,
+            (temperature, top_p, max_tokens), system_instruction, tools, deadline,
+        )
+        r.raise_for_status()
+        data = r.json()
+        count_usage(data.get("usageMetadata"), model)
+        text = _candidate_text(data)
+        return text.strip() or EMPTY_REPLY
+    except CircuitOpen:
+        return f"{ERROR_PREFIX}: {UNAVAILABLE}"
+    except Exception as e:
+        return f"{ERROR_PREFIX}: {e}"
+    finally:
+        observe("gemini_total_seconds", time.monotonic() - started, method="generateContent", model=model)
+
+
+def gemini_stream(
+    prompt,
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    *,
+    model: str,
+    api_key: str,
+    system_instruction: dict = None,
+    tools: list = DEFAULT_TOOLS,
+    fallback_model: str = GEMINI_FALLBACK_MODEL,
+    deadline: float = None,
+    status: dict = None,
+):
+    """
+    Generador de fragmentos de texto vía SSE (streamGenerateContent?alt=sse).
+    Pensado para st.write_stream: el primer token llega en cuanto el modelo lo emite.
+    Un error antes del primer fragmento se devuelve como texto, igual que
+    gemini_generate. Un error a media respuesta NO se mezcla con el texto:
+    se anota en `status["error"]` (la respuesta quedó incompleta).
+    El respaldo sólo aplica antes del primer fragmento.
+    """
+    status = {} if status is None else status
+    got_text = False
+    usage = None
+    started = time.monotonic()
+    try:
+        with _open(
+            "streamGenerateContent", model, fallback_model, api_key, prompt,
+            (temperature, top_p, max_tokens), system_instruction, tools, deadline,
+            params={"alt": "sse"}, stream=True,
+        ) as r:
+            r.raise_for_status()
+            r.encoding = "utf-8"
+            for line in r.iter_lines(decode_unicode=True):
+                # Cada evento SSE llega como "data: {json}"
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:].strip())
+                usage = event.get("usageMetadata", usage)  # el último trae los totales
+                chunk = _candidate_text(event)
+                if chunk:
+                    if not got_text:
+                        observe("gemini_first_chunk_seconds", time.monotonic() - started, model=model)
+                    got_text = True
+                    yield chunk
+    except CircuitOpen:
+        status["error"] = UNAVAILABLE
+        got_text = True
+        yield f"{ERROR_PREFIX}: {UNAVAILABLE}"
+    except Exception as e:
+        status["error"] = str(e) or type(e).__name__
+        if not got_text:
+            got_text = True
+            yield f"{ERROR_PREFIX}: {e}"
+    finally:
+        count_usage(usage, model)
+        observe("gemini_total_seconds", time.monotonic() - started,
+                method="streamGenerateContent", model=model)
+
+    if not got_text:
+        yield EMPTY_REPLY
+
+
+def gemini_job(job, prompt, temperature, top_p, max_tokens, *, stream: bool = True,
+               degraded: str = "", **kwargs) -> str:
+    """
+    Trabajo para worker_utils: emite el texto en `job` conforme llega
+    y corta la conexión si el usuario manda otro mensaje (job.cancel()).
+    Si Gemini falla antes de emitir texto y hay `degraded` (respuesta sin
+    modelo), se emite ésa y se marca job.meta["degraded"] (no se cachea).
+    Cualquier falla queda en job.meta["error"]: el texto no terminó limpio.
+    """
+    if not stream:
+        text = gemini_generate(prompt, temperature, top_p, max_tokens, **kwargs)
+        if is_error_reply(text):
+            job.meta["error"] = True
+            if degraded:
+                job.meta["degraded"] = True
+                text = degraded
+        if not job.cancelled:
+            job.emit(text)
+        return text
+
+    chunks = gemini_stream(prompt, temperature, top_p, max_tokens, status=job.meta, **kwargs)
+    try:
+        for chunk in chunks:
+            if job.cancelled:
+                break
+            if degraded and not job.text and is_error_reply(chunk):
+                job.meta["degraded"] = True
+                chunk = degraded
+            job.emit(chunk)
+    finally:
+        chunks.close()
+    return job.text
+
+
+def is_error_reply(text: str) -> bool:
+    """True si el texto es un aviso de error o respuesta vacía (no cachear)."""
+    text = (text or "").strip()
+    return not text or text.startswith(ERROR_PREFIX) or text == EMPTY_REPLY
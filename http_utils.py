@@ -0,0 +1,103 @@
+# ---------------------------------------
+# http_utils.py
+# Cliente HTTP compartido por proceso (Gemini y OAuth)
+# Pool de conexiones keep-alive + reintentos con backoff acotado y jitter.
+# Un POST a Gemini sólo se reintenta si no llegó a enviarse (conexión);
+# los 429/503 de Gemini se reintentan una vez en gemini_utils, dentro del plazo.
+# ---------------------------------------
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from config_utils import get_setting
+from metrics_utils import METRICS_ENABLED, span
+
+HTTP_POOL_CONNECTIONS = get_setting("HTTP_POOL_CONNECTIONS", 10)
+HTTP_POOL_MAXSIZE = get_setting("HTTP_POOL_MAXSIZE", 50)
+HTTP_RETRIES = get_setting("HTTP_RETRIES", 3)
+HTTP_BACKOFF = get_setting("HTTP_BACKOFF", 0.5)
+HTTP_BACKOFF_JITTER = get_setting("HTTP_BACKOFF_JITTER", 0.5)
+# Espera máxima entre reintentos (urllib3 permite hasta 120 s)
+HTTP_BACKOFF_MAX = get_setting("HTTP_BACKOFF_MAX", 2.0)
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        with span("http_connect", host=self.host):
+            super().connect()
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # TCP + TLS: lo que se ahorra al reutilizar conexiones keep-alive
+        with span("http_connect", host=self.host):
+            super().connect()
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter que mide cada conexión nueva (sólo con METRICS_ENABLED)."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def _build_adapter() -> HTTPAdapter:
+    retry = Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,  # la petición no salió: seguro también para POST
+        read=0,  # no repetir si el servidor ya recibió la petición
+        status=HTTP_RETRIES,
+        status_forcelist=(429, 503),
+        # Sólo métodos idempotentes (GET de certificados); un POST con 429/503
+        # vuelve tal cual para que cuente en el cortacircuitos y en el plazo del turno
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        backoff_factor=HTTP_BACKOFF,
+        backoff_jitter=HTTP_BACKOFF_JITTER,
+        backoff_max=HTTP_BACKOFF_MAX,
+        respect_retry_after_header=False,  # Retry-After puede pedir minutos
+        raise_on_status=False,
+    )
+    adapter_cls = TimedHTTPAdapter if METRICS_ENABLED else HTTPAdapter
+    return adapter_cls(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_http_session() -> requests.Session:
+    """
+    Una sola requests.Session por proceso: las conexiones TCP/TLS a
+    generativelanguage.googleapis.com y oauth2.googleapis.com se reutilizan
+    entre turnos y entre sesiones.
+    """
+    session = requests.Session()
+    adapter = _build_adapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def share_pool(session: requests.Session) -> requests.Session:
+    """Monta el pool compartido en otra sesión (p. ej. la OAuth2Session de Flow)."""
+    shared = get_http_session()
+    for prefix in ("https://", "http://"):
+        session.mount(prefix, shared.get_adapter(prefix))
+    return session
@@ -0,0 +1,292 @@
+# ---------------------------------------
+# media_utils.py
+# Videos del avatar de NICO
+# build_media.py genera variantes pequeñas (220 px, sin audio, WebM y MP4
+# en dos calidades) con un manifiesto. La app elige la variante según el
+# navegador; sin manifiesto usa los originales. En ambos casos los bytes
+# se cargan UNA vez por proceso y se sirven por URL con st.video (/media/...,
+# con el tipo MIME correcto) en lugar de incrustarlos en base64.
+# ---------------------------------------
+
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+from dataclasses import dataclass
+
+import streamlit as st
+
+from config_utils import get_setting
+
+VIDEO_DIR = "assets/videos"
+HEADER_VIDEO = "assets/videos/nico_header_video.mp4"
+VIDEO_EXTS = (".mp4", ".webm")
+MIMETYPES = {".mp4": "video/mp4", ".webm": "video/webm"}
+
+# Variantes precomprimidas de build_media.py
+MEDIA_DIR = get_setting("MEDIA_DIR", "assets/avatar")
+# "auto": ligera en celulares, estándar en los demás
+MEDIA_QUALITY = get_setting("MEDIA_QUALITY", "auto")
+
+MEDIA_WIDTH = 220
+MEDIA_MAX_SECONDS = 12
+# calidad -> (kbps de video, cuadros por segundo). La ligera queda en decenas
+# de KB; con menos cuadros cada uno recibe más bits y no se ve tan cuadriculada.
+MEDIA_PROFILES = {"lite": (32, 12), "std": (220, 24)}
+# formato -> (extensión, mimetype, argumentos de ffmpeg)
+MEDIA_FORMATS = {
+    "webm": (".webm", "video/webm", ["-c:v", "libvpx-vp9", "-deadline", "good", "-row-mt", "1"]),
+    "mp4": (".mp4", "video/mp4", ["-c:v", "libx264", "-preset", "slow", "-profile:v", "main",
+                                  "-pix_fmt", "yuv420p", "-movflags", "+faststart"]),
+}
+
+
+@dataclass(frozen=True)
+class AvatarVideo:
+    name: str
+    data: bytes
+    mimetype: str
+
+
+@st.cache_resource(show_spinner=False)
+def load_avatar_videos(folder: str = VIDEO_DIR) -> dict:
+    """
+    Lee cada video una sola vez por proceso. Devuelve {nombre: AvatarVideo}.
+    Todas las sesiones comparten estos bytes; st.video ya arma la URL con el
+    hash del contenido, así que un video nuevo cambia de URL solo.
+    """
+    videos = {}
+    if not os.path.isdir(folder):
+        return videos
+    for name in sorted(os.listdir(folder)):
+        ext = os.path.splitext(name)[1].lower()
+        if ext not in VIDEO_EXTS:
+            continue
+        with open(os.path.join(folder, name), "rb") as f:
+            data = f.read()
+        videos[name] = AvatarVideo(
+            name=name,
+            data=data,
+            mimetype=MIMETYPES[ext],
+        )
+    return videos
+
+
+@st.cache_resource(show_spinner=False)
+def load_media_manifest(folder: str = MEDIA_DIR) -> dict:
+    """Clips del manifiesto de build_media.py ({nombre original: entrada}), o {} si no hay."""
+    try:
+        with open(os.path.join(folder, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)["clips"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def pick_avatar_video():
+    """Elige un video al azar; la sesión sólo guarda su nombre (referencia)."""
+    names = list(load_media_manifest() or load_avatar_videos())
+    return random.choice(names) if names else None
+
+
+def _user_agent() -> str:
+    try:
+        return st.context.headers.get("User-Agent", "")
+    except Exception:
+        return ""  # fuera de una sesión (pruebas, bench)
+
+
+def avatar_variant(name, user_agent: str = None):
+    """
+    Variante del manifiesto para el navegador, o None si el clip no está en él.
+    Ligera en celulares (MEDIA_QUALITY=auto) y, de los formatos que el navegador
+    reproduce, el archivo más pequeño. Safari e iOS (WebKit no siempre
+    reproduce VP9) y los clientes sin User-Agent reciben MP4.
+    """
+    clip = load_media_manifest().get(name) if name else None
+    if clip is None:
+        return None
+    agent = _user_agent() if user_agent is None else user_agent
+    quality = MEDIA_QUALITY
+    if quality not in MEDIA_PROFILES:
+        quality = "lite" if re.search(r"Mobi|Android", agent) else "std"
+    webkit = re.search(r"iPhone|iPad|iPod", agent) or (
+        "Safari" in agent and not re.search(r"Chrome|Chromium|Firefox|Edg", agent)
+    )
+    formats = ["mp4"] if webkit or not agent else list(MEDIA_FORMATS)
+    playable = [v for v in clip["variants"] if v["quality"] == quality and v["format"] in formats]
+    if not playable:
+        return None
+    return min(playable, key=lambda v: v.get("bytes", 0))
+
+
+@st.cache_resource(show_spinner=False)
+def load_media_file(file: str, folder: str = MEDIA_DIR) -> bytes:
+    """Bytes de una variante, leídos una vez por proceso."""
+    with open(os.path.join(folder, file), "rb") as f:
+        return f.read()
+
+
+def render_avatar_video(container, name) -> bool:
+    """
+    Muestra el video en el contenedor con st.video: la variante del manifiesto
+    (decenas de KB) o, sin manifiesto, el original. Streamlit guarda los bytes
+    una vez (por hash) y el navegador los pide por URL, así que el websocket
+    sólo transporta la referencia.
+    """
+    variant = avatar_variant(name)
+    if variant is not None:
+        try:
+            container.video(load_media_file(variant["file"]), format=variant["type"], loop=True, muted=True)
+            return True
+        except OSError:
+            pass  # variante faltante: se usa el original
+    video = load_avatar_videos().get(name) if name else None
+    if video is None:
+        return False
+    container.video(video.data, format=video.mimetype, loop=True, muted=True)
+    return True
+
+
+# ============================================================
+# Construcción de variantes (build_media.py)
+# ============================================================
+
+def _slug(name: str) -> str:
+    stem = os.path.splitext(name)[0].lower()
+    return re.sub(r"[^a-z0-9]+", "-", stem).strip("-") or "clip"
+
+
+def _ffmpeg(args: list):
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *args], check=True)
+
+
+def _profile_tag(quality: str, fmt: str) -> str:
+    # Cambiar los parámetros de codificación cambia el nombre: se vuelve a codificar
+    settings = (MEDIA_WIDTH, MEDIA_MAX_SECONDS, MEDIA_PROFILES[quality], MEDIA_FORMATS[fmt][2])
+    return hashlib.sha256(repr(settings).encode("utf-8")).hexdigest()[:6]
+
+
+def _encode(src: str, out: str, fmt: str, quality: str):
+    _, _, codec = MEDIA_FORMATS[fmt]
+    kbps, fps = MEDIA_PROFILES[quality]
+    _ffmpeg([
+        "-i", src, "-t", str(MEDIA_MAX_SECONDS), "-an",
+        "-vf", f"scale={MEDIA_WIDTH}:-2,fps={fps}",
+        *codec,
+        "-b:v", f"{kbps}k", "-maxrate", f"{kbps * 3 // 2}k", "-bufsize", f"{kbps * 2}k",
+        out,
+    ])
+
+
+def build_media(src_dir: str = VIDEO_DIR, out_dir: str = MEDIA_DIR) -> dict:
+    """
+    Genera las variantes de cada video de `src_dir` en `out_dir` y
+    escribe manifest.json. Los nombres de archivo llevan la huella del
+    original, así que sólo se vuelven a codificar los videos que cambiaron.
+    Devuelve estadísticas de la construcción.
+    """
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg no está instalado (se necesita sólo para construir las variantes)")
+    os.makedirs(out_dir, exist_ok=True)
+    stats = {"clips": 0, "encoded": 0, "reused": 0, "removed": 0, "bytes_in": 0, "bytes_out": 0}
+
+    clips, keep = {}, {"manifest.json"}
+    for name in sorted(os.listdir(src_dir)):
+        if os.path.splitext(name)[1].lower() not in VIDEO_EXTS or name == os.path.basename(HEADER_VIDEO):
+            continue
+        src = os.path.join(src_dir, name)
+        with open(src, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        base = f"{_slug(name)}-{digest}"
+        stats["clips"] += 1
+        stats["bytes_in"] += os.path.getsize(src)
+
+        entry = {"source": name, "sha256": digest, "width": MEDIA_WIDTH, "variants": []}
+        outputs = []
+        for quality in MEDIA_PROFILES:
+            for fmt, (ext, mimetype, _) in MEDIA_FORMATS.items():
+                file = f"{base}-{quality}-{_profile_tag(quality, fmt)}{ext}"
+                entry["variants"].append({"quality": quality, "format": fmt, "type": mimetype, "file": file})
+                outputs.append((file, lambda out, s=src, f=fmt, q=quality: _encode(s, out, f, q)))
+
+        encoded = False
+        for file, make in outputs:
+            path = os.path.join(out_dir, file)
+            keep.add(file)
+            if not os.path.exists(path):
+                # Archivo temporal + os.replace: nunca se sirve un video a medias
+                tmp = os.path.join(out_dir, f".tmp-{file}")
+                make(tmp)
+                os.replace(tmp, path)
+                encoded = True
+        for variant in entry["variants"]:
+            variant["bytes"] = os.path.getsize(os.path.join(out_dir, variant["file"]))
+            stats["bytes_out"] += variant["bytes"]
+        stats["encoded" if encoded else "reused"] += 1
+        clips[name] = entry
+
+    for file in os.listdir(out_dir):
+        if file not in keep:
+            os.remove(os.path.join(out_dir, file))
+            stats["removed"] += 1
+
+    tmp = os.path.join(out_dir, ".manifest.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"clips": clips}, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, os.path.join(out_dir, "manifest.json"))
+    return stats
+
+
+@st.cache_resource(show_spinner=False)
+def header_html():
+    """Cabecera visual y estilos; se arma (y se lee el video) una vez por proceso."""
+    video_path = HEADER_VIDEO
+    video_tag = '<div class="nico-placeholder">🦊</div>'
+    
+    if os.path.exists(video_path):
+        with open(video_path, "rb") as f:
+            b64 = base64.b64encode(f.read()).decode("utf-8")
+        video_tag = f"""
+        <video class="nico-video" autoplay loop muted playsinline>
+            <source src="data:video/mp4;base64,{b64}" type="video/mp4">
+        </video>
+        """
+
+    return f"""
+    <style>
+    .nico-header {{
+        background: linear-gradient(90deg, #0f2347 0%, #1a3b6e 100%);
+        color: #fff;
+        padding: 16px 24px;
+        border-radius: 12px;
+        margin-bottom: 20px;
+        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+    }}
+    .nico-wrap {{ display: flex; align-items: center; gap: 16px; }}
+    .nico-video, .nico-placeholder {{
+        width: 60px; height: 60px; border-radius: 50%;
+        background: #fff; object-fit: cover; border: 2px solid #ffd700;
+        display: flex; align-items: center; justify-content: center; font-size: 30px;
+    }}
+    .nico-title {{ font-size: 24px; font-weight: 800; margin: 0; }}
+    .nico-subtitle {{ margin: 0; font-size: 16px; opacity: 0.8; font-weight: 300; }}
+    [data-testid="stVideo"] {{ max-width: 220px; border-radius: 12px; }}
+    .chat-bubble {{
+        background: #f0f2f6; border-radius: 12px; padding: 16px; margin-top: 8px;
+        color: #31333F; border-left: 4px solid #0f2347;
+    }}
+    </style>
+    <div class="nico-header">
+        <div class="nico-wrap">
+            {video_tag}
+            <div>
+                <p class="nico-title">NICO</p>
+                <p class="nico-subtitle">Asistente Virtual UMSNH</p>
+            </div>
+        </div>
+    </div>
+    """
@@ -0,0 +1,131 @@
+# ---------------------------------------
+# memory_utils.py
+# Memoria de conversación con presupuesto de tokens:
+# turnos recientes textuales + resumen acumulado de los antiguos,
+# calculado en segundo plano.
+# ---------------------------------------
+
+import threading
+import uuid
+
+from config_utils import get_setting
+from gemini_utils import gemini_generate, is_error_reply
+from rate_utils import submit_admitted
+from worker_utils import PoolBusy
+
+MEMORY_TOKEN_BUDGET = get_setting("MEMORY_TOKEN_BUDGET", 1200)
+MEMORY_SUMMARY_TOKENS = get_setting("MEMORY_SUMMARY_TOKENS", 256)
+# Tope de mensajes que se guardan en session_state (la vista muestra 20)
+HISTORY_MAX_MESSAGES = get_setting("HISTORY_MAX_MESSAGES", 40)
+
+SUMMARY_INSTRUCTION = (
+    "Resume en español, en un solo párrafo de máximo 120 palabras, la conversación "
+    "entre un estudiante y NICO, el asistente de la UMSNH. Conserva nombres, fechas, "
+    "trámites y datos concretos que el estudiante pidió. No uses Markdown."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación barata: ~4 caracteres por token (suficiente para el presupuesto)."""
+    return len(text or "") // 4 + 1
+
+
+def new_message(role: str, content: str) -> dict:
+    """Mensaje del historial con id estable (sirve para resumen, voz y persistencia)."""
+    return {"id": uuid.uuid4().hex, "role": role, "content": content}
+
+
+class ConversationMemory:
+    """
+    Vive en st.session_state["memory"].
+    - select(): turnos recientes que caben en el presupuesto de tokens
+    - los turnos que quedan fuera se resumen en segundo plano (fold)
+    - trim(): recorta el historial de la sesión sin perder contexto
+    """
+
+    def __init__(self, token_budget: int = MEMORY_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.summary = ""
+        self.folded = set()  # ids ya incluidos en el resumen
+        self._pending = None  # (Job, ids)
+        self._lock = threading.Lock()
+
+    def select(self, history: list) -> list:
+        """Mensajes recientes (el actual siempre incluido) dentro del presupuesto."""
+        recent, used = [], estimate_tokens(self.summary)
+        for msg in reversed(history):
+            cost = estimate_tokens(msg["content"])
+            if recent and used + cost > self.token_budget:
+                break
+            recent.insert(0, msg)
+            used += cost
+        return recent
+
+    def collect(self):
+        """Aplica el resumen si el trabajo en segundo plano ya terminó."""
+        with self._lock:
+            if self._pending is None or not self._pending[0].done:
+                return
+            job, ids = self._pending
+            self._pending = None
+        try:
+            summary = job.result()
+        except Exception:
+            return
+        if summary and not job.meta.get("throttled"):
+            self.summary = summary
+            self.folded.update(ids)
+
+    def fold(self, history: list, recent: list, summarize):
+        """
+        Lanza el resumen de los mensajes anteriores a `recent` que aún no están
+        en el resumen. `summarize(previo, mensajes) -> str | None` corre en un hilo
+        tras pasar por la fila de Gemini (rate_utils), como los turnos.
+        """
+        recent_ids = {m["id"] for m in recent}
+        older = [m for m in history if m["id"] not in recent_ids and m["id"] not in self.folded]
+        with self._lock:
+            if not older or self._pending is not None:
+                return
+            try:
+                job = submit_admitted(
+                    lambda job, previous=self.summary: summarize(previous, older)
+                )
+            except PoolBusy:
+                return  # se intentará en el siguiente turno
+            self._pending = (job, [m["id"] for m in older])
+
+    def trim(self, history: list, max_messages: int = HISTORY_MAX_MESSAGES) -> list:
+        """Recorta el historial de la sesión; lo antiguo ya vive en el resumen."""
+        if len(history) <= max_messages:
+            return history
+        kept = history[-max_messages:]
+        self.folded.intersection_update(m["id"] for m in kept)
+        return kept
+
+
+def summary_prompt(previous: str, messages: list) -> str:
+    lines = []
+    if previous:
+        lines.append(f"Resumen previo: {previous}")
+    lines.append("Conversación:")
+    for msg in messages:
+        role = "Asistente" if msg["role"] == "assistant" else "Usuario"
+        lines.append(f"{role}: {msg['content']}")
+    return SUMMARY_INSTRUCTION + "\n\n" + "\n".join(lines)
+
+
+def gemini_summarizer(model: str, api_key: str):
+    """Función de resumen para fold(): Gemini sin búsqueda web y temperatura baja."""
+    def summarize(previous: str, messages: list):
+        text = gemini_generate(
+            summary_prompt(previous, messages),
+            0.2,
+            0.9,
+            MEMORY_SUMMARY_TOKENS,
+            model=model,
+            api_key=api_key,
+            tools=[],
+        )
+        return None if is_error_reply(text) else text
+    return summarize
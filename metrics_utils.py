@@ -0,0 +1,250 @@
+# ---------------------------------------
+# metrics_utils.py
+# Métricas del camino crítico: tramos (spans) con duración, contadores
+# (códigos de Gemini, tokens de usageMetadata, aciertos de caché),
+# medidores (sesiones y su memoria) y
+# exportación estilo Prometheus en un puerto aparte, más logs JSON
+# estilo OpenTelemetry opcionales.
+# Desactivado (por defecto), span() e inc() no hacen nada.
+# ---------------------------------------
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+from config_utils import get_setting
+
+METRICS_ENABLED = get_setting("METRICS_ENABLED", False)
+METRICS_PORT = get_setting("METRICS_PORT", 9464)
+METRICS_LOG = get_setting("METRICS_LOG", False)  # una línea JSON por tramo
+METRICS_PREFIX = "nico"
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_logger = logging.getLogger("nico.metrics")
+_current = contextvars.ContextVar("nico_span", default=None)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _label_text(key: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Registry:
+    """Contadores, medidores e histogramas en memoria del proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # nombre -> {labels: valor}
+        self._gauges = {}      # nombre -> {labels: valor}
+        self._histograms = {}  # nombre -> {labels: [cubetas..., suma, cuenta]}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def clear_gauge(self, name: str):
+        """Borra todas las series del medidor (p. ej. un top que cambia de miembros)."""
+        with self._lock:
+            self._gauges.pop(name, None)
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    state[i] += 1
+            state[-2] += seconds
+            state[-1] += 1
+
+    def render(self) -> str:
+        """Formato de texto de Prometheus."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{METRICS_PREFIX}_{name}"
+                lines.append(f"# TYPE {full} counter")
+                for key, value in series.items():
+                    lines.append(f"{full}{_label_text(key)} {value}")
+            for name, series in sorted(self._gauges.items()):
+                full = f"{METRICS_PREFIX}_{name}"
+                lines.append(f"# TYPE {full} gauge")
+                for key, value in series.items():
+                    lines.append(f"{full}{_label_text(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                full = f"{METRICS_PREFIX}_{name}"
+                lines.append(f"# TYPE {full} histogram")
+                for key, state in series.items():
+                    for bound, count in zip(BUCKETS, state):
+                        le = f'le="{bound}"'
+                        lines.append(f"{full}_bucket{_label_text(key, le)} {count}")
+                    le = 'le="+Inf"'
+                    lines.append(f"{full}_bucket{_label_text(key, le)} {state[-1]}")
+                    lines.append(f"{full}_sum{_label_text(key)} {state[-2]}")
+                    lines.append(f"{full}_count{_label_text(key)} {state[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    """Tramo medido: histograma `span_seconds{span=...}` y, si se pide, log JSON."""
+
+    __slots__ = ("name", "labels", "trace_id", "span_id", "parent_id", "start", "_token")
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        parent = _current.get()
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = os.urandom(8).hex()
+
+    def set(self, **labels):
+        self.labels.update(labels)
+
+    def __enter__(self):
+        self.start = time.time()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        duration = time.time() - self.start
+        if exc_type is not None:
+            self.labels["error"] = exc_type.__name__
+        get_registry().observe("span_seconds", duration, span=self.name, **self.labels)
+        if METRICS_LOG:
+            _logger.info(json.dumps({
+                "name": self.name,
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_span_id": self.parent_id,
+                "start_time_unix_nano": int(self.start * 1e9),
+                "duration_ms": round(duration * 1000, 3),
+                "attributes": self.labels,
+            }, ensure_ascii=False))
+        return False
+
+
+class _NoopSpan:
+    def set(self, **labels):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+@st.cache_resource(show_spinner=False)
+def get_registry() -> Registry:
+    return Registry()
+
+
+def span(name: str, **labels):
+    """`with span("prompt_build"): ...` — sin costo si las métricas están apagadas."""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return Span(name, labels)
+
+
+def inc(name: str, value: float = 1, **labels):
+    if METRICS_ENABLED:
+        get_registry().inc(name, value, **labels)
+
+
+def gauge(name: str, value: float, **labels):
+    if METRICS_ENABLED:
+        get_registry().set_gauge(name, value, **labels)
+
+
+def clear_gauge(name: str):
+    if METRICS_ENABLED:
+        get_registry().clear_gauge(name)
+
+
+def observe(name: str, seconds: float, **labels):
+    if METRICS_ENABLED:
+        get_registry().observe(name, seconds, **labels)
+
+
+def count_usage(usage: dict, model: str):
+    """Tokens de usageMetadata de Gemini por tipo."""
+    if not METRICS_ENABLED or not usage:
+        return
+    for field, kind in (("promptTokenCount", "prompt"), ("candidatesTokenCount", "output"),
+                        ("cachedContentTokenCount", "cached"), ("toolUsePromptTokenCount", "tool")):
+        if usage.get(field):
+            get_registry().inc("gemini_tokens_total", usage[field], kind=kind, model=model)
+
+
+# ============================================================
+# Exportador
+# ============================================================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = get_registry().render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def start_exporters():
+    """
+    Una vez por proceso: logs JSON (METRICS_LOG) y /metrics en METRICS_PORT.
+    Streamlit no permite rutas propias, así que /metrics se sirve desde un
+    hilo del mismo proceso en un puerto aparte.
+    """
+    if not METRICS_ENABLED:
+        return None
+    if METRICS_LOG and not _logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+    if not METRICS_PORT:
+        return None
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", METRICS_PORT), _MetricsHandler)
+    except OSError:
+        return None  # puerto ocupado (p. ej. otra réplica en la misma máquina)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="nico-metrics", daemon=True).start()
+    return server
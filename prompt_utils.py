@@ -0,0 +1,139 @@
+# ---------------------------------------
+# prompt_utils.py
+# Construcción del request estructurado para Gemini:
+# systemInstruction (persona fija de NICO) + contents con rol (user/model)
+# ---------------------------------------
+
+# Prompt del Sistema (CONSTANTE, igual para todos los usuarios para poder cachearlo)
+SYS_PROMPT = (
+    "Eres NICO, asistente institucional de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH). "
+    "se responsable e incluyente, eficiente y ético"    
+    "Tu personalidad es alegre y jovial"
+    "Eres la mascota de la UMSNH eres un zorro, puedes hablar en español o purepecha"       
+    "NO uses negritas, NO uses Markdown, NO uses símbolos como **, *, _, #, ~~, etc.  "
+    "NO generes listas con guiones viñetas asteriscos o puntos. "
+    "Tu objetivo principal es proporcionar información precisa, actualizada y relevante de la UMSNH. "
+    "ANTE CUALQUIER PREGUNTA SOBRE NOTICIAS, CONTACTOS, O ACTUALIDAD (DESPUÉS DE 2023), DEBES EJECUTAR LA HERRAMIENTA DE BÚSQUEDA WEB DE GOOGLE (GoGoGoogleSearchh)"                                                                                                       
+    "Responde siempre en español de mexico o en purépecha si es solicitado de forma clara, breve y amable. "
+    "**IMPORTANTE: NO saludes al inicio de tu respuesta (ej. no digas 'Hola', 'Buenos días', 'Qué tal {nombre}'). El sistema ya saluda por ti la primera vez. Comienza directamente con la información solicitada o la respuesta a la pregunta.**"
+    "Usa su nombre ocasionalmente en la conversación para que suene natural, pero no en cada frase.\n "
+    "para nombres de funcionarios busca la web en https://umich.mx/unidades-administrativas/"       
+    "Prioriza sitios *.umich.mx."
+    "- https://www.umich.mx\n"
+    "-https://www.gacetanicolaita.umich.mx/n"
+    "-https://umich.mx/unidades-administrativas/n"
+    "- https://www.dce.umich.mx\n"
+    "- https://siia.umich.mx\n"
+    "Solo si te preguntan quien es la rectora, responde con, La rectora de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH) es Yarabí Ávila González. Fue designada para este cargo por el periodo 2023-2027."
+    "Solo si te preguntan quien es el director de El director de la Dirección de Tecnologías de la Información y la Comunicación (DTIC) respondeEl director de la Dirección de Tecnologías de la Información y la Comunicación (DTIC) de la UMSNH (Universidad Michoacana de San Nicolás de Hidalgo) es el Ingeniero Francisco Octavio Aparicio Contreras"
+    "El lema de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH) es, Cuna de héroes, crisol de pensadores"
+     "cual es el himno de la UMSNH, Universidad Michoacana, Tienes el tesoro del saber, Universidad Michoacana,En tu esencia Humanista he de crecer. Universidad Michoacana, Llevas puesto el corazón de Ocampo, Universidad Michoacana, Tienes en tu sangre inscrito a Hidalgo." 
+     "Pis pas, calis calas es parte de una famosa porra de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH) en Morelia, México, un grito tradicional de identidad y orgullo estudiantil que se canta en eventos deportivos y cívicos, significando rapidez y unidad, y a menudo se completa con ¡Pummm! ¡San Nicolás! "           
+     "Solo si te preguntan quien es el secretario general de la UMSNH El secretario general de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH) es Javier Cervantes Rodríguez. Asumió el cargo en julio de 2023")
+
+SYSTEM_INSTRUCTION = {"parts": [{"text": SYS_PROMPT}]}
+
+# Datos fijos de la persona (los mismos de SYS_PROMPT) que se responden sin llamar al modelo
+PERSONA_FACTS = {
+    "rectora": (
+        "La rectora de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH) es "
+        "Yarabí Ávila González. Fue designada para este cargo por el periodo 2023-2027."
+    ),
+    "director_dtic": (
+        "El director de la Dirección de Tecnologías de la Información y la Comunicación (DTIC) "
+        "de la UMSNH es el Ingeniero Francisco Octavio Aparicio Contreras."
+    ),
+    "secretario_general": (
+        "El secretario general de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH) "
+        "es Javier Cervantes Rodríguez. Asumió el cargo en julio de 2023."
+    ),
+    "lema": (
+        "El lema de la Universidad Michoacana de San Nicolás de Hidalgo (UMSNH) es "
+        "Cuna de héroes, crisol de pensadores."
+    ),
+    "himno": (
+        "Universidad Michoacana, tienes el tesoro del saber. Universidad Michoacana, "
+        "en tu esencia humanista he de crecer. Universidad Michoacana, llevas puesto "
+        "el corazón de Ocampo. Universidad Michoacana, tienes en tu sangre inscrito a Hidalgo."
+    ),
+    "porra": (
+        "Pis pas, calis calas es parte de una famosa porra de la Universidad Michoacana de "
+        "San Nicolás de Hidalgo (UMSNH), un grito tradicional de identidad y orgullo "
+        "estudiantil que se canta en eventos deportivos y cívicos, significando rapidez y "
+        "unidad, y a menudo se completa con ¡Pummm! ¡San Nicolás!"
+    ),
+}
+
+# Gemini sólo acepta estos roles; "assistant" provoca el error 400
+GEMINI_ROLES = {"user": "user", "assistant": "model", "model": "model"}
+
+
+def greeting(first_name: str) -> str:
+    """Saludo único que el sistema antepone a la primera respuesta."""
+    return f"¡Hola {first_name}! Soy NICO, tu asistente virtual.\n\n"
+
+
+def user_note(first_name: str) -> str:
+    """Dato personal que va en los contents (no en la instrucción cacheable)."""
+    return f"El usuario se llama {first_name}."
+
+
+def build_contents(history: list, first_name: str, max_messages: int = 5, summary: str = "") -> list:
+    """
+    Convierte el historial (dicts role/content, el último es el mensaje actual)
+    en contents con rol para Gemini:
+    - roles assistant -> model
+    - sin el saludo inyectado por el sistema
+    - sin mensajes vacíos, turnos consecutivos del mismo rol fusionados
+    - siempre empieza y termina con un turno "user"
+    - el resumen de turnos antiguos (memory_utils) va como nota en el primer turno
+    """
+    contents = []
+    for msg in history[-max_messages:]:
+        role = GEMINI_ROLES.get(msg.get("role"))
+        text = (msg.get("content") or "").strip()
+        if role == "model" and text.startswith(greeting(first_name).strip()):
+            text = text[len(greeting(first_name).strip()):].strip()
+        if not role or not text:
+            continue
+        if contents and contents[-1]["role"] == role:
+            contents[-1]["parts"].append({"text": text})
+        else:
+            contents.append({"role": role, "parts": [{"text": text}]})
+
+    while contents and contents[0]["role"] != "user":
+        contents.pop(0)
+
+    if contents:
+        notes = [{"text": user_note(first_name)}]
+        if summary:
+            notes.append({"text": f"Resumen de la conversación anterior: {summary}"})
+        contents[0]["parts"][:0] = notes
+
+    validate_contents(contents)
+    return contents
+
+
+def add_context(contents: list, note: str) -> list:
+    """Antepone una nota de contexto (p. ej. pasajes recuperados) al último turno user."""
+    if note and contents:
+        contents[-1]["parts"].insert(0, {"text": note})
+    return contents
+
+
+def validate_contents(contents: list):
+    """Falla antes de llamar a la API si el request provocaría un 400."""
+    if not contents:
+        raise ValueError("contents vacío: falta el mensaje del usuario")
+    previous = None
+    for item in contents:
+        role = item.get("role")
+        if role not in ("user", "model"):
+            raise ValueError(f"rol inválido para Gemini: {role!r}")
+        if role == previous:
+            raise ValueError("los roles deben alternar entre user y model")
+        if not any((p.get("text") or "").strip() for p in item.get("parts", [])):
+            raise ValueError(f"turno {role!r} sin texto")
+        previous = role
+    if contents[0]["role"] != "user" or contents[-1]["role"] != "user":
+        raise ValueError("contents debe empezar y terminar con un turno user")
@@ -0,0 +1,247 @@
+# ---------------------------------------
+# rate_utils.py
+# Control de admisión delante de Gemini:
+# cubeta de tokens por usuario (email de OAuth) + semáforo global con fila
+# visible. En memoria por proceso, o en Redis si hay varias réplicas.
+# Los trabajos admitidos esperan en su propio pool, no en el de worker_utils.
+# ---------------------------------------
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+from config_utils import get_setting
+from metrics_utils import inc, observe
+from state_utils import STATE_BACKEND, STATE_REDIS_URL, redis_client
+from worker_utils import BUSY_REPLY, WorkerPool
+
+# Por defecto, el mismo backend que el estado compartido (state_utils)
+RATE_LIMIT_BACKEND = get_setting("RATE_LIMIT_BACKEND", STATE_BACKEND)  # "memory" o "redis"
+RATE_LIMIT_REDIS_URL = get_setting("RATE_LIMIT_REDIS_URL", STATE_REDIS_URL)
+# Cubeta por usuario: ráfaga máxima y recarga por minuto
+RATE_LIMIT_BURST = get_setting("RATE_LIMIT_BURST", 3)
+RATE_LIMIT_PER_MINUTE = get_setting("RATE_LIMIT_PER_MINUTE", 6.0)
+# Semáforo global: llamadas simultáneas a Gemini y tamaño de la fila
+GEMINI_MAX_CONCURRENT = get_setting("GEMINI_MAX_CONCURRENT", 4)
+GEMINI_QUEUE_MAX = get_setting("GEMINI_QUEUE_MAX", 16)
+GEMINI_QUEUE_TIMEOUT = get_setting("GEMINI_QUEUE_TIMEOUT", 30.0)
+# Un turno que lleva más que esto dentro del semáforo se da por perdido
+GEMINI_SLOT_LEASE = get_setting("GEMINI_SLOT_LEASE", 180.0)
+# Cada cuánto se descartan las cubetas llenas (usuarios inactivos)
+RATE_LIMIT_SWEEP_SECONDS = 60.0
+
+
+def slow_down_reply(retry_after: float) -> str:
+    seconds = max(1, math.ceil(retry_after))
+    return f"Vas muy rápido 🙂. Espera {seconds} s antes de tu siguiente pregunta."
+
+
+# ============================================================
+# Backend en memoria (un proceso)
+# ============================================================
+
+class MemoryRateLimiter:
+    def __init__(self, burst: int = RATE_LIMIT_BURST, per_minute: float = RATE_LIMIT_PER_MINUTE,
+                 max_concurrent: int = GEMINI_MAX_CONCURRENT, lease: float = GEMINI_SLOT_LEASE,
+                 clock=time.monotonic):
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self.max_concurrent = max_concurrent
+        self.lease = lease
+        self._clock = clock  # inyectable en las pruebas
+        self._lock = threading.Lock()
+        self._buckets = {}  # email -> (tokens, actualizado)
+        self._swept = clock()
+        self._changed = threading.Condition(self._lock)
+        self._tickets = OrderedDict()  # ticket -> hora de llegada (orden de la fila)
+
+    def take(self, key: str):
+        """Consume un token del usuario. Devuelve (permitido, segundos para el siguiente)."""
+        now = self._clock()
+        with self._lock:
+            self._evict(now)
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return True, 0.0
+            self._buckets[key] = (tokens, now)
+            return False, (1 - tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def _evict(self, now: float):
+        # Una cubeta que ya se recargó equivale a no tenerla: se descarta
+        if now - self._swept < RATE_LIMIT_SWEEP_SECONDS:
+            return
+        self._swept = now
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * self.rate >= self.burst:
+                del self._buckets[key]
+
+    def _position(self, ticket) -> int:
+        now = self._clock()
+        for old, arrived in list(self._tickets.items()):
+            if now - arrived > self.lease:
+                del self._tickets[old]
+        if ticket not in self._tickets:
+            return -1
+        rank = list(self._tickets).index(ticket)
+        return 0 if rank < self.max_concurrent else rank - self.max_concurrent + 1
+
+    def enter(self, ticket: str) -> int:
+        """Entra a la fila. 0 = admitido; N > 0 = lugar en la fila."""
+        with self._lock:
+            self._tickets.setdefault(ticket, self._clock())
+            return self._position(ticket)
+
+    def wait(self, ticket: str, timeout: float) -> int:
+        with self._changed:
+            self._changed.wait(timeout)
+            return self._position(ticket)
+
+    def leave(self, ticket: str):
+        with self._changed:
+            self._tickets.pop(ticket, None)
+            self._changed.notify_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._position(None)
+            active = min(len(self._tickets), self.max_concurrent)
+            return {"active": active, "queued": len(self._tickets) - active}
+
+
+# ============================================================
+# Backend Redis (varias réplicas)
+# ============================================================
+
+_TAKE_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisRateLimiter:
+    """
+    Mismo contrato que MemoryRateLimiter sobre Redis (o compatible):
+    la cubeta es un hash actualizado con un script Lua (atómico) y la fila
+    un sorted set ordenado por hora de llegada.
+    """
+
+    prefix = "nico:rate"
+
+    def __init__(self, url: str, burst: int = RATE_LIMIT_BURST, per_minute: float = RATE_LIMIT_PER_MINUTE,
+                 max_concurrent: int = GEMINI_MAX_CONCURRENT, lease: float = GEMINI_SLOT_LEASE,
+                 clock=time.time):
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self.max_concurrent = max_concurrent
+        self.lease = lease
+        self._clock = clock  # hora de pared: la comparten todas las réplicas
+        self._redis = redis_client(url)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+        self._queue = f"{self.prefix}:queue"
+
+    def take(self, key: str):
+        allowed, tokens = self._take(
+            keys=[f"{self.prefix}:bucket:{key}"], args=[self.burst, self.rate, self._clock()]
+        )
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / self.rate if self.rate > 0 else float("inf")
+
+    def _position(self, ticket) -> int:
+        self._redis.zremrangebyscore(self._queue, 0, self._clock() - self.lease)
+        rank = self._redis.zrank(self._queue, ticket)
+        if rank is None:
+            return -1
+        return 0 if rank < self.max_concurrent else rank - self.max_concurrent + 1
+
+    def enter(self, ticket: str) -> int:
+        self._redis.zadd(self._queue, {ticket: self._clock()}, nx=True)
+        return self._position(ticket)
+
+    def wait(self, ticket: str, timeout: float) -> int:
+        time.sleep(timeout)  # sin notificaciones entre réplicas: sondeo corto
+        return self._position(ticket)
+
+    def leave(self, ticket: str):
+        self._redis.zrem(self._queue, ticket)
+
+    def stats(self) -> dict:
+        self._position("")
+        total = self._redis.zcard(self._queue)
+        active = min(total, self.max_concurrent)
+        return {"active": active, "queued": total - active}
+
+
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter():
+    """Limitador compartido por proceso; con RATE_LIMIT_BACKEND=redis, Redis o error."""
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisRateLimiter(RATE_LIMIT_REDIS_URL)
+    return MemoryRateLimiter()
+
+
+# ============================================================
+# Trabajo admitido
+# ============================================================
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_pool() -> WorkerPool:
+    """
+    Hilos para las llamadas a Gemini: uno por lugar del semáforo y de la fila,
+    sin cola del ejecutor. Así quien espera turno no ocupa un hilo del pool
+    general (voz, resúmenes) y todo trabajo enviado ya está en la fila visible.
+    """
+    return WorkerPool(GEMINI_MAX_CONCURRENT + GEMINI_QUEUE_MAX, 0, name="nico-gemini")
+
+
+def submit_admitted(fn, *args, **kwargs):
+    """Ejecuta fn(job, ...) tras pasar por admitted(); lanza PoolBusy si no hay lugar."""
+    return get_gemini_pool().submit(admitted, fn, *args, **kwargs)
+
+
+def admitted(job, fn, *args, **kwargs):
+    """
+    Envuelve un trabajo de worker_utils: espera lugar en el semáforo global
+    (publicando su lugar en job.meta["queue_position"]) y luego ejecuta
+    fn(job, ...). Si la fila está llena o la espera se alarga, responde rápido.
+    Se usa a través de submit_admitted.
+    """
+    limiter = get_rate_limiter()
+    deadline = time.monotonic() + GEMINI_QUEUE_TIMEOUT
+    try:
+        position = limiter.enter(job.id)
+        while position:
+            if position > GEMINI_QUEUE_MAX or time.monotonic() > deadline:
+                inc("rate_limited_total", reason="queue")
+                job.meta["throttled"] = True
+                job.emit(BUSY_REPLY)
+                return BUSY_REPLY
+            if job.cancelled:
+                return None
+            job.meta["queue_position"] = position
+            position = limiter.wait(job.id, 0.25)
+            if position < 0:  # el lugar caducó: volver a formarse
+                position = limiter.enter(job.id)
+        job.meta["queue_position"] = 0
+        observe("queue_wait_seconds", GEMINI_QUEUE_TIMEOUT - (deadline - time.monotonic()))
+        return fn(job, *args, **kwargs)
+    finally:
+        limiter.leave(job.id)
@@ -0,0 +1,302 @@
+# ---------------------------------------
+# resilience_utils.py
+# Cola lenta y caídas de Gemini:
+#   - plazo por turno: nadie espera más de GEMINI_DEADLINE a que empiece la respuesta
+#   - solicitudes de cobertura (hedging): si la primera tarda más que el p95
+#     reciente, se lanza un duplicado y gana la que responda primero. Sólo
+#     GEMINI_HEDGE_THREADS llamadas a la vez pueden cubrirse; las demás corren
+#     sin duplicado en el hilo de quien llama (no hay tope oculto de llamadas)
+#   - cortacircuitos por modelo: tras varias fallas seguidas se deja de llamar
+#     (respuesta inmediata con datos fijos) y se prueba de nuevo con una sola
+#     petición (medio abierto) pasado un tiempo
+# ---------------------------------------
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+import streamlit as st
+
+from config_utils import get_setting
+from metrics_utils import inc
+
+# Segundos máximos por turno hasta que empiece la respuesta (incluye el modelo de respaldo)
+GEMINI_DEADLINE = get_setting("GEMINI_DEADLINE", 25.0)
+GEMINI_HEDGE = get_setting("GEMINI_HEDGE", True)
+# Espera antes del duplicado mientras no hay muestras suficientes para el p95
+GEMINI_HEDGE_DELAY = get_setting("GEMINI_HEDGE_DELAY", 4.0)
+GEMINI_HEDGE_MIN_DELAY = get_setting("GEMINI_HEDGE_MIN_DELAY", 0.5)
+# Llamadas que pueden cubrirse a la vez (cada una usa hasta dos hilos del pool)
+GEMINI_HEDGE_THREADS = get_setting("GEMINI_HEDGE_THREADS", 8)
+# Fallas seguidas para abrir el circuito y segundos antes de la prueba (se duplican, hasta 8x)
+BREAKER_FAILURES = get_setting("BREAKER_FAILURES", 5)
+BREAKER_COOLDOWN = get_setting("BREAKER_COOLDOWN", 20.0)
+
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Exception):
+    """El modelo está marcado como caído: no se llama (falla rápida)."""
+
+
+# ============================================================
+# Latencia reciente (para el retraso de la cobertura)
+# ============================================================
+
+class LatencyTracker:
+    """Últimas latencias hasta el primer byte por modelo; p95 para decidir cuándo cubrir."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = {}  # modelo -> deque de segundos
+        self.window = window
+
+    def record(self, model: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def p95(self, model: str):
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return None
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def hedge_delay(self, model: str) -> float:
+        p95 = self.p95(model)
+        return GEMINI_HEDGE_DELAY if p95 is None else max(GEMINI_HEDGE_MIN_DELAY, p95)
+
+
+# ============================================================
+# Cortacircuitos
+# ============================================================
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN,
+                 clock=time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._clock = clock  # inyectable en las pruebas
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._streak = 0
+        self._trips = 0        # aperturas seguidas (para alargar la espera)
+        self._retry_at = 0.0
+        self._probing = False
+
+    def available(self) -> bool:
+        """Sin efectos: False si está abierto y aún no toca probar."""
+        with self._lock:
+            return self.state == CLOSED or (self.state == OPEN and self._clock() >= self._retry_at)
+
+    def allow(self) -> bool:
+        """
+        Reserva una llamada. Abierto: no, salvo que ya toque la prueba, que
+        pasa a medio abierto y deja pasar UNA sola petición hasta saber el resultado.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self._clock() >= self._retry_at:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self._streak = 0
+            self._trips = 0
+            self._probing = False
+
+    def failure(self) -> bool:
+        """Registra una falla; True si con ella se abre el circuito."""
+        with self._lock:
+            self._streak += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._streak >= self.failures):
+                self._trips += 1
+                self.state = OPEN
+                self._retry_at = self._clock() + self.cooldown * min(8, 2 ** (self._trips - 1))
+                self._probing = False
+                return True
+            return False
+
+
+class Upstream:
+    """Cortacircuitos y latencias por modelo, compartidos por todas las sesiones."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self.latency = LatencyTracker()
+        # Original y duplicado de cada llamada cubierta: con un hilo por intento nada espera en cola
+        self.pool = ThreadPoolExecutor(2 * GEMINI_HEDGE_THREADS, thread_name_prefix="nico-hedge")
+        self._hedge_slots = threading.BoundedSemaphore(GEMINI_HEDGE_THREADS)
+
+    def reserve_hedge(self) -> bool:
+        """Lugar para una llamada cubierta; False si el presupuesto está agotado."""
+        return self._hedge_slots.acquire(blocking=False)
+
+    def release_hedge(self):
+        self._hedge_slots.release()
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker()
+            return self._breakers[model]
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            model: {"state": breaker.state, "p95": self.latency.p95(model)}
+            for model, breaker in breakers.items()
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def get_upstream() -> Upstream:
+    return Upstream()
+
+
+# ============================================================
+# Llamada con plazo, cobertura y cortacircuitos
+# ============================================================
+
+def _healthy(response) -> bool:
+    # 429 y 5xx cuentan como falla del servicio; otros 4xx son errores de la petición
+    return response.status_code < 500 and response.status_code != 429
+
+
+def _discard(future, latency, model):
+    """Cierra la respuesta de un intento perdedor cuando termine (y anota su latencia)."""
+    def close(f):
+        if not f.cancelled() and f.exception() is None:
+            response = f.result()
+            latency.record(model, response.elapsed.total_seconds())
+            response.close()
+    future.add_done_callback(close)
+
+
+def _when_all_done(futures: list, callback):
+    """Llama callback() cuando terminen todos los intentos (también los perdedores)."""
+    lock, left = threading.Lock(), [len(futures)]
+
+    def done(_):
+        with lock:
+            left[0] -= 1
+            last = left[0] == 0
+        if last:
+            callback()
+
+    for future in futures:
+        future.add_done_callback(done)
+
+
+def _settle(upstream, breaker, model, result, error):
+    """Aplica el resultado al cortacircuitos y a las latencias; devuelve la respuesta o lanza."""
+    if result is not None and _healthy(result):
+        # Latencia propia de cada intento (hasta los encabezados), no la del turno
+        upstream.latency.record(model, result.elapsed.total_seconds())
+        breaker.success()
+        return result
+    if breaker.failure():
+        inc("circuit_open_total", model=model)
+    if result is not None:
+        return result
+    if error is not None:
+        raise error
+    raise requests.Timeout("plazo del turno agotado")
+
+
+def guarded_call(model: str, attempt, deadline: float):
+    """
+    Ejecuta attempt(timeout) -> requests.Response para `model` respetando el
+    plazo (time.monotonic()). Si no hay respuesta en el p95 reciente, lanza un
+    duplicado; gana la primera respuesta sana. Lanza CircuitOpen si el
+    circuito no deja pasar y requests.Timeout si se agota el plazo.
+    Devuelve la respuesta (la última, aunque sea 5xx, si todas fallaron).
+    Sin cobertura (apagada, circuito en prueba o presupuesto agotado) el
+    intento corre en el hilo de quien llama, con el plazo como timeout.
+    """
+    if deadline <= time.monotonic():
+        # El plazo se fue antes de llamar (no es culpa del servicio: no cuenta como falla)
+        raise requests.Timeout("plazo del turno agotado")
+    upstream = get_upstream()
+    breaker = upstream.breaker(model)
+    if not breaker.allow():
+        inc("circuit_rejected_total", model=model)
+        raise CircuitOpen(model)
+
+    def timed():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.Timeout("plazo del turno agotado")
+        return attempt(remaining)
+
+    # Sólo se cubre con el circuito cerrado (no duplicar la petición de prueba)
+    if not (GEMINI_HEDGE and breaker.state == CLOSED and upstream.reserve_hedge()):
+        try:
+            result, error = timed(), None
+        except Exception as e:
+            result, error = None, e
+        return _settle(upstream, breaker, model, result, error)
+
+    started = time.monotonic()
+    futures = [upstream.pool.submit(timed)]
+    pending = set(futures)
+    hedge_at = started + upstream.latency.hedge_delay(model)
+    hedge, winner = None, None
+    result, error = None, None
+
+    while pending:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        wake = deadline if hedge else min(deadline, hedge_at)
+        done, pending = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            try:
+                response = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if _healthy(response):
+                if result is not None:
+                    result.close()
+                result, winner = response, future
+                break
+            if result is not None:
+                result.close()
+            result = response  # 5xx / 429: se guarda por si nadie responde mejor
+        if result is not None and _healthy(result):
+            break
+
+        if hedge is None and time.monotonic() >= hedge_at and pending:
+            inc("gemini_hedge_total", model=model)
+            hedge = upstream.pool.submit(timed)
+            futures.append(hedge)
+            pending.add(hedge)
+
+    # El lugar de cobertura se devuelve cuando terminan todos sus intentos
+    _when_all_done(futures, upstream.release_hedge)
+    for future in pending:
+        # Plazo agotado o ya hay ganador: lo que no empezó se cancela, lo demás se cierra al llegar
+        future.cancel()
+        _discard(future, upstream.latency, model)
+
+    if hedge is not None and result is not None and _healthy(result):
+        inc("gemini_hedge_won_total" if winner is hedge else "gemini_hedge_lost_total", model=model)
+    if pending and result is None:
+        error = None  # los intentos siguen en curso: es el plazo lo que se agotó
+    return _settle(upstream, breaker, model, result, error)
@@ -0,0 +1,316 @@
+# ---------------------------------------
+# retrieval_utils.py
+# Índice local (BM25) sobre una copia de páginas de umich.mx
+# (unidades administrativas, gaceta, dce, siia...).
+# Los pasajes más relevantes van en el prompt y, si bastan, se omite
+# la búsqueda web de Google. El índice vive en disco (NumPy, mmap)
+# y se reconstruye por archivo con build_index.py.
+# ---------------------------------------
+
+import hashlib
+import json
+import os
+import re
+import threading
+from html.parser import HTMLParser
+
+import numpy as np
+import streamlit as st
+
+from cache_utils import normalize_question
+from config_utils import get_setting
+
+RETRIEVAL_INDEX_DIR = get_setting("RETRIEVAL_INDEX_DIR", "index/umich")
+RETRIEVAL_TOP_K = get_setting("RETRIEVAL_TOP_K", 4)
+# Puntaje BM25 mínimo del mejor pasaje para confiar en el índice y omitir la búsqueda web
+RETRIEVAL_MIN_SCORE = get_setting("RETRIEVAL_MIN_SCORE", 6.0)
+RETRIEVAL_CHUNK_WORDS = get_setting("RETRIEVAL_CHUNK_WORDS", 120)
+RETRIEVAL_CHUNK_OVERLAP = get_setting("RETRIEVAL_CHUNK_OVERLAP", 20)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+SNAPSHOT_EXTENSIONS = (".html", ".htm", ".txt", ".md")
+
+_STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los", "me",
+    "mi", "para", "por", "que", "se", "su", "sus", "un", "una", "y", "o", "u", "como",
+    "cual", "cuales", "quien", "quienes", "donde", "cuando", "dime", "sobre", "hay",
+}
+
+
+def tokenize(text: str) -> list:
+    return [w for w in normalize_question(text).split() if w not in _STOPWORDS and len(w) > 1]
+
+
+# ============================================================
+# Ingesta: copia local -> pasajes
+# ============================================================
+
+class _TextExtractor(HTMLParser):
+    """Texto visible de una página, un bloque por párrafo / encabezado / celda."""
+
+    _SKIP = {"script", "style", "nav", "header", "footer", "noscript", "svg", "form"}
+    _BLOCK = {"p", "div", "li", "h1", "h2", "h3", "h4", "h5", "h6", "td", "th", "br", "section", "article"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = [""]
+        self.title = ""
+        self._skip = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skip += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in self._BLOCK and self.blocks[-1]:
+            self.blocks.append("")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP and self._skip:
+            self._skip -= 1
+        elif tag == "title":
+            self._in_title = False
+        elif tag in self._BLOCK and self.blocks[-1]:
+            self.blocks.append("")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data.strip()
+        elif not self._skip and data.strip():
+            self.blocks[-1] += " " + " ".join(data.split())
+
+
+def page_text(raw: str, is_html: bool):
+    """Devuelve (título, párrafos) de una página de la copia."""
+    if not is_html:
+        paragraphs = [" ".join(p.split()) for p in re.split(r"\n\s*\n", raw)]
+        return "", [p for p in paragraphs if p]
+    parser = _TextExtractor()
+    parser.feed(raw)
+    return parser.title, [b.strip() for b in parser.blocks if b.strip()]
+
+
+def source_url(rel_path: str) -> str:
+    """Ruta de la copia (estilo `wget -m`: dominio/ruta/index.html) -> URL original."""
+    parts = rel_path.replace(os.sep, "/").split("/")
+    if "." not in parts[0]:
+        return rel_path
+    if parts[-1] in ("index.html", "index.htm"):
+        parts[-1] = ""
+    return "https://" + "/".join(parts)
+
+
+def chunk_paragraphs(paragraphs: list, words: int = RETRIEVAL_CHUNK_WORDS,
+                     overlap: int = RETRIEVAL_CHUNK_OVERLAP) -> list:
+    """Agrupa párrafos en pasajes de ~`words` palabras con un traslape pequeño."""
+    tokens = " ".join(paragraphs).split()
+    if not tokens:
+        return []
+    step = max(1, words - overlap)
+    chunks = []
+    for start in range(0, len(tokens), step):
+        chunks.append(" ".join(tokens[start:start + words]))
+        if start + words >= len(tokens):
+            break
+    return chunks
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# ============================================================
+# Construcción del índice en disco
+# ============================================================
+
+def _load_previous(index_dir: str) -> dict:
+    """Pasajes del índice anterior agrupados por archivo (para la reconstrucción incremental)."""
+    previous = {}
+    try:
+        with open(os.path.join(index_dir, "manifest.json"), encoding="utf-8") as f:
+            files = json.load(f)["files"]
+        with open(os.path.join(index_dir, "chunks.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                previous.setdefault(chunk["file"], []).append(chunk)
+    except (OSError, ValueError, KeyError):
+        return {}
+    return {path: (files[path], previous.get(path, [])) for path in files}
+
+
+def build_index(snapshot_dir: str, index_dir: str = RETRIEVAL_INDEX_DIR) -> dict:
+    """
+    Lee la copia local, trocea las páginas y escribe el índice BM25.
+    Sólo se vuelven a procesar los archivos cuyo contenido cambió.
+    Devuelve estadísticas de la construcción.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    previous = _load_previous(index_dir)
+    stats = {"files": 0, "reused": 0, "parsed": 0, "removed": 0, "chunks": 0}
+
+    files, chunks = {}, []
+    for root, _, names in os.walk(snapshot_dir):
+        for name in sorted(names):
+            if not name.lower().endswith(SNAPSHOT_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, snapshot_dir).replace(os.sep, "/")
+            digest = _file_digest(path)
+            files[rel] = digest
+            stats["files"] += 1
+
+            old = previous.get(rel)
+            if old and old[0] == digest:
+                chunks.extend(old[1])
+                stats["reused"] += 1
+                continue
+
+            with open(path, encoding="utf-8", errors="replace") as f:
+                title, paragraphs = page_text(f.read(), name.lower().endswith((".html", ".htm")))
+            url = source_url(rel)
+            for text in chunk_paragraphs(paragraphs):
+                chunks.append({"file": rel, "url": url, "title": title, "text": text})
+            stats["parsed"] += 1
+    stats["removed"] = len(set(previous) - set(files))
+    stats["chunks"] = len(chunks)
+
+    # Listas invertidas en formato CSR: offsets[t]:offsets[t+1] -> (pasaje, frecuencia)
+    vocab, postings = {}, []
+    doc_len = np.zeros(len(chunks), dtype=np.float32)
+    for doc_id, chunk in enumerate(chunks):
+        counts = {}
+        for term in tokenize(chunk["title"] + " " + chunk["text"]):
+            counts[term] = counts.get(term, 0) + 1
+        doc_len[doc_id] = sum(counts.values())
+        for term, tf in counts.items():
+            postings.append((vocab.setdefault(term, len(vocab)), doc_id, tf))
+
+    postings.sort()
+    terms = np.array([p[0] for p in postings], dtype=np.int32)
+    offsets = np.searchsorted(terms, np.arange(len(vocab) + 1)).astype(np.int64)
+    arrays = {
+        "offsets": offsets,
+        "docs": np.array([p[1] for p in postings], dtype=np.int32),
+        "tfs": np.array([p[2] for p in postings], dtype=np.float32),
+        "doc_len": doc_len,
+    }
+
+    def write(name, writer, mode="w"):
+        # Archivo temporal + os.replace: la app nunca lee un archivo a medias
+        tmp = os.path.join(index_dir, f".{name}.tmp")
+        with open(tmp, mode, encoding=None if "b" in mode else "utf-8") as f:
+            writer(f)
+        os.replace(tmp, os.path.join(index_dir, name))
+
+    for name, array in arrays.items():
+        write(f"{name}.npy", lambda f, a=array: np.save(f, a), "wb")
+    write("vocab.json", lambda f: json.dump(vocab, f, ensure_ascii=False))
+    write("chunks.jsonl", lambda f: f.writelines(
+        json.dumps(chunk, ensure_ascii=False) + "\n" for chunk in chunks
+    ))
+    # El manifiesto va al final: su fecha indica a la app que hay índice nuevo
+    write("manifest.json", lambda f: json.dump({"files": files, "chunks": len(chunks)}, f))
+    return stats
+
+
+# ============================================================
+# Consulta
+# ============================================================
+
+class _Index:
+    """Una versión del índice en disco (arreglos memory-mapped); no cambia una vez cargada."""
+
+    def __init__(self, index_dir: str = None, version=None):
+        self.version = version
+        self.offsets = self.docs = self.tfs = self.doc_len = np.zeros(0)
+        self.vocab, self.chunks, self.avg_len = {}, [], 0.0
+        if index_dir is None:
+            return  # índice vacío: todavía no se ha construido
+        path = lambda name: os.path.join(index_dir, name)
+        self.offsets = np.load(path("offsets.npy"), mmap_mode="r")
+        self.docs = np.load(path("docs.npy"), mmap_mode="r")
+        self.tfs = np.load(path("tfs.npy"), mmap_mode="r")
+        self.doc_len = np.load(path("doc_len.npy"), mmap_mode="r")
+        with open(path("vocab.json"), encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        with open(path("chunks.jsonl"), encoding="utf-8") as f:
+            self.chunks = [json.loads(line) for line in f]
+        self.avg_len = float(self.doc_len.mean()) if len(self.doc_len) else 0.0
+
+
+class Retriever:
+    """
+    Índice BM25 memory-mapped. Se carga al primer uso y se recarga solo si
+    build_index escribe uno nuevo (también si al arrancar aún no existía).
+    Cada recarga sustituye la versión completa de un solo golpe: una búsqueda
+    en curso sigue con la versión que tomó al empezar.
+    """
+
+    def __init__(self, index_dir: str = RETRIEVAL_INDEX_DIR):
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._index = _Index()
+
+    def _manifest_mtime(self):
+        try:
+            return os.stat(os.path.join(self.index_dir, "manifest.json")).st_mtime_ns
+        except OSError:
+            return None
+
+    def _refresh(self) -> _Index:
+        if self._manifest_mtime() != self._index.version:
+            with self._lock:
+                version = self._manifest_mtime()
+                if version != self._index.version:
+                    try:
+                        self._index = _Index(self.index_dir, version) if version else _Index()
+                    except (OSError, ValueError):
+                        pass  # índice a medio escribir o dañado: sigue la versión anterior
+        return self._index
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> list:
+        """Los `k` pasajes con mayor puntaje BM25: [(puntaje, pasaje), ...]."""
+        index = self._refresh()
+        n = len(index.chunks)
+        if not n:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * index.doc_len / max(index.avg_len, 1e-6))
+        for term in set(tokenize(query)):
+            term_id = index.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = index.offsets[term_id], index.offsets[term_id + 1]
+            docs, tfs = index.docs[start:end], index.tfs[start:end]
+            idf = np.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + norm[docs])
+
+        top = np.argsort(-scores)[:k]
+        return [(float(scores[i]), index.chunks[i]) for i in top if scores[i] > 0]
+
+
+@st.cache_resource(show_spinner=False)
+def get_retriever() -> Retriever:
+    """Retriever compartido; sin índice en disco no devuelve pasajes hasta que se construya."""
+    return Retriever()
+
+
+def retrieve(query: str, k: int = RETRIEVAL_TOP_K):
+    """
+    Devuelve (pasajes, suficientes). `suficientes` indica que el mejor pasaje
+    supera RETRIEVAL_MIN_SCORE y se puede omitir la búsqueda web.
+    """
+    hits = get_retriever().search(query, k)
+    return [chunk for _, chunk in hits], bool(hits) and hits[0][0] >= RETRIEVAL_MIN_SCORE
+
+
+def passages_note(passages: list) -> str:
+    """Pasajes numerados con su fuente, para el turno del usuario."""
+    lines = ["Información de sitios umich.mx (úsala si responde la pregunta):"]
+    for i, chunk in enumerate(passages, 1):
+        lines.append(f"[{i}] {chunk['url']}: {chunk['text']}")
+    return "\n".join(lines)
@@ -0,0 +1,146 @@
+# ---------------------------------------
+# router_utils.py
+# Enrutado por pregunta (sólo palabras clave, sin llamadas extra):
+#   static   -> datos fijos de la persona, sin llamar a Gemini
+#   fast     -> modelo sin búsqueda web (explicaciones, charla, traducciones)
+#   grounded -> modelo con google_search (noticias, fechas, contactos, personas)
+# ---------------------------------------
+
+import re
+from dataclasses import dataclass, field
+
+from cache_utils import normalize_question
+from config_utils import get_setting
+from gemini_utils import DEFAULT_TOOLS
+from prompt_utils import PERSONA_FACTS, add_context
+from retrieval_utils import passages_note, retrieve
+
+ROUTER_ENABLED = get_setting("ROUTER_ENABLED", True)
+# "" = el modelo principal (GEMINI_MODEL)
+ROUTER_FAST_MODEL = get_setting("ROUTER_FAST_MODEL", "")
+ROUTER_GROUNDED_MODEL = get_setting("ROUTER_GROUNDED_MODEL", "")
+# Preguntas más largas que esto nunca se responden con un dato fijo
+ROUTER_STATIC_MAX_WORDS = get_setting("ROUTER_STATIC_MAX_WORDS", 14)
+
+STATIC, FAST, GROUNDED = "static", "fast", "grounded"
+
+OUTAGE_REPLY = (
+    "En este momento no puedo consultar mis fuentes. "
+    "Intenta de nuevo en un minuto; mientras tanto puedes revisar https://www.umich.mx."
+)
+
+# (patrón sobre la pregunta normalizada, clave en PERSONA_FACTS)
+_STATIC_PATTERNS = [
+    (re.compile(r"\b(quien|como se llama|nombre)\b.*\brectora?\b"), "rectora"),
+    (re.compile(r"\b(quien|como se llama|nombre)\b.*\bdirector\b.*\b(dtic|tecnologias de la informacion)\b"),
+     "director_dtic"),
+    (re.compile(r"\b(quien|como se llama|nombre)\b.*\bsecretari[oa] general\b"), "secretario_general"),
+    (re.compile(r"\blema\b"), "lema"),
+    (re.compile(r"\b(cual|dime|canta|letra|como va)\b.*\bhimno\b"), "himno"),
+    (re.compile(r"\b(pis pas|calis calas|porra)\b"), "porra"),
+]
+# Preguntas históricas o de otras épocas: el dato fijo (actual) no aplica
+_NOT_STATIC = re.compile(r"\b(fue|era|eran|anterior|anteriores|primer|primera|historia|\d{4})\b")
+# Los datos fijos son de la UMSNH: si la pregunta nombra otra universidad,
+# un sindicato, una facultad o escuela, etc., la responde el modelo
+_OTHER_ENTITY = re.compile(
+    r"\b(facultad|escuela|instituto|preparatoria|prepa|colegio|sindicato|spum|suemum|"
+    r"unam|ipn|udg|udeg|uam|buap|uanl|tec|itesm|itm|"
+    r"nacional|mexico|gobierno|estado|municipio|pais|otra|otro)\b"
+    r"|\buniversidad\s+(?!michoacana\b|de\s+san\s+nicolas\b|de\s+michoacan\b)"
+    r"(de|del|autonoma|nacional|estatal|tecnologica|la)\b"
+)
+# "el lema de la ...", "el secretario general del ...": ¿de quién?
+_QUALIFIED = re.compile(
+    r"\b(rectora?|secretari[oa] general|lema|himno|porra)\s+(?:de|del)\s+(?:la\s+|el\s+|los\s+|las\s+)?(\w+)"
+)
+_OWN_ENTITY = {"umsnh", "umich", "universidad", "michoacana", "uni", "nicolaita", "nicolaitas", "san"}
+
+# Temas que cambian con el tiempo o son específicos del sitio: requieren búsqueda
+_GROUNDED_WORDS = {
+    "noticia", "noticias", "hoy", "actual", "actualmente", "reciente", "recientes",
+    "ultimo", "ultima", "ultimos", "ultimas", "fecha", "fechas", "cuando", "convocatoria",
+    "convocatorias", "inscripcion", "inscripciones", "reinscripcion", "admision", "examen",
+    "resultados", "calendario", "periodo", "horario", "horarios", "telefono", "correo",
+    "contacto", "ubicacion", "donde", "quien", "quienes", "director", "directora",
+    "coordinador", "coordinadora", "funcionario", "funcionarios", "rector", "rectora",
+    "secretario", "secretaria", "costo", "costos", "cuota", "cuotas", "pago", "beca",
+    "becas", "tramite", "tramites", "requisito", "requisitos", "pagina", "sitio", "enlace",
+    "link", "siia", "dce", "gaceta", "evento", "eventos",
+}
+_YEAR = re.compile(r"\b20[2-9]\d\b")
+
+
+@dataclass
+class Route:
+    tier: str
+    model: str = ""
+    tools: list = field(default_factory=list)
+    answer: str = ""  # sólo para el nivel static
+
+
+def _static_fact(text: str) -> str:
+    """Clave de PERSONA_FACTS para la pregunta normalizada, o "" si no aplica."""
+    if _NOT_STATIC.search(text) or _OTHER_ENTITY.search(text):
+        return ""
+    if any(m.group(2) not in _OWN_ENTITY for m in _QUALIFIED.finditer(text)):
+        return ""
+    for pattern, fact in _STATIC_PATTERNS:
+        if pattern.search(text):
+            return fact
+    return ""
+
+
+def classify(question: str, allow_static: bool = True) -> tuple:
+    """Devuelve (nivel, clave de PERSONA_FACTS o "")."""
+    text = normalize_question(question)
+    words = text.split()
+
+    if allow_static and len(words) <= ROUTER_STATIC_MAX_WORDS:
+        fact = _static_fact(text)
+        if fact:
+            return STATIC, fact
+
+    if _GROUNDED_WORDS.intersection(words) or _YEAR.search(text):
+        return GROUNDED, ""
+    return FAST, ""
+
+
+def route_question(question: str, model: str, follow_up: bool = False, previous_tier: str = "") -> Route:
+    """
+    Ruta para la pregunta. Las preguntas de seguimiento ("¿y eso?") no se
+    responden con datos fijos y heredan la búsqueda si el turno anterior la usó.
+    """
+    grounded = Route(GROUNDED, ROUTER_GROUNDED_MODEL or model, DEFAULT_TOOLS)
+    if not ROUTER_ENABLED:
+        return grounded
+
+    tier, fact = classify(question, allow_static=not follow_up)
+    if follow_up and previous_tier == GROUNDED:
+        tier = GROUNDED
+
+    if tier == STATIC:
+        return Route(STATIC, answer=PERSONA_FACTS[fact])
+    if tier == GROUNDED:
+        return grounded
+    return Route(FAST, ROUTER_FAST_MODEL or model, [])
+
+
+def ground(route: Route, contents: list, question: str) -> list:
+    """
+    Ruta grounded: antepone los pasajes del índice local de umich.mx al
+    turno del usuario y, si bastan, quita la búsqueda web. Devuelve los pasajes.
+    """
+    if route.tier != GROUNDED:
+        return []
+    passages, enough = retrieve(question)
+    add_context(contents, passages_note(passages) if passages else "")
+    if enough:
+        route.tools = []
+    return passages
+
+
+def fallback_answer(question: str) -> str:
+    """Respuesta sin Gemini (servicio caído): el dato fijo que toque la pregunta, o un aviso."""
+    fact = _static_fact(normalize_question(question))
+    return PERSONA_FACTS[fact] if fact else OUTAGE_REPLY
@@ -0,0 +1,178 @@
+# ---------------------------------------
+# session_utils.py
+# Reanudación de sesión: token firmado (HMAC) en una cookie para que
+# al recargar la página no haya que repetir el flujo OAuth completo.
+# La validación es local (sólo CPU); al expirar se renueva con el
+# refresh token "offline" guardado en el servidor.
+# ---------------------------------------
+
+import base64
+import hashlib
+import hmac
+import json
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from config_utils import get_setting
+from http_utils import get_http_session
+from state_utils import get_shared_state
+
+SESSION_COOKIE = "nico_session"
+SESSION_TTL_HOURS = get_setting("SESSION_TTL_HOURS", 12.0)
+# Pasado este plazo ya no se intenta renovar con el refresh token
+SESSION_REFRESH_DAYS = get_setting("SESSION_REFRESH_DAYS", 30.0)
+SESSION_DB = get_setting("SESSION_DB", "nico_sessions.db")
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def session_secret(fallback: str = "") -> bytes:
+    """SESSION_SECRET o, si no existe, una clave derivada del client secret de OAuth."""
+    secret = get_setting("SESSION_SECRET", "")
+    if secret:
+        return secret.encode("utf-8")
+    if fallback:
+        return hmac.new(fallback.encode("utf-8"), b"nico-session", hashlib.sha256).digest()
+    return b""
+
+
+def issue_session_token(profile: dict, secret: bytes, ttl_hours: float = SESSION_TTL_HOURS) -> str:
+    """Token `payload.firma` ligado al perfil verificado por Google."""
+    payload = {
+        "email": profile.get("email"),
+        "name": profile.get("name"),
+        "picture": profile.get("picture"),
+        "exp": int(time.time() + ttl_hours * 3600),
+    }
+    body = _b64(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    sig = _b64(hmac.new(secret, body.encode("ascii"), hashlib.sha256).digest())
+    return f"{body}.{sig}"
+
+
+def read_session_token(token: str, secret: bytes):
+    """
+    Devuelve (perfil, vigente) si la firma es válida, o (None, False).
+    Un token firmado pero expirado sirve para intentar la renovación.
+    """
+    if not token or not secret or token.count(".") != 1:
+        return None, False
+    body, sig = token.split(".")
+    expected = _b64(hmac.new(secret, body.encode("ascii"), hashlib.sha256).digest())
+    if not hmac.compare_digest(sig, expected):
+        return None, False
+    try:
+        payload = json.loads(_unb64(body))
+    except ValueError:
+        return None, False
+    profile = {k: payload.get(k) for k in ("email", "name", "picture")}
+    if not profile["email"]:
+        return None, False
+    exp = payload.get("exp", 0)
+    if time.time() - exp > SESSION_REFRESH_DAYS * 86400:
+        return None, False
+    return profile, exp > time.time()
+
+
+class RefreshTokenVault:
+    """Refresh tokens de Google por email (sólo en el servidor, nunca en la cookie)."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS refresh_tokens ("
+            " email TEXT PRIMARY KEY, token TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def put(self, email: str, token: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO refresh_tokens (email, token, updated) VALUES (?, ?, ?)",
+                (email, token, time.time()),
+            )
+            self._db.commit()
+
+    def get(self, email: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT token FROM refresh_tokens WHERE email = ?", (email,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, email: str):
+        with self._lock:
+            self._db.execute("DELETE FROM refresh_tokens WHERE email = ?", (email,))
+            self._db.commit()
+
+
+class SharedRefreshVault:
+    """Misma interfaz sobre el estado compartido: cualquier réplica reanuda la sesión."""
+
+    def __init__(self, state, ttl_days: float = SESSION_REFRESH_DAYS):
+        self._state = state
+        self.ttl = ttl_days * 86400
+
+    def put(self, email: str, token: str):
+        self._state.set(f"refresh:{email}", token, ttl=self.ttl)
+
+    def get(self, email: str):
+        return self._state.get(f"refresh:{email}")
+
+    def delete(self, email: str):
+        self._state.delete(f"refresh:{email}")
+
+
+@st.cache_resource(show_spinner=False)
+def get_refresh_vault():
+    """SQLite local con una réplica; el estado compartido si hay varias (Redis)."""
+    state = get_shared_state()
+    if state.shared:
+        return SharedRefreshVault(state)
+    return RefreshTokenVault(SESSION_DB)
+
+
+def refresh_id_token(refresh_token: str, client_id: str, client_secret: str, token_uri: str):
+    """Canjea el refresh token por un id_token nuevo (sin pasar por la pantalla de Google)."""
+    r = get_http_session().post(
+        token_uri,
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+            "client_id": client_id,
+            "client_secret": client_secret,
+        },
+        timeout=10,
+    )
+    if r.status_code != 200:
+        return None
+    return r.json().get("id_token")
+
+
+def write_session_cookie(token: str, max_age: int):
+    """Escribe (o borra con max_age=0) la cookie desde el navegador."""
+    components.html(
+        "<script>"
+        f"parent.document.cookie = '{SESSION_COOKIE}={token}; max-age={int(max_age)}; "
+        "path=/; SameSite=Lax' + (parent.location.protocol === 'https:' ? '; Secure' : '');"
+        "</script>",
+        height=0,
+    )
+
+
+def session_cookie() -> str:
+    try:
+        return st.context.cookies.get(SESSION_COOKIE, "")
+    except Exception:
+        return ""
@@ -1,49 +1,376 @@
 # ---------------------------------------
 # speech_utils.py
 # Módulo simple para voz masculina/neutral
-# No cambia nada del resto de tu app
+# Voz del servidor: un solo cliente TTS por proceso, frases sintetizadas
+# en paralelo y caché de audio (memoria + disco) por contenido.
 # ---------------------------------------
 
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+import wave
+from collections import OrderedDict
+from concurrent.futures import CancelledError
+
 import streamlit as st
-from google.cloud import texttospeech
-from google.oauth2 import service_account
+
+from config_utils import get_setting
+from worker_utils import PoolBusy, get_worker_pool
+
+TTS_BACKEND = get_setting("TTS_BACKEND", "google")  # "google" o "fake" (sin red)
+TTS_VOICE = get_setting("TTS_VOICE", "es-MX-Neural2-D")
+TTS_CHUNK_CHARS = get_setting("TTS_CHUNK_CHARS", 280)
+TTS_CACHE_MEMORY_MB = get_setting("TTS_CACHE_MEMORY_MB", 32)
+TTS_CACHE_DISK_MB = get_setting("TTS_CACHE_DISK_MB", 256)
+TTS_CACHE_DIR = get_setting(
+    "TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "nico_tts_cache")
+)
+# Audio precalculado por build_faq.py (sólo lectura, mismas llaves que la caché)
+TTS_SEED_DIR = get_setting("TTS_SEED_DIR", "faq/audio")
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
 
 def _get_client():
     # Usa credenciales desde st.secrets o desde el entorno
+    from google.cloud import texttospeech
+    from google.oauth2 import service_account
+
     if "service_account" in st.secrets:
         info = dict(st.secrets["service_account"])
         creds = service_account.Credentials.from_service_account_info(info)
         return texttospeech.TextToSpeechClient(credentials=creds)
     return texttospeech.TextToSpeechClient()
 
-def synthesize_edge_tts(texto: str) -> bytes:
+
+# ============================================================
+# Backends
+# ============================================================
+
+class GoogleTTSBackend:
+    """Google Cloud TTS con un solo TextToSpeechClient (se crea la primera vez)."""
+
+    encoding = "MP3"
+    mimetype = "audio/mp3"
+
+    def __init__(self, voice: str = TTS_VOICE):
+        self.voice = voice
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _client_once(self):
+        with self._lock:
+            if self._client is None:
+                self._client = _get_client()
+            return self._client
+
+    def synthesize(self, text: str) -> bytes:
+        from google.cloud import texttospeech
+
+        # 🟦 Voz masculina/neutral es-MX Neural
+        response = self._client_once().synthesize_speech(
+            input=texttospeech.SynthesisInput(text=text),
+            voice=texttospeech.VoiceSelectionParams(
+                language_code=self.voice[:5], name=self.voice
+            ),
+            audio_config=texttospeech.AudioConfig(
+                audio_encoding=texttospeech.AudioEncoding.MP3
+            ),
+        )
+        return response.audio_content
+
+    @staticmethod
+    def join(chunks: list) -> bytes:
+        # Los frames MP3 se pueden concatenar tal cual
+        return b"".join(chunks)
+
+
+class FakeTTSBackend:
     """
-    Mantiene el MISMO nombre para que tu app no truene.
-    Genera voz masculina/neutral con Google TTS.
-    Devuelve audio MP3.
+    Backend sin red para pruebas y benchmarks: WAV de silencio cuya duración
+    depende del largo del texto. `delay` simula la latencia del servicio.
     """
 
-    if not texto or texto.strip() == "":
-        texto = "No se recibió texto para convertir a voz."
+    encoding = "WAV"
+    mimetype = "audio/wav"
+    rate = 8000
 
-    client = _get_client()
+    def __init__(self, voice: str = "fake", delay: float = 0.0):
+        self.voice = voice
+        self.delay = delay
+        self.calls = 0
 
-    input_text = texttospeech.SynthesisInput(text=texto)
+    def synthesize(self, text: str) -> bytes:
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        frames = int(self.rate * 0.06 * max(1, len(text.split())))
+        return self._wav(b"\x00\x00" * frames)
 
-    # 🟦 Voz masculina/neutral es-MX Neural
-    voice = texttospeech.VoiceSelectionParams(
-        language_code="es-MX",
-        name="es-MX-Neural2-D"
-    )
+    def _wav(self, pcm: bytes) -> bytes:
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.rate)
+            w.writeframes(pcm)
+        return buf.getvalue()
 
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3
-    )
+    def join(self, chunks: list) -> bytes:
+        pcm = b""
+        for chunk in chunks:
+            with wave.open(io.BytesIO(chunk), "rb") as w:
+                pcm += w.readframes(w.getnframes())
+        return self._wav(pcm)
+
+
+# ============================================================
+# Caché de audio por contenido
+# ============================================================
+
+def audio_key(text: str, voice: str, encoding: str) -> str:
+    raw = f"{voice}\x1f{encoding}\x1f{text}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class AudioCache:
+    """LRU en memoria acotada por bytes + directorio en disco acotado por tamaño."""
+
+    def __init__(self, max_memory_bytes: int, disk_dir: str = "", max_disk_bytes: int = 0,
+                 seed_dir: str = ""):
+        self.max_memory_bytes = max_memory_bytes
+        self.seed_dir = seed_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_dir = disk_dir if disk_dir and max_disk_bytes > 0 else ""
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def get(self, key: str):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return data
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self._remember(key, data)
+        self._write_disk(key, data)
+
+    def _remember(self, key, data):
+        if key in self._items:
+            self._memory_bytes -= len(self._items.pop(key))
+        self._items[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes and len(self._items) > 1:
+            _, old = self._items.popitem(last=False)
+            self._memory_bytes -= len(old)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.audio")
 
-    response = client.synthesize_speech(
-        input=input_text,
-        voice=voice,
-        audio_config=audio_config
+    def _disk_entries(self):
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".audio"):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _read_disk(self, key):
+        if self.seed_dir:
+            try:
+                with open(os.path.join(self.seed_dir, f"{key}.audio"), "rb") as f:
+                    return f.read()
+            except OSError:
+                pass
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))  # LRU en disco por fecha de uso
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        if not self.disk_dir or os.path.exists(self._path(key)):
+            return
+        try:
+            tmp = f"{self._path(key)}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes += len(data)
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+            # Desalojo: primero los de uso más antiguo
+            for path, size, _ in sorted(self._disk_entries(), key=lambda e: e[2]):
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    self._disk_bytes -= size
+                except OSError:
+                    pass
+
+
+# ============================================================
+# Motor de voz
+# ============================================================
+
+def split_sentences(text: str, max_chars: int = TTS_CHUNK_CHARS) -> list:
+    """
+    Divide el texto en fragmentos por frase. La primera frase va sola para que
+    su audio esté listo cuanto antes; las demás se agrupan hasta `max_chars`.
+    """
+    sentences = []
+    for sentence in _SENTENCE_END.split(text or ""):
+        sentence = sentence.strip()
+        # Frases enormes (sin puntuación) se cortan por palabras
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            sentences.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            sentences.append(sentence)
+
+    chunks = []
+    for sentence in sentences:
+        if len(chunks) > 1 and len(chunks[-1]) + len(sentence) + 1 <= max_chars:
+            chunks[-1] += " " + sentence
+        else:
+            chunks.append(sentence)
+    return chunks
+
+
+class SpeechEngine:
+    def __init__(self, backend, cache: AudioCache):
+        self.backend = backend
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Job (evita sintetizar dos veces la misma frase)
+
+    @property
+    def mimetype(self) -> str:
+        return self.backend.mimetype
+
+    def _key(self, chunk: str) -> str:
+        return audio_key(chunk, self.backend.voice, self.backend.encoding)
+
+    def synthesize(self, chunk: str) -> bytes:
+        """Audio de un fragmento, desde la caché si ya se sintetizó antes."""
+        key = self._key(chunk)
+        data = self.cache.get(key)
+        if data is None:
+            data = self.backend.synthesize(chunk)
+            self.cache.put(key, data)
+        return data
+
+    def _submit(self, chunk: str):
+        key = self._key(chunk)
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                return job
+            try:
+                job = get_worker_pool().submit(lambda job: self.synthesize(chunk))
+            except PoolBusy:
+                return None
+            self._inflight[key] = job
+        job.future.add_done_callback(lambda _: self._forget(key))
+        return job
+
+    def _forget(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def prefetch(self, text: str) -> list:
+        """Lanza en paralelo la síntesis de todos los fragmentos (sin esperar)."""
+        return [self._submit(chunk) for chunk in split_sentences(text)]
+
+    @staticmethod
+    def cancel(jobs: list):
+        """Descarta los fragmentos que aún no empiezan (p. ej. llegó otra respuesta)."""
+        for job in jobs:
+            if job is not None and not job.done:
+                job.cancel()
+
+    def _collect(self, chunk: str, job) -> bytes:
+        if job is not None:
+            try:
+                data = job.result()
+            except CancelledError:
+                data = None
+            if data is not None:
+                return data
+        # Pool lleno o trabajo cancelado (por otra sesión): se sintetiza aquí
+        return self.synthesize(chunk)
+
+    def stream(self, text: str):
+        """
+        Genera el audio fragmento por fragmento, en orden. Todos se sintetizan
+        en paralelo y el primero se entrega en cuanto está listo. Si el
+        generador se cierra antes de tiempo, lo pendiente se cancela.
+        """
+        chunks = split_sentences(text)
+        jobs = [self._submit(chunk) for chunk in chunks]
+        try:
+            for chunk, job in zip(chunks, jobs):
+                yield self._collect(chunk, job)
+        finally:
+            self.cancel(jobs)
+
+    def speak(self, text: str) -> bytes:
+        """Audio completo (fragmentos unidos) listo para st.audio."""
+        chunks = list(self.stream(text))
+        return self.backend.join(chunks) if chunks else b""
+
+
+@st.cache_resource(show_spinner=False)
+def get_tts_engine() -> SpeechEngine:
+    """Motor compartido: un cliente TTS y una caché de audio por proceso."""
+    backend = FakeTTSBackend() if TTS_BACKEND == "fake" else GoogleTTSBackend()
+    cache = AudioCache(
+        TTS_CACHE_MEMORY_MB * 1024 * 1024,
+        TTS_CACHE_DIR,
+        TTS_CACHE_DISK_MB * 1024 * 1024,
+        seed_dir=TTS_SEED_DIR,
     )
+    return SpeechEngine(backend, cache)
+
+
+def synthesize_edge_tts(texto: str) -> bytes:
+    """
+    Mantiene el MISMO nombre para que tu app no truene.
+    Genera voz masculina/neutral con Google TTS.
+    Devuelve audio MP3 (usa el motor compartido y su caché).
+    """
+
+    if not texto or texto.strip() == "":
+        texto = "No se recibió texto para convertir a voz."
 
-    return response.audio_content
+    return get_tts_engine().speak(texto)
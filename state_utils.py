@@ -0,0 +1,179 @@
+# ---------------------------------------
+# state_utils.py
+# Estado compartido entre réplicas: estados/nonces de OAuth, refresh
+# tokens, caché de respuestas e historial. En memoria del
+# proceso por defecto (una sola réplica) o en Redis (o compatible) para
+# correr varias réplicas detrás de un balanceador sin sesiones pegajosas.
+# Los valores son texto (quien guarda estructuras las pasa a JSON).
+# ---------------------------------------
+
+import threading
+import time
+
+import streamlit as st
+
+from config_utils import get_setting
+
+STATE_BACKEND = get_setting("STATE_BACKEND", "memory")  # "memory" o "redis"
+# "fakeredis://" usa un servidor Redis simulado en el proceso (pruebas)
+STATE_REDIS_URL = get_setting("STATE_REDIS_URL", "redis://localhost:6379/0")
+STATE_PREFIX = "nico:state"
+
+
+def redis_client(url: str, **kwargs):
+    """
+    Cliente Redis para `url`. Si se configuró Redis y falta el paquete, falla
+    con un error claro: caer al estado por proceso rompería en silencio los
+    nonces, la caché y el límite entre réplicas.
+    """
+    try:
+        if url.startswith("fakeredis://"):
+            import fakeredis
+
+            return fakeredis.FakeRedis(server=_fake_server(), **kwargs)
+        import redis
+    except ImportError as e:
+        raise RuntimeError(f"Redis configurado ({url.split('://')[0]}://) pero falta el paquete: {e.name}") from e
+
+    return redis.Redis.from_url(url, **kwargs)
+
+
+@st.cache_resource(show_spinner=False)
+def _fake_server():
+    # Un solo servidor simulado por proceso: todos los clientes ven los mismos datos
+    import fakeredis
+
+    return fakeredis.FakeServer()
+
+
+# ============================================================
+# Backend en memoria (un proceso)
+# ============================================================
+
+class MemoryState:
+    """Diccionario con caducidad por llave; sólo lo ve este proceso."""
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = {}  # llave -> (valor, expira o None)
+
+    def _live(self, key: str):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] < time.time():
+            del self._items[key]
+            return None
+        return item
+
+    @staticmethod
+    def _expires(ttl):
+        return time.time() + ttl if ttl else None
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._live(key)
+            return None if item is None or isinstance(item[0], list) else item[0]
+
+    def set(self, key: str, value: str, ttl: float = None):
+        with self._lock:
+            self._items[key] = (value, self._expires(ttl))
+
+    def pop(self, key: str):
+        """Lee y borra en un solo paso (p. ej. un nonce de un solo uso)."""
+        with self._lock:
+            item = self._live(key)
+            self._items.pop(key, None)
+            return None if item is None else item[0]
+
+    def delete(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def push(self, key: str, value: str, maxlen: int = 0, ttl: float = None):
+        """Agrega al final de una lista; conserva sólo los últimos `maxlen`."""
+        with self._lock:
+            item = self._live(key)
+            values = item[0] if item else []
+            values.append(value)
+            if maxlen:
+                del values[:-maxlen]
+            self._items[key] = (values, self._expires(ttl))
+
+    def items(self, key: str) -> list:
+        with self._lock:
+            item = self._live(key)
+            return list(item[0]) if item else []
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._items if k.startswith(prefix)]:
+                del self._items[key]
+
+
+# ============================================================
+# Backend Redis (varias réplicas)
+# ============================================================
+
+class RedisState:
+    """
+    Mismo contrato que MemoryState sobre Redis (o compatible). Las llaves
+    llevan el prefijo STATE_PREFIX; pop (MULTI/EXEC) es atómico, así un
+    nonce no se consume dos veces entre réplicas.
+    """
+
+    shared = True
+
+    def __init__(self, url: str = STATE_REDIS_URL, prefix: str = STATE_PREFIX):
+        self._redis = redis_client(url, decode_responses=True)
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    @staticmethod
+    def _ms(ttl) -> int:
+        return max(1, int(ttl * 1000))
+
+    def get(self, key: str):
+        return self._redis.get(self._key(key))
+
+    def set(self, key: str, value: str, ttl: float = None):
+        self._redis.set(self._key(key), value, px=self._ms(ttl) if ttl else None)
+
+    def pop(self, key: str):
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.get(self._key(key))
+        pipe.delete(self._key(key))
+        value, _ = pipe.execute()
+        return value
+
+    def delete(self, key: str):
+        self._redis.delete(self._key(key))
+
+    def push(self, key: str, value: str, maxlen: int = 0, ttl: float = None):
+        pipe = self._redis.pipeline()
+        pipe.rpush(self._key(key), value)
+        if maxlen:
+            pipe.ltrim(self._key(key), -maxlen, -1)
+        if ttl:
+            pipe.pexpire(self._key(key), self._ms(ttl))
+        pipe.execute()
+
+    def items(self, key: str) -> list:
+        return self._redis.lrange(self._key(key), 0, -1)
+
+    def delete_prefix(self, prefix: str):
+        keys = list(self._redis.scan_iter(match=f"{self._key(prefix)}*", count=500))
+        if keys:
+            self._redis.delete(*keys)
+
+
+@st.cache_resource(show_spinner=False)
+def get_shared_state():
+    """Estado compartido del proceso; con STATE_BACKEND=redis, Redis o error."""
+    if STATE_BACKEND == "redis":
+        return RedisState(STATE_REDIS_URL)
+    return MemoryState()
@@ -0,0 +1,190 @@
+# ---------------------------------------
+# store_utils.py
+# Historial persistente por usuario (email de OAuth).
+# SQLite en modo WAL por defecto; escrituras append-only agrupadas
+# por un hilo escritor y lectura paginada de turnos antiguos.
+# Con varias réplicas, en el estado compartido (state_utils) con tope por usuario.
+# ---------------------------------------
+
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from config_utils import get_setting
+from state_utils import STATE_BACKEND, get_shared_state
+
+# "sqlite", "shared" o "none"; con el estado en Redis, "shared" por defecto
+HISTORY_STORE = get_setting("HISTORY_STORE", "shared" if STATE_BACKEND == "redis" else "sqlite")
+HISTORY_DB = get_setting("HISTORY_DB", "nico_history.db")
+HISTORY_PAGE_SIZE = get_setting("HISTORY_PAGE_SIZE", 20)
+HISTORY_FLUSH_SECONDS = get_setting("HISTORY_FLUSH_SECONDS", 0.5)
+HISTORY_BATCH_SIZE = get_setting("HISTORY_BATCH_SIZE", 200)
+# Estado compartido: mensajes guardados por usuario y días sin uso antes de borrarlos
+HISTORY_SHARED_MAX = get_setting("HISTORY_SHARED_MAX", 400)
+HISTORY_SHARED_DAYS = get_setting("HISTORY_SHARED_DAYS", 90.0)
+
+
+class NullHistoryStore:
+    """Sin persistencia (HISTORY_STORE=none): misma interfaz, no guarda nada."""
+
+    def append(self, email: str, message: dict):
+        pass
+
+    def recent(self, email: str, limit: int = HISTORY_PAGE_SIZE) -> list:
+        return []
+
+    def before(self, email: str, message_id: str, limit: int = HISTORY_PAGE_SIZE) -> list:
+        return []
+
+    def flush(self):
+        pass
+
+
+class SQLiteHistoryStore:
+    """
+    append() sólo encola; un hilo escritor inserta por lotes en una transacción.
+    Las lecturas usan una conexión por hilo (WAL permite leer mientras se escribe).
+    """
+
+    def __init__(self, path: str, flush_seconds: float = HISTORY_FLUSH_SECONDS,
+                 batch_size: int = HISTORY_BATCH_SIZE):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._flushed = threading.Condition()
+        self._pending = 0
+
+        db = self._connect()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " email TEXT NOT NULL, msg_id TEXT NOT NULL UNIQUE,"
+            " role TEXT NOT NULL, content TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS messages_email_seq ON messages (email, seq)")
+        db.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name="nico-history-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    # --- escritura ---
+
+    def append(self, email: str, message: dict):
+        if not email:
+            return
+        with self._flushed:
+            self._pending += 1
+        self._queue.put((email, message["id"], message["role"], message["content"], time.time()))
+
+    def _write_loop(self):
+        db = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                with db:
+                    db.executemany(
+                        "INSERT OR IGNORE INTO messages (email, msg_id, role, content, created)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        batch,
+                    )
+            except sqlite3.Error:
+                pass  # no tumbar el hilo escritor por un lote malo
+            with self._flushed:
+                self._pending -= len(batch)
+                self._flushed.notify_all()
+
+    def flush(self, timeout: float = 5.0):
+        """Espera a que el escritor vacíe la cola (al salir o en pruebas)."""
+        with self._flushed:
+            self._flushed.wait_for(lambda: self._pending <= 0, timeout)
+
+    # --- lectura paginada ---
+
+    @staticmethod
+    def _rows_to_messages(rows) -> list:
+        return [{"id": r[0], "role": r[1], "content": r[2]} for r in reversed(rows)]
+
+    def recent(self, email: str, limit: int = HISTORY_PAGE_SIZE) -> list:
+        """Los últimos `limit` mensajes, en orden cronológico."""
+        rows = self._connect().execute(
+            "SELECT msg_id, role, content FROM messages WHERE email = ?"
+            " ORDER BY seq DESC LIMIT ?",
+            (email, limit),
+        ).fetchall()
+        return self._rows_to_messages(rows)
+
+    def before(self, email: str, message_id: str, limit: int = HISTORY_PAGE_SIZE) -> list:
+        """Página de mensajes anteriores a `message_id`, en orden cronológico."""
+        rows = self._connect().execute(
+            "SELECT msg_id, role, content FROM messages WHERE email = ? AND seq <"
+            " (SELECT seq FROM messages WHERE msg_id = ?) ORDER BY seq DESC LIMIT ?",
+            (email, message_id, limit),
+        ).fetchall()
+        return self._rows_to_messages(rows)
+
+
+class SharedHistoryStore:
+    """
+    Lista por usuario en el estado compartido (Redis): cualquier réplica
+    recupera la conversación. Sólo se conservan los últimos `maxlen` mensajes.
+    """
+
+    def __init__(self, state, maxlen: int = HISTORY_SHARED_MAX, ttl_days: float = HISTORY_SHARED_DAYS):
+        self._state = state
+        self.maxlen = maxlen
+        self.ttl = ttl_days * 86400
+
+    def append(self, email: str, message: dict):
+        if not email:
+            return
+        item = {"id": message["id"], "role": message["role"], "content": message["content"]}
+        self._state.push(f"history:{email}", json.dumps(item, ensure_ascii=False), self.maxlen, self.ttl)
+
+    def _messages(self, email: str) -> list:
+        return [json.loads(item) for item in self._state.items(f"history:{email}")]
+
+    def recent(self, email: str, limit: int = HISTORY_PAGE_SIZE) -> list:
+        return self._messages(email)[-limit:]
+
+    def before(self, email: str, message_id: str, limit: int = HISTORY_PAGE_SIZE) -> list:
+        messages = self._messages(email)
+        end = next((i for i, m in enumerate(messages) if m["id"] == message_id), 0)
+        return messages[max(0, end - limit):end]
+
+    def flush(self):
+        pass  # cada append ya quedó escrito
+
+
+@st.cache_resource(show_spinner=False)
+def get_history_store():
+    if HISTORY_STORE == "sqlite":
+        return SQLiteHistoryStore(HISTORY_DB)
+    if HISTORY_STORE == "shared":
+        return SharedHistoryStore(get_shared_state())
+    return NullHistoryStore()
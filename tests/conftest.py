@@ -0,0 +1,5 @@
+# Los módulos de NICO viven en la raíz del repo (sin paquete)
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
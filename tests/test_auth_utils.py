@@ -0,0 +1,71 @@
+import threading
+import time
+
+from auth_utils import CachingRequest
+
+CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.status_code = 200
+        self.headers = headers
+        self.content = b'{"kid": "pem"}'
+
+
+class FakeSession:
+    """Sesión HTTP que tarda en responder y cuenta las descargas."""
+
+    def __init__(self, headers=None, delay=0.05):
+        self.headers = headers or {"Cache-Control": "public, max-age=3600"}
+        self.delay = delay
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        return FakeResponse(self.headers)
+
+    def close(self):
+        pass
+
+
+def _concurrent_gets(request, n=20):
+    barrier = threading.Barrier(n)
+    results = []
+
+    def login():
+        barrier.wait()
+        results.append(request(CERTS_URL).data)
+
+    threads = [threading.Thread(target=login) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_misses_fetch_certs_once():
+    session = FakeSession()
+    request = CachingRequest(session=session)
+    results = _concurrent_gets(request)
+    assert session.calls == 1
+    assert results == [b'{"kid": "pem"}'] * 20
+    assert (request.hits, request.misses) == (19, 1)
+
+
+def test_uncacheable_response_is_fetched_every_time():
+    session = FakeSession(headers={"Cache-Control": "no-store"}, delay=0)
+    request = CachingRequest(session=session)
+    request(CERTS_URL)
+    request(CERTS_URL)
+    assert session.calls == 2
+
+
+def test_expired_certs_are_refreshed():
+    session = FakeSession(headers={"Cache-Control": "max-age=100", "Age": "100"}, delay=0)
+    request = CachingRequest(session=session)
+    request(CERTS_URL)
+    request(CERTS_URL)
+    assert session.calls == 2
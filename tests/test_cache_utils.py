@@ -0,0 +1,43 @@
+from cache_utils import NAME_PLACEHOLDER, AnswerCache, cache_key, depersonalize, personalize, swap_name
+
+
+def test_name_inside_place_name_is_not_shared():
+    # "Nicolás" también es parte de "San Nicolás de Hidalgo"
+    reply = "¡Claro, Nicolás! La Universidad Michoacana de San Nicolás de Hidalgo abre a las 8."
+    assert depersonalize(reply, "Nicolás") is None
+
+
+def test_vocative_name_is_replaced():
+    reply = "¡Claro, Ana! El examen es el lunes."
+    shared = depersonalize(reply, "Ana")
+    assert shared == f"¡Claro, {NAME_PLACEHOLDER}! El examen es el lunes."
+    assert personalize(shared, "Luis") == "¡Claro, Luis! El examen es el lunes."
+
+
+def test_short_name_inside_words_is_left_alone():
+    reply = "Hola Ana, la próxima semana por la mañana hay registro."
+    assert depersonalize(reply, "Ana") == (
+        f"Hola {NAME_PLACEHOLDER}, la próxima semana por la mañana hay registro."
+    )
+    assert depersonalize("Luisa es la coordinadora.", "Luis") == "Luisa es la coordinadora."
+
+
+def test_swap_name_keeps_place_names():
+    text = "¡Claro, Nicolás! La UMSNH es la Universidad Michoacana de San Nicolás de Hidalgo."
+    assert swap_name(text, "Nicolás", "Ana") == (
+        "¡Claro, Ana! La UMSNH es la Universidad Michoacana de San Nicolás de Hidalgo."
+    )
+
+
+def test_cache_key_depends_on_route_model_and_tools():
+    args = ("¿Quién es la rectora?", "modelo", 0.7, 0.9, 256)
+    assert cache_key(*args, tools=[{"google_search": {}}]) != cache_key(*args, tools=[])
+    assert cache_key(*args) != cache_key("¿Quién es la rectora?", "otro", 0.7, 0.9, 256)
+
+
+def test_peek_does_not_count():
+    cache = AnswerCache(ttl=60, maxsize=4)
+    cache.put("k", "respuesta")
+    assert cache.peek("k") == "respuesta" and cache.peek("nada") is None
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 0
+    assert cache.get("k") == "respuesta" and cache.stats()["hits"] == 1
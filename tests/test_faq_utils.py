@@ -0,0 +1,48 @@
+import json
+import time
+from types import SimpleNamespace
+
+import faq_utils
+from router_utils import GROUNDED, STATIC
+
+DAY = 86400
+
+
+def _build(tmp_path, monkeypatch, tier, verifiable, generated_days_ago):
+    questions = tmp_path / "preguntas.txt"
+    questions.write_text("¿Cuándo son las inscripciones?\n", encoding="utf-8")
+    store = tmp_path / "answers.json"
+    old = {
+        "question": "¿Cuándo son las inscripciones?", "variants": [], "tier": tier,
+        "source_hash": "fuentes", "prompt_hash": "prompt", "answer": "Del 1 al 5 de agosto.",
+        "generated_at": time.time() - generated_days_ago * DAY,
+        "checked_at": time.time() - generated_days_ago * DAY,
+    }
+    store.write_text(json.dumps({"answers": {
+        faq_utils.normalize_question(old["question"]): old,
+    }}), encoding="utf-8")
+
+    route = SimpleNamespace(tier=tier, model="m", tools=[], answer="Del 1 al 5 de agosto.")
+    monkeypatch.setattr(faq_utils, "plan_question", lambda q, m: (route, [], "fuentes", "prompt", verifiable))
+    monkeypatch.setattr(faq_utils, "gemini_generate", lambda *a, **k: "Del 3 al 7 de agosto.")
+    stats = faq_utils.build_faq(str(questions), str(store), api_key="k")
+    entry = next(iter(json.loads(store.read_text(encoding="utf-8"))["answers"].values()))
+    return stats, entry, old
+
+
+def test_web_grounded_entry_is_regenerated_once_stale(tmp_path, monkeypatch):
+    stats, entry, _ = _build(tmp_path, monkeypatch, GROUNDED, False, faq_utils.FAQ_REFRESH_DAYS + 1)
+    assert stats["generated"] == 1
+    assert entry["answer"] == "Del 3 al 7 de agosto."
+
+
+def test_reused_web_entry_keeps_its_checked_at(tmp_path, monkeypatch):
+    stats, entry, old = _build(tmp_path, monkeypatch, GROUNDED, False, 1)
+    assert stats["reused"] == 1
+    assert entry["checked_at"] == old["checked_at"]
+
+
+def test_static_entry_is_reverified(tmp_path, monkeypatch):
+    stats, entry, old = _build(tmp_path, monkeypatch, STATIC, True, faq_utils.FAQ_MAX_AGE_DAYS + 1)
+    assert stats["reused"] == 1
+    assert entry["checked_at"] > old["checked_at"]
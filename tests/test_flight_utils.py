@@ -0,0 +1,68 @@
+import time
+
+from flight_utils import Flight, SingleFlight
+from worker_utils import Job
+
+
+def _registered(first_name="Nicolás"):
+    flights = SingleFlight()
+    flight = Flight(Job(), first_name)
+    leader = flight.attach(first_name)
+    flights._flights["clave"] = flight
+    return flights, flight, leader
+
+
+def test_follower_sees_leader_text_with_own_name():
+    flights, flight, _ = _registered()
+    view = flights.join("clave", "Ana")
+    flight.job.emit("¡Claro, Nicolás! San Nicolás de Hidalgo abre a las 8.")
+    flight.job.finish()
+    assert view.text == "¡Claro, Ana! San Nicolás de Hidalgo abre a las 8."
+    assert flights.stats()["followers"] == 1
+
+
+def test_cancelled_flight_is_a_miss():
+    flights, flight, leader = _registered()
+    leader.cancel()  # el líder se fue: la llamada se cancela
+    assert flight.job.cancelled
+    assert flights.join("clave", "Ana") is None
+
+
+def test_released_flight_refuses_new_waiters_before_cancel():
+    flights, flight, leader = _registered()
+    flight.job.cancel = lambda: None  # ventana entre release() y la cancelación
+    leader.cancel()
+    assert flights.join("clave", "Ana") is None
+
+
+def test_finished_flight_is_a_miss():
+    flights, flight, _ = _registered()
+    flight.job.emit("listo")
+    flight.job.finish()
+    assert flights.join("clave", "Ana") is None
+    assert flights.stats()["followers"] == 0
+
+
+def test_snapshot_waits_while_first_word_is_incomplete():
+    flights, flight, _ = _registered()
+    view = flights.join("clave", "Ana")
+    flight.job.emit("¡Claro")  # sin espacio: la vista sigue vacía
+    assert view.snapshot(0, timeout=0) == ("", False)
+
+    started = time.monotonic()
+    assert view.snapshot(0, timeout=0.2) == ("", False)
+    assert time.monotonic() - started >= 0.15  # esperó en vez de girar
+
+    flight.job.emit(", Nicolás! Hola")
+    assert view.snapshot(0, timeout=1) == ("¡Claro, Ana! ", False)
+
+
+def test_snapshot_returns_at_once_when_caller_is_behind():
+    flights, flight, _ = _registered()
+    view = flights.join("clave", "Ana")
+    flight.job.emit("Hola Nicolás, ")
+    assert view.snapshot(0, timeout=0) == ("Hola Ana, ", False)
+    # Tras un rerun el script vuelve a pedir desde cero: no hay que esperar
+    started = time.monotonic()
+    assert view.snapshot(0, timeout=1) == ("Hola Ana, ", False)
+    assert time.monotonic() - started < 0.5
@@ -0,0 +1,45 @@
+import time
+from datetime import timedelta
+
+import gemini_utils
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+        self.elapsed = timedelta(seconds=0.1)
+
+    def close(self):
+        self.closed = True
+
+
+def _scripted(monkeypatch, statuses):
+    calls = []
+
+    def guarded_call(model, attempt, deadline):
+        calls.append(model)
+        return Response(statuses.pop(0))
+
+    monkeypatch.setattr(gemini_utils, "guarded_call", guarded_call)
+    monkeypatch.setattr(gemini_utils, "_retry_delay", lambda retry: 0.01)
+    return calls
+
+
+def test_429_is_retried_once_on_the_same_model(monkeypatch):
+    calls = _scripted(monkeypatch, [429, 200])
+    r = gemini_utils._guarded_with_retry("m", None, time.monotonic() + 5)
+    assert r.status_code == 200 and calls == ["m", "m"]
+
+
+def test_no_retry_without_time_left(monkeypatch):
+    calls = _scripted(monkeypatch, [503, 200])
+    r = gemini_utils._guarded_with_retry("m", None, time.monotonic() + 0.015)
+    assert r.status_code == 503 and calls == ["m"]
+
+
+def test_persistent_429_falls_back_to_the_second_model(monkeypatch):
+    calls = _scripted(monkeypatch, [429, 429, 200])
+    r = gemini_utils._open("generateContent", "principal", "respaldo", "k", "hola", (0.7, 0.9, 64), None, [],
+                           deadline=time.monotonic() + 5)
+    assert r.status_code == 200 and calls == ["principal", "principal", "respaldo"]
@@ -0,0 +1,41 @@
+import pytest
+
+from prompt_utils import build_contents, greeting, validate_contents
+
+
+def test_assistant_role_is_sent_as_model():
+    history = [
+        {"role": "user", "content": "Hola"},
+        {"role": "assistant", "content": greeting("Ana") + "¿En qué te ayudo?"},
+        {"role": "user", "content": "¿Cuándo abre la biblioteca?"},
+    ]
+    contents = build_contents(history, "Ana")
+    assert [c["role"] for c in contents] == ["user", "model", "user"]
+    # El saludo del sistema no se reenvía al modelo
+    assert contents[1]["parts"] == [{"text": "¿En qué te ayudo?"}]
+
+
+def test_consecutive_turns_are_merged_and_empty_ones_dropped():
+    history = [
+        {"role": "assistant", "content": "Respuesta suelta"},
+        {"role": "user", "content": "primera"},
+        {"role": "user", "content": "   "},
+        {"role": "user", "content": "segunda"},
+    ]
+    contents = build_contents(history, "Ana")
+    assert [c["role"] for c in contents] == ["user"]
+    texts = [p["text"] for p in contents[0]["parts"]]
+    assert texts[-2:] == ["primera", "segunda"]
+    validate_contents(contents)
+
+
+@pytest.mark.parametrize("contents", [
+    [],
+    [{"role": "assistant", "parts": [{"text": "hola"}]}],
+    [{"role": "user", "parts": [{"text": "a"}]}, {"role": "user", "parts": [{"text": "b"}]}],
+    [{"role": "user", "parts": [{"text": ""}]}],
+    [{"role": "user", "parts": [{"text": "a"}]}, {"role": "model", "parts": [{"text": "b"}]}],
+])
+def test_validate_contents_rejects_requests_that_would_400(contents):
+    with pytest.raises(ValueError):
+        validate_contents(contents)
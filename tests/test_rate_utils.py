@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+
+import rate_utils
+from rate_utils import MemoryRateLimiter, RedisRateLimiter, admitted
+from worker_utils import Job
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(params=["memory", "redis"])
+def make_limiter(request, clock):
+    def make(**kwargs):
+        kwargs.setdefault("burst", 2)
+        kwargs.setdefault("per_minute", 60.0)  # un token por segundo
+        kwargs.setdefault("max_concurrent", 2)
+        kwargs.setdefault("lease", 180.0)
+        if request.param == "memory":
+            return MemoryRateLimiter(clock=clock, **kwargs)
+        limiter = RedisRateLimiter("fakeredis://", clock=clock, **kwargs)
+        limiter._redis.flushall()  # el servidor simulado es uno por proceso
+        return limiter
+
+    return make
+
+
+def test_bucket_allows_burst_then_refills(make_limiter, clock):
+    limiter = make_limiter()
+    assert limiter.take("ana@umich.mx") == (True, 0.0)
+    assert limiter.take("ana@umich.mx") == (True, 0.0)
+    allowed, retry = limiter.take("ana@umich.mx")
+    assert not allowed and retry == pytest.approx(1.0)
+
+    clock.advance(0.5)
+    allowed, retry = limiter.take("ana@umich.mx")
+    assert not allowed and retry == pytest.approx(0.5)
+
+    clock.advance(0.5)
+    assert limiter.take("ana@umich.mx") == (True, 0.0)
+    # La cubeta es por usuario
+    assert limiter.take("luis@umich.mx") == (True, 0.0)
+
+
+def test_bucket_never_exceeds_burst(make_limiter, clock):
+    limiter = make_limiter()
+    clock.advance(3600)
+    assert [limiter.take("ana@umich.mx")[0] for _ in range(3)] == [True, True, False]
+
+
+def test_queue_positions_are_fifo(make_limiter, clock):
+    limiter = make_limiter()
+    positions = []
+    for ticket in "abcd":
+        positions.append(limiter.enter(ticket))
+        clock.advance(0.01)
+    assert positions == [0, 0, 1, 2]
+    assert limiter.stats() == {"active": 2, "queued": 2}
+    assert limiter.enter("c") == 1  # volver a entrar no cambia el lugar
+
+    limiter.leave("a")
+    assert [limiter.wait(t, 0) for t in "bcd"] == [0, 0, 1]
+    assert limiter.stats() == {"active": 2, "queued": 1}
+
+
+def test_expired_lease_frees_the_slot(make_limiter, clock):
+    limiter = make_limiter(max_concurrent=1, lease=10.0)
+    assert limiter.enter("perdido") == 0
+    clock.advance(5)
+    assert limiter.enter("b") == 1
+    clock.advance(6)
+    assert limiter.wait("b", 0) == 0
+    assert limiter.wait("perdido", 0) == -1
+
+
+def test_cancel_while_queued_leaves_the_queue(make_limiter, clock, monkeypatch):
+    limiter = make_limiter(max_concurrent=1)
+    monkeypatch.setattr(rate_utils, "get_rate_limiter", lambda: limiter)
+    assert limiter.enter("ocupado") == 0
+    clock.advance(0.01)
+
+    calls = []
+    job = Job()
+    result = []
+    thread = threading.Thread(target=lambda: result.append(admitted(job, calls.append)))
+    thread.start()
+    for _ in range(200):
+        if job.meta.get("queue_position") == 1:
+            break
+        thread.join(0.01)
+    assert job.meta["queue_position"] == 1
+
+    job.cancel()
+    thread.join(5)
+    assert result == [None] and calls == []
+    assert limiter.stats() == {"active": 1, "queued": 0}
@@ -0,0 +1,150 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+import requests
+
+import resilience_utils
+from resilience_utils import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpen,
+    Upstream,
+    guarded_call,
+)
+
+MODEL = "gemini-prueba"
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body="ok"):
+        self.status_code = status_code
+        self.body = body
+        self.elapsed = timedelta(seconds=0.1)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    upstream = Upstream()
+    monkeypatch.setattr(resilience_utils, "get_upstream", lambda: upstream)
+    yield upstream
+    upstream.pool.shutdown(wait=True)
+
+
+def _deadline(seconds=5.0):
+    return time.monotonic() + seconds
+
+
+def test_breaker_opens_probes_once_and_closes(upstream):
+    clock = FakeClock()
+    breaker = upstream._breakers[MODEL] = CircuitBreaker(failures=3, cooldown=10.0, clock=clock)
+    down = lambda timeout: FakeResponse(503)
+
+    for _ in range(3):
+        assert guarded_call(MODEL, down, _deadline()).status_code == 503
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        guarded_call(MODEL, down, _deadline())
+
+    clock.advance(10.0)
+    assert breaker.available()
+    probing, release = threading.Event(), threading.Event()
+
+    def probe(timeout):
+        probing.set()
+        release.wait(5)
+        return FakeResponse(200)
+
+    thread = threading.Thread(target=lambda: guarded_call(MODEL, probe, _deadline()))
+    thread.start()
+    assert probing.wait(5)
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):  # una sola petición de prueba a la vez
+        guarded_call(MODEL, down, _deadline())
+    release.set()
+    thread.join(5)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens_with_longer_cooldown():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failures=1, cooldown=10.0, clock=clock)
+    assert breaker.failure() and breaker.state == OPEN
+    clock.advance(10.0)
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert breaker.failure() and breaker.state == OPEN
+    clock.advance(10.0)
+    assert not breaker.allow()  # la segunda espera es del doble
+    clock.advance(10.0)
+    assert breaker.allow()
+
+
+def test_hedge_wins_over_slow_primary(upstream, monkeypatch):
+    monkeypatch.setattr(resilience_utils, "GEMINI_HEDGE_DELAY", 0.05)
+    calls = []
+
+    def attempt(timeout):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            time.sleep(0.5)  # el original se atora
+            return FakeResponse(200, "lenta")
+        return FakeResponse(200, "cobertura")
+
+    started = time.monotonic()
+    response = guarded_call(MODEL, attempt, _deadline())
+    assert response.body == "cobertura"
+    assert time.monotonic() - started < 0.4
+    assert len(calls) == 2
+
+
+def test_deadline_is_enforced(upstream, monkeypatch):
+    monkeypatch.setattr(resilience_utils, "GEMINI_HEDGE_DELAY", 10.0)
+
+    def hung(timeout):
+        time.sleep(1.0)
+        return FakeResponse(200)
+
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        guarded_call(MODEL, hung, _deadline(0.2))
+    assert time.monotonic() - started < 0.6
+    assert upstream.breaker(MODEL)._streak == 1
+
+
+def test_expired_deadline_does_not_count_as_failure(upstream):
+    with pytest.raises(requests.Timeout):
+        guarded_call(MODEL, lambda timeout: FakeResponse(200), time.monotonic() - 1)
+    assert upstream.breaker(MODEL)._streak == 0
+
+
+def test_exhausted_hedge_budget_runs_inline_without_duplicate(upstream, monkeypatch):
+    monkeypatch.setattr(resilience_utils, "GEMINI_HEDGE_DELAY", 0.01)
+    while upstream.reserve_hedge():
+        pass
+    calls = []
+
+    def attempt(timeout):
+        calls.append(threading.current_thread())
+        time.sleep(0.1)
+        return FakeResponse(200)
+
+    assert guarded_call(MODEL, attempt, _deadline()).status_code == 200
+    assert calls == [threading.current_thread()]
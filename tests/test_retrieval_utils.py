@@ -0,0 +1,19 @@
+from retrieval_utils import Retriever, build_index
+
+PAGE = (
+    "<html><title>Control Escolar</title><body><p>La Dirección de Control Escolar "
+    "atiende inscripciones y credenciales de lunes a viernes.</p></body></html>"
+)
+
+
+def test_index_built_after_start_is_picked_up(tmp_path):
+    snapshot = tmp_path / "snapshot" / "umich.mx"
+    snapshot.mkdir(parents=True)
+    index_dir = str(tmp_path / "index")
+    retriever = Retriever(index_dir)
+    assert retriever.search("inscripciones") == []
+
+    (snapshot / "index.html").write_text(PAGE, encoding="utf-8")
+    build_index(str(snapshot.parent), index_dir)
+    hits = retriever.search("inscripciones control escolar")
+    assert hits and hits[0][1]["url"] == "https://umich.mx/"
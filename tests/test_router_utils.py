@@ -0,0 +1,43 @@
+import pytest
+
+from router_utils import FAST, GROUNDED, OUTAGE_REPLY, STATIC, classify, fallback_answer
+
+
+@pytest.mark.parametrize("question, fact", [
+    ("¿Quién es la rectora?", "rectora"),
+    ("¿Cómo se llama el rector de la UMSNH?", "rectora"),
+    ("¿Quién es el secretario general de la Universidad Michoacana?", "secretario_general"),
+    ("¿Cuál es el lema de la universidad?", "lema"),
+    ("¿Cuál es el lema nicolaita?", "lema"),
+    ("Dime el himno", "himno"),
+    ("¿Cómo va la porra?", "porra"),
+    ("¿Quién es el director de la DTIC?", "director_dtic"),
+])
+def test_umsnh_facts_are_static(question, fact):
+    assert classify(question) == (STATIC, fact)
+
+
+@pytest.mark.parametrize("question", [
+    "¿Quién es el rector de la Universidad de Guadalajara?",
+    "¿Quién es el rector de la UNAM?",
+    "¿Quién es el secretario general del SPUM?",
+    "¿Quién es el secretario general del sindicato?",
+    "¿Cuál es el lema de la Facultad de Medicina?",
+    "la porra de la facultad de ingeniería civil",
+    "¿Cuál es el himno nacional?",
+    "¿Quién fue el primer rector?",
+])
+def test_other_entities_and_history_go_to_the_model(question):
+    tier, fact = classify(question)
+    assert tier in (FAST, GROUNDED) and fact == ""
+
+
+def test_follow_up_is_never_static():
+    assert classify("¿Quién es la rectora?", allow_static=False) == (GROUNDED, "")
+
+
+def test_fallback_answer_only_uses_umsnh_facts():
+    assert "Yarabí" in fallback_answer("¿Quién es la rectora?")
+    assert fallback_answer("¿Quién es el rector de la Universidad de Guadalajara?") == OUTAGE_REPLY
+    assert fallback_answer("¿Quién fue el primer rector?") == OUTAGE_REPLY
+    assert fallback_answer("¿Qué es la termodinámica?") == OUTAGE_REPLY
@@ -0,0 +1,102 @@
+import json
+
+import pytest
+import streamlit as st
+
+import auth_utils
+from session_utils import (
+    SESSION_REFRESH_DAYS,
+    _b64,
+    _unb64,
+    issue_session_token,
+    read_session_token,
+)
+
+SECRET = b"secreto-de-prueba"
+PROFILE = {"email": "ana@umich.mx", "name": "Ana", "picture": None}
+
+
+def test_valid_token_round_trips():
+    token = issue_session_token(PROFILE, SECRET)
+    assert read_session_token(token, SECRET) == (PROFILE, True)
+
+
+def test_tampered_payload_is_rejected():
+    body, sig = issue_session_token(PROFILE, SECRET).split(".")
+    payload = json.loads(_unb64(body))
+    payload["email"] = "rectoria@umich.mx"
+    forged = _b64(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    assert read_session_token(f"{forged}.{sig}", SECRET) == (None, False)
+
+
+def test_tampered_signature_is_rejected():
+    body, sig = issue_session_token(PROFILE, SECRET).split(".")
+    flipped = ("A" if sig[0] != "A" else "B") + sig[1:]
+    assert read_session_token(f"{body}.{flipped}", SECRET) == (None, False)
+    assert read_session_token(body, SECRET) == (None, False)
+
+
+def test_token_from_another_secret_is_rejected():
+    token = issue_session_token(PROFILE, b"otra-replica")
+    assert read_session_token(token, SECRET) == (None, False)
+    assert read_session_token(token, b"") == (None, False)
+
+
+def test_expired_token_inside_refresh_window_can_be_renewed():
+    token = issue_session_token(PROFILE, SECRET, ttl_hours=-1)
+    assert read_session_token(token, SECRET) == (PROFILE, False)
+
+
+def test_expired_token_outside_refresh_window_is_rejected():
+    token = issue_session_token(PROFILE, SECRET, ttl_hours=-(SESSION_REFRESH_DAYS * 24 + 1))
+    assert read_session_token(token, SECRET) == (None, False)
+
+
+# ------------------------------------------------------------
+# resume_session: renovación con el refresh token guardado
+# ------------------------------------------------------------
+
+class FakeVault:
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def get(self, email):
+        return self.tokens.get(email)
+
+
+@pytest.fixture
+def resume(monkeypatch):
+    st.session_state.clear()
+    st.session_state["logged"] = False
+    monkeypatch.setattr(auth_utils, "session_secret", lambda fallback="": SECRET)
+    monkeypatch.setattr(auth_utils, "get_refresh_vault", lambda: FakeVault({PROFILE["email"]: "rt"}))
+    monkeypatch.setattr(auth_utils, "refresh_id_token", lambda *args: "nuevo-id-token")
+
+    def run(cookie, idinfo):
+        monkeypatch.setattr(auth_utils, "session_cookie", lambda: cookie)
+        monkeypatch.setattr(auth_utils, "verify_google_id_token", lambda token, audience: idinfo)
+        auth_utils.resume_session()
+        return dict(st.session_state)
+
+    yield run
+    st.session_state.clear()
+
+
+def test_resume_valid_token_needs_no_refresh(resume):
+    state = resume(issue_session_token(PROFILE, SECRET), idinfo=None)
+    assert state["logged"] and state["profile"] == PROFILE
+    assert "session_token_pending" not in state
+
+
+def test_resume_expired_token_renews_with_refresh_token(resume):
+    renewed = dict(PROFILE, name="Ana María")
+    state = resume(issue_session_token(PROFILE, SECRET, ttl_hours=-1), idinfo=renewed)
+    assert state["logged"] and state["profile"] == renewed
+    assert read_session_token(state["session_token_pending"], SECRET) == (renewed, True)
+
+
+def test_resume_refuses_refresh_for_another_account(resume):
+    other = dict(PROFILE, email="otra@umich.mx")
+    state = resume(issue_session_token(PROFILE, SECRET, ttl_hours=-1), idinfo=other)
+    assert not state["logged"]
+    assert state["login_hint"] == PROFILE["email"]
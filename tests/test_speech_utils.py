@@ -0,0 +1,128 @@
+import os
+import threading
+
+import pytest
+
+import speech_utils
+from speech_utils import AudioCache, FakeTTSBackend, SpeechEngine, audio_key, split_sentences
+from worker_utils import WorkerPool
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = WorkerPool(1, 8, name="test-tts")
+    monkeypatch.setattr(speech_utils, "get_worker_pool", lambda: pool)
+    return pool
+
+
+def test_first_sentence_goes_alone_and_rest_are_grouped():
+    text = "Hola. Soy NICO. Te ayudo con trámites. ¿Qué necesitas?"
+    assert split_sentences(text, max_chars=40) == [
+        "Hola.",
+        "Soy NICO. Te ayudo con trámites.",
+        "¿Qué necesitas?",
+    ]
+
+
+def test_long_sentence_is_cut_at_words():
+    chunks = split_sentences("uno dos tres cuatro cinco seis", max_chars=10)
+    assert chunks[0] == "uno dos"
+    assert all(len(chunk) <= 10 for chunk in chunks)
+    assert " ".join(chunks) == "uno dos tres cuatro cinco seis"
+    assert split_sentences("") == []
+
+
+def test_memory_lru_evicts_least_recently_used():
+    cache = AudioCache(max_memory_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"  # "a" pasa a ser la más reciente
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.get("c") == b"cccc"
+
+
+def test_disk_hit_survives_a_new_process(tmp_path):
+    AudioCache(10, str(tmp_path), 1024).put("clave", b"audio")
+    cache = AudioCache(10, str(tmp_path), 1024)
+    assert cache.get("clave") == b"audio"
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_disk_evicts_oldest_used_file(tmp_path):
+    cache = AudioCache(0, str(tmp_path), max_disk_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    os.utime(tmp_path / "a.audio", (1, 1))
+    os.utime(tmp_path / "b.audio", (2, 2))
+    cache.put("c", b"cccc")
+    assert sorted(os.listdir(tmp_path)) == ["b.audio", "c.audio"]
+
+
+def test_seed_dir_is_read_only_hit(tmp_path):
+    seed = tmp_path / "seed"
+    seed.mkdir()
+    key = audio_key("Hola.", "fake", "WAV")
+    (seed / f"{key}.audio").write_bytes(b"precalculado")
+    backend = FakeTTSBackend()
+    engine = SpeechEngine(backend, AudioCache(1024, seed_dir=str(seed)))
+    assert engine.synthesize("Hola.") == b"precalculado"
+    assert backend.calls == 0
+
+
+def test_stream_yields_chunks_in_order_and_caches(pool):
+    backend = FakeTTSBackend()
+    engine = SpeechEngine(backend, AudioCache(1 << 20))
+    text = "Hola. " + "Palabra " * 60 + "fin."
+    chunks = split_sentences(text)
+    audio = list(engine.stream(text))
+    assert audio == [backend.synthesize(chunk) for chunk in chunks]
+    backend.calls = 0
+    assert engine.speak(text) == backend.join(audio)
+    assert backend.calls == 0  # todo salió de la caché
+
+
+def test_cancel_skips_chunks_that_have_not_started(pool):
+    started, gate = threading.Event(), threading.Event()
+
+    class SlowBackend(FakeTTSBackend):
+        def synthesize(self, text):
+            started.set()
+            gate.wait(5)
+            return super().synthesize(text)
+
+    backend = SlowBackend()
+    engine = SpeechEngine(backend, AudioCache(1 << 20))
+    jobs = engine.prefetch("Hola. Esta frase ya no hace falta.")
+    assert len(jobs) == 2
+    assert started.wait(5)
+    engine.cancel(jobs)
+    gate.set()
+    jobs[0].result(timeout=5)
+    assert jobs[1].future.cancelled()
+    assert backend.calls == 1
+    assert engine._inflight == {}
+    # Lo cancelado se vuelve a pedir si otra sesión lo necesita
+    assert len(list(engine.stream("Hola. Esta frase ya no hace falta."))) == 2
+    assert backend.calls == 2
+
+
+def test_closing_stream_cancels_pending_chunks(pool):
+    gate = threading.Event()
+
+    class GatedBackend(FakeTTSBackend):
+        def synthesize(self, text):
+            if text != "Hola.":
+                gate.wait(5)
+            return super().synthesize(text)
+
+    backend = GatedBackend()
+    engine = SpeechEngine(backend, AudioCache(1 << 20))
+    stream = engine.stream("Hola. Segunda frase. Tercera frase." + " relleno" * 40)
+    next(stream)
+    jobs = list(engine._inflight.values())
+    assert jobs
+    stream.close()  # llegó otra respuesta: el resto sobra
+    gate.set()
+    assert all(job.cancelled for job in jobs)
@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from state_utils import MemoryState, RedisState
+
+
+@pytest.fixture(params=["memory", "redis"])
+def state(request):
+    if request.param == "memory":
+        return MemoryState()
+    state = RedisState("fakeredis://", prefix="prueba")
+    state._redis.flushall()  # el servidor simulado es uno por proceso
+    return state
+
+
+def test_pop_consumes_a_nonce_once(state):
+    state.set("oauth:estado", "nonce", ttl=60)
+    results = []
+    barrier = threading.Barrier(8)
+
+    def callback():
+        barrier.wait()
+        results.append(state.pop("oauth:estado"))
+
+    threads = [threading.Thread(target=callback) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count("nonce") == 1 and results.count(None) == 7
+    assert state.get("oauth:estado") is None
+
+
+def test_push_keeps_only_the_last_items(state):
+    for turn in range(5):
+        state.push("history:ana", f"turno {turn}", maxlen=3, ttl=60)
+    assert state.items("history:ana") == ["turno 2", "turno 3", "turno 4"]
+    assert state.items("history:luis") == []
+
+
+def test_delete_prefix_only_touches_matching_keys(state):
+    state.set("answer:1", "a")
+    state.set("answer:2", "b")
+    state.push("answers-log", "x")
+    state.set("oauth:1", "n")
+    state.delete_prefix("answer:")
+    assert state.get("answer:1") is None and state.get("answer:2") is None
+    assert state.items("answers-log") == ["x"]
+    assert state.get("oauth:1") == "n"
+
+
+def test_redis_prefix_isolates_deployments():
+    first = RedisState("fakeredis://", prefix="uno")
+    first._redis.flushall()
+    second = RedisState("fakeredis://", prefix="dos")
+    first.set("answer:1", "a")
+    second.delete_prefix("answer:")
+    assert first.get("answer:1") == "a"
+    assert second.get("answer:1") is None
@@ -0,0 +1,98 @@
+# ---------------------------------------
+# voice_utils.py
+# Reproducción de voz en el navegador con UN componente estático.
+# Cada respuesta se habla una sola vez (se rastrea por id de mensaje);
+# en los reruns sólo viaja el id, no el texto ni un iframe nuevo.
+# La voz del servidor viaja fragmento por fragmento: el componente pide el
+# siguiente en cuanto recibe uno, así el primero suena sin esperar al resto.
+# ---------------------------------------
+
+import base64
+import os
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from metrics_utils import span
+from speech_utils import get_tts_engine
+
+_voice_component = components.declare_component(
+    "nico_voice",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "voice_component"),
+)
+
+
+def latest_assistant_message(history: list):
+    for msg in reversed(history):
+        if msg["role"] == "assistant":
+            return msg
+    return None
+
+
+def _next_audio_url(stream: dict):
+    """Siguiente fragmento de la voz del servidor como data URL (None al terminar)."""
+    audio = next(stream["chunks"], None)
+    if not audio:
+        return None
+    stream["seq"] += 1
+    return f"data:{get_tts_engine().mimetype};base64,{base64.b64encode(audio).decode('ascii')}"
+
+
+def _acked(stream: dict) -> bool:
+    """¿El navegador ya recibió el último fragmento enviado?"""
+    ack = st.session_state.get("nico_voice") or {}
+    return ack.get("id") == stream["id"] and ack.get("seq") == stream["seq"]
+
+
+def _close_stream():
+    stream = st.session_state.get("voice_stream")
+    if stream is not None:
+        stream["chunks"].close()  # cancela los fragmentos pendientes
+    st.session_state["voice_stream"] = None
+
+
+def render_voice(message, enabled: bool, mode: str = "Navegador"):
+    """
+    Monta el componente de voz (siempre en la misma posición para que el iframe
+    sobreviva a los reruns) y le pasa el mensaje sólo si aún no se ha hablado.
+    En modo Servidor manda un fragmento de audio por rerun del fragmento.
+    """
+    args = {"id": message["id"] if message else None, "enabled": bool(enabled)}
+    error = None
+
+    stream = st.session_state.get("voice_stream")
+    if stream is not None and (not enabled or stream["id"] != args["id"]):
+        _close_stream()
+        stream = None
+
+    with span("voice_render", mode=mode) as current:
+        if enabled and message and message["id"] != st.session_state.get("spoken_id"):
+            st.session_state["spoken_id"] = message["id"]
+            if mode == "Servidor":
+                stream = {"id": message["id"], "seq": -1,
+                          "chunks": get_tts_engine().stream(message["content"])}
+                st.session_state["voice_stream"] = stream
+                try:
+                    args["audio"] = _next_audio_url(stream)
+                except Exception as e:
+                    error = e
+            if not args.get("audio"):
+                _close_stream()
+                args["text"] = message["content"]
+        elif stream is not None and _acked(stream):
+            # El componente ya tiene el fragmento anterior: va el siguiente
+            current.set(mode="chunk")
+            try:
+                args["audio"] = _next_audio_url(stream)
+            except Exception as e:
+                error = e
+            if not args.get("audio"):
+                _close_stream()
+        else:
+            current.set(mode="idle")  # sólo el id: rerun sin voz nueva
+
+        if args.get("audio"):
+            args["seq"] = st.session_state["voice_stream"]["seq"]
+        _voice_component(key="nico_voice", default=None, **args)
+    if error is not None:
+        st.caption(f"Voz del servidor no disponible: {error}")
@@ -0,0 +1,130 @@
+# ---------------------------------------
+# worker_utils.py
+# Pool de hilos compartido por proceso para trabajos lentos
+# (Gemini, resúmenes, voz) fuera del hilo del script de Streamlit.
+# Concurrencia acotada y cancelación cooperativa.
+# ---------------------------------------
+
+import contextvars
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from config_utils import get_setting
+
+WORKER_MAX_THREADS = get_setting("WORKER_MAX_THREADS", 8)
+# Trabajos que pueden esperar turno además de los que ya corren
+WORKER_MAX_QUEUE = get_setting("WORKER_MAX_QUEUE", 32)
+
+BUSY_REPLY = (
+    "NICO está atendiendo a muchos estudiantes en este momento. "
+    "Intenta de nuevo en unos segundos."
+)
+
+
+class PoolBusy(Exception):
+    """No hay lugar en el pool: se responde rápido en vez de encolar sin límite."""
+
+
+class Job:
+    """
+    Trabajo en segundo plano. El hilo trabajador emite texto con emit();
+    el script lo lee con snapshot() aunque haya sido interrumpido por un rerun.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.meta = {}
+        self.future = None
+        self._cancelled = threading.Event()
+        self._cond = threading.Condition()
+        self._parts = []
+        self._done = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def done(self) -> bool:
+        with self._cond:
+            return self._done
+
+    @property
+    def text(self) -> str:
+        with self._cond:
+            return "".join(self._parts)
+
+    def emit(self, chunk: str):
+        with self._cond:
+            self._parts.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self._done = True
+            self._cond.notify_all()
+
+    def cancel(self):
+        """Cancelación cooperativa: el trabajo deja de emitir y se descarta."""
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def snapshot(self, seen: int = 0, timeout: float = 0.25):
+        """Espera texto nuevo (más de `seen` caracteres) o el final; devuelve (texto, terminado)."""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._done or sum(map(len, self._parts)) > seen, timeout
+            )
+            return "".join(self._parts), self._done
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class WorkerPool:
+    def __init__(self, max_workers: int = WORKER_MAX_THREADS, max_queue: int = WORKER_MAX_QUEUE,
+                 name: str = "nico-worker"):
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    def submit(self, fn, *args, **kwargs) -> Job:
+        """Ejecuta fn(job, *args, **kwargs) en el pool. Lanza PoolBusy si está lleno."""
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusy()
+
+        job = Job()
+        ctx = get_script_run_ctx(suppress_warning=True)
+
+        def run():
+            # El hilo usa el contexto de la sesión para leer st.cache_resource
+            if ctx is not None:
+                add_script_run_ctx(threading.current_thread(), ctx)
+            try:
+                if job.cancelled:
+                    return None
+                return fn(job, *args, **kwargs)
+            except Exception:
+                job.meta["error"] = True  # lo emitido hasta aquí está incompleto
+                raise
+            finally:
+                job.finish()
+
+        def release(future):
+            if future.cancelled():
+                job.finish()
+            self._slots.release()
+
+        # El trabajo hereda las variables de contexto (p. ej. el tramo de métricas en curso)
+        job.future = self._executor.submit(contextvars.copy_context().run, run)
+        job.future.add_done_callback(release)
+        return job
+
+
+@st.cache_resource(show_spinner=False)
+def get_worker_pool() -> WorkerPool:
+    return WorkerPool()